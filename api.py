@@ -0,0 +1,510 @@
+# ─── API DE CONSULTA (HTTP, sem Streamlit) ──────────────────────────
+"""Consulta às matrículas por HTTP, com o mesmo motor de filtro do dashboard.
+
+Uso:
+    python api.py servir [--host 127.0.0.1] [--porta 8502] [--pasta DIR]
+    python api.py carga [--url http://127.0.0.1:8502] [--clientes 8] [--requisicoes 200]
+
+Rotas (GET; valores múltiplos repetem o parâmetro: ano=2023&ano=2024):
+    /modalidades   modalidades com arquivo presente, níveis e colunas de cada nível
+    /opcoes        modalidade, nivel → anos, redes e hierarquia Etapa/Subetapa/Série
+    /consulta      modalidade, nivel, ano, rede, etapa, subetapa, serie,
+                   busca.<coluna>, pagina, por_pagina → linhas da página
+    /agregado      mesmos filtros + por=<coluna> → soma das matrículas por grupo
+
+As respostas são colunares ({"colunas": [...], "dados": {coluna: [...]}});
+com formato=arrow (ou Accept: application/vnd.apache.arrow.stream) a tabela
+vai como stream Arrow IPC, com total e paginação nos cabeçalhos X-Total,
+X-Pagina e X-Paginas. A conexão é mantida entre requisições (HTTP/1.1) e as
+respostas ficam num cache LRU por consulta.
+"""
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import numpy as np
+import pyarrow as pa
+
+from dados import (
+    ARQ, MODALIDADES, CacheFiltros, MotorFiltro, TabelaModalidade, filtrar_indices,
+    filtrar_texto, ler_modalidade, montar_linhas, nivel_map, plano_colunas,
+)
+from preparar_dados import agregar_cubo, colunas_usadas, converter_tipos, ler_cubo
+
+# ─── 1. CONSTANTES ──────────────────────────────────────────────────
+HOST_PADRAO = "127.0.0.1"
+PORTA_PADRAO = 8502
+POR_PAGINA_PADRAO = 100
+POR_PAGINA_MAX = 10_000
+MEDIDA = "Número de Matrículas"
+
+TIPO_JSON = "application/json; charset=utf-8"
+TIPO_ARROW = "application/vnd.apache.arrow.stream"
+
+
+# ─── 2. FUNÇÕES UTIL ────────────────────────────────────────────────
+class ErroConsulta(ValueError):
+    """Parâmetro inválido na consulta (vira resposta 400)."""
+
+
+def _unico(parametros: dict[str, list[str]], nome: str, padrao: str | None = None) -> str:
+    valores = parametros.get(nome)
+    if not valores:
+        if padrao is None:
+            raise ErroConsulta(f"Parâmetro obrigatório ausente: {nome}")
+        return padrao
+    return valores[-1]
+
+
+def _inteiro(parametros: dict[str, list[str]], nome: str, padrao: int,
+             minimo: int = 1, maximo: int | None = None) -> int:
+    texto = _unico(parametros, nome, str(padrao))
+    try:
+        valor = int(texto)
+    except ValueError:
+        raise ErroConsulta(f"{nome} deve ser inteiro: {texto!r}") from None
+    return max(minimo, min(valor, maximo) if maximo else valor)
+
+
+def _modalidade(parametros: dict[str, list[str]]) -> str:
+    modalidade = _unico(parametros, "modalidade")
+    if modalidade not in MODALIDADES:
+        raise ErroConsulta(f"Modalidade desconhecida: {modalidade!r}")
+    return modalidade
+
+
+def _nivel(parametros: dict[str, list[str]]) -> str:
+    """Aceita o nome da interface ("Escolas") ou o do arquivo ("escola")."""
+    nivel = _unico(parametros, "nivel")
+    if nivel in nivel_map:
+        return nivel_map[nivel]
+    if nivel in nivel_map.values():
+        return nivel
+    raise ErroConsulta(f"Nível desconhecido: {nivel!r}")
+
+
+def _colunar(tabela: pa.Table) -> dict:
+    """Corpo JSON colunar de uma tabela Arrow (nulos viram null)."""
+    return {"colunas": tabela.column_names, "dados": tabela.to_pydict()}
+
+
+def _arrow_ipc(tabela: pa.Table) -> bytes:
+    destino = pa.BufferOutputStream()
+    with pa.ipc.new_stream(destino, tabela.schema) as escritor:
+        escritor.write_table(tabela)
+    return destino.getvalue().to_pybytes()
+
+
+# ─── 3. CACHE DE RESPOSTAS ──────────────────────────────────────────
+class CacheRespostas:
+    """Cache LRU das respostas prontas (bytes), limitado pelo total de bytes.
+
+    A chave é a rota, o formato e os parâmetros em forma canônica, então a
+    mesma consulta de vários clientes é servida sem refazer filtro nem
+    serialização.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self._itens: OrderedDict[tuple, tuple] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = self.falhas = 0
+
+    @staticmethod
+    def chave(rota: str, formato: str, parametros: dict[str, list[str]]) -> tuple:
+        return rota, formato, tuple(sorted((k, tuple(v)) for k, v in parametros.items()))
+
+    def obter(self, chave: tuple) -> tuple | None:
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+            self.falhas += 1
+            return None
+
+    def guardar(self, chave: tuple, resposta: tuple) -> None:
+        tamanho = len(resposta[-1])
+        if tamanho > self.max_bytes:
+            return
+        with self._lock:
+            if chave in self._itens:
+                return
+            self._itens[chave] = resposta
+            self._bytes += tamanho
+            while self._bytes > self.max_bytes:
+                _, antiga = self._itens.popitem(last=False)
+                self._bytes -= len(antiga[-1])
+
+
+# ─── 4. SERVIÇO DE CONSULTA ─────────────────────────────────────────
+class ServicoConsulta:
+    """Responde às rotas da API sobre as tabelas de modalidade.
+
+    `carregar` recebe o arquivo da modalidade e devolve a TabelaModalidade;
+    dentro do dashboard é o próprio carregar_modalidade (mesmas tabelas e
+    mesmo CacheFiltros da interface), fora dele um carregador local. `pasta`
+    é onde estão os Parquet: /modalidades só lista os que existem lá, e
+    /agregado soma pelo cubo (preparar_dados.py cubos) que estiver ao lado.
+    """
+
+    def __init__(self, carregar: Callable[[str], TabelaModalidade],
+                 cache_filtros: CacheFiltros | None = None,
+                 cache_respostas: CacheRespostas | None = None,
+                 pasta: str | Path = "."):
+        self.carregar = carregar
+        self.pasta = Path(pasta)
+        self.cache_filtros = cache_filtros or CacheFiltros()
+        self.cache_respostas = cache_respostas or CacheRespostas()
+        # Cubo por modalidade: (mtime e tamanho da origem, (cubo, motor) ou None)
+        self._cubos: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._rotas = {
+            "/modalidades": self.modalidades,
+            "/opcoes": self.opcoes,
+            "/consulta": self.consulta,
+            "/agregado": self.agregado,
+        }
+
+    def responder(self, rota: str, parametros: dict[str, list[str]],
+                  formato: str = "json") -> tuple[int, str, dict, bytes]:
+        """(status, content-type, cabeçalhos extras, corpo) de uma requisição.
+
+        As rotas devolvem o corpo e um dicionário de metadados (total,
+        página...): no JSON eles entram no próprio corpo; no Arrow, viram
+        cabeçalhos X-<Nome>.
+        """
+        if rota not in self._rotas:
+            return self._erro(404, f"Rota desconhecida: {rota}")
+        chave = CacheRespostas.chave(rota, formato, parametros)
+        resposta = self.cache_respostas.obter(chave)
+        if resposta is not None:
+            return resposta
+        try:
+            corpo, meta = self._rotas[rota](parametros)
+        except ErroConsulta as e:
+            return self._erro(400, str(e))
+
+        if isinstance(corpo, pa.Table):
+            if formato == "arrow":
+                cabecalhos = {f"X-{k.capitalize()}": v for k, v in meta.items()}
+                resposta = (200, TIPO_ARROW, cabecalhos, _arrow_ipc(corpo))
+                self.cache_respostas.guardar(chave, resposta)
+                return resposta
+            corpo = {**meta, **_colunar(corpo)}
+        resposta = (200, TIPO_JSON, {}, json.dumps(corpo, ensure_ascii=False).encode())
+        self.cache_respostas.guardar(chave, resposta)
+        return resposta
+
+    @staticmethod
+    def _erro(status: int, mensagem: str) -> tuple[int, str, dict, bytes]:
+        return status, TIPO_JSON, {}, json.dumps({"erro": mensagem}, ensure_ascii=False).encode()
+
+    # --- rotas ---
+    def modalidades(self, parametros) -> tuple[dict, dict]:
+        corpo = {}
+        for nome, config in MODALIDADES.items():
+            if not (self.pasta / ARQ[nome]).exists():
+                continue
+            colunas = colunas_usadas(ARQ[nome])
+            corpo[nome] = {
+                "niveis": {ui: plano_colunas(nivel, colunas) for ui, nivel in nivel_map.items()},
+                "serie_col": config.serie_col,
+            }
+        return corpo, {}
+
+    def opcoes(self, parametros) -> tuple[dict, dict]:
+        modalidade, nivel = _modalidade(parametros), _nivel(parametros)
+        opcoes = self.carregar(ARQ[modalidade]).opcoes(nivel, MODALIDADES[modalidade].serie_col)
+        return {
+            "anos": opcoes.anos, "redes": opcoes.redes, "etapas": opcoes.etapas,
+            "hierarquia": opcoes.hierarquia,
+        }, {}
+
+    def _filtros(self, parametros) -> tuple:
+        """Modalidade, nível, tabela, anos, redes, filtros de etapa e buscas pedidos."""
+        modalidade, nivel = _modalidade(parametros), _nivel(parametros)
+        arquivo, serie_col = ARQ[modalidade], MODALIDADES[modalidade].serie_col
+        tabela = self.carregar(arquivo)
+        colunas = plano_colunas(nivel, tabela.tabela.column_names)
+
+        try:
+            anos = [int(a) for a in parametros.get("ano", [])]
+        except ValueError:
+            raise ErroConsulta("ano deve ser inteiro") from None
+        # Sem ano/rede: todos (na interface ao menos um ano é obrigatório)
+        anos = anos or tabela.opcoes(nivel, serie_col).anos
+        redes = parametros.get("rede", [])
+        filtros = {k: parametros.get(k, []) for k in ("etapa", "subetapa", "serie")}
+
+        buscas = {k.removeprefix("busca."): v[-1] for k, v in parametros.items()
+                  if k.startswith("busca.")}
+        for col in buscas:
+            if col not in colunas:
+                raise ErroConsulta(f"Coluna de busca inexistente no nível: {col!r}")
+        return modalidade, nivel, tabela, anos, redes, filtros, buscas
+
+    def _linhas(self, parametros, pedido: tuple | None = None
+                ) -> tuple[TabelaModalidade, str, np.ndarray]:
+        """Tabela, nível e posições das linhas que passam nos filtros pedidos."""
+        modalidade, nivel, tabela, anos, redes, filtros, buscas = pedido or self._filtros(parametros)
+        arquivo, serie_col = ARQ[modalidade], MODALIDADES[modalidade].serie_col
+        chave = CacheFiltros.chave(arquivo, nivel, anos, redes, filtros)
+        linhas = self.cache_filtros.obter(chave, lambda: filtrar_indices(
+            tabela.motor(nivel, serie_col), modalidade, anos, redes, filtros
+        ))
+        if buscas:
+            linhas = filtrar_texto(tabela.indice_texto(nivel), linhas, buscas, {})
+        return tabela, nivel, linhas
+
+    def consulta(self, parametros) -> tuple[pa.Table, dict]:
+        tabela, nivel, linhas = self._linhas(parametros)
+        por_pagina = _inteiro(parametros, "por_pagina", POR_PAGINA_PADRAO, maximo=POR_PAGINA_MAX)
+        paginas = max(1, -(-len(linhas) // por_pagina))
+        pagina = _inteiro(parametros, "pagina", 1, maximo=paginas)
+
+        df = tabela.nivel(nivel)
+        inicio = (pagina - 1) * por_pagina
+        df_page = montar_linhas(df, linhas[inicio:inicio + por_pagina],
+                                plano_colunas(nivel, list(df.columns)))
+        meta = {"total": len(linhas), "pagina": pagina, "paginas": paginas}
+        return pa.Table.from_pandas(df_page, preserve_index=False).replace_schema_metadata(), meta
+
+    def _cubo(self, modalidade: str) -> tuple[pa.Table, MotorFiltro] | None:
+        """Cubo atualizado da modalidade e o motor de filtro sobre ele (None sem cubo).
+
+        O cubo só é relido (e a origem conferida pelo SHA-256) quando o
+        mtime ou o tamanho do Parquet de origem mudam.
+        """
+        origem = self.pasta / ARQ[modalidade]
+        info = origem.stat()
+        marca = (info.st_mtime_ns, info.st_size)
+        with self._lock:
+            guardado = self._cubos.get(modalidade)
+        if guardado is None or guardado[0] != marca:
+            cubo = ler_cubo(origem)
+            if cubo is not None:
+                # Mesmos valores das tabelas (Subetapa nula vira "N/A"); o texto
+                # fica sem dicionário para o agregar_cubo poder ordenar
+                tipado = converter_tipos(cubo)
+                for col in ("Subetapa", "Ano/Série"):
+                    if col in cubo.column_names:
+                        cubo = cubo.set_column(cubo.column_names.index(col), col,
+                                               tipado[col].cast(pa.string()))
+                cubo = (cubo, MotorFiltro(tipado.to_pandas(), MODALIDADES[modalidade].serie_col))
+            guardado = (marca, cubo)
+            with self._lock:
+                self._cubos[modalidade] = guardado
+        return guardado[1]
+
+    def agregado(self, parametros) -> tuple[pa.Table, dict]:
+        pedido = self._filtros(parametros)
+        modalidade, _, _, anos, redes, filtros, buscas = pedido
+        tabela, nivel, linhas = self._linhas(parametros, pedido)
+        df = tabela.nivel(nivel)
+        por = parametros.get("por", [])
+        for col in por:
+            if col not in df.columns or col == MEDIDA:
+                raise ErroConsulta(f"Coluna de agrupamento inválida: {col!r}")
+
+        # Escola e município: soma no cubo, que já agrupa as escolas por todas
+        # as dimensões de filtro (o estado é pequeno e segue os rótulos da origem)
+        cubo = (self._cubo(modalidade)
+                if nivel != nivel_map["Pernambuco"] and not buscas else None)
+        if cubo is not None and set(por) <= set(cubo[0].column_names):
+            tabela_cubo, motor = cubo
+            grupos = agregar_cubo(
+                tabela_cubo.take(filtrar_indices(motor, modalidade, anos, redes, filtros)), por
+            ).to_pandas()
+        elif por:
+            grupos = (df.iloc[linhas].groupby(por, observed=True, sort=True)[MEDIDA]
+                      .sum().reset_index())
+        else:
+            grupos = df.iloc[linhas][[MEDIDA]].sum().to_frame().T
+        grupos[MEDIDA] = grupos[MEDIDA].astype(np.int64)
+        return (pa.Table.from_pandas(grupos, preserve_index=False).replace_schema_metadata(),
+                {"total": len(linhas)})
+
+
+def carregador_local(pasta: str | Path = ".") -> Callable[[str], TabelaModalidade]:
+    """Carregador com cache próprio, para a API fora do dashboard."""
+    tabelas: dict[str, TabelaModalidade] = {}
+    lock = threading.Lock()
+
+    def carregar(arquivo: str) -> TabelaModalidade:
+        with lock:
+            if arquivo not in tabelas:
+                tabelas[arquivo] = TabelaModalidade(ler_modalidade(str(Path(pasta) / arquivo)))
+            return tabelas[arquivo]
+
+    return carregar
+
+
+# ─── 5. SERVIDOR HTTP ───────────────────────────────────────────────
+class _Manipulador(BaseHTTPRequestHandler):
+    # HTTP/1.1: a conexão fica aberta entre requisições (keep-alive)
+    protocol_version = "HTTP/1.1"
+    server_version = "DashboardPNE-API"
+    # Cabeçalhos e corpo saem em escritas separadas: sem TCP_NODELAY, o
+    # Nagle + ACK atrasado do cliente somam ~40 ms a cada resposta
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        partes = urlsplit(self.path)
+        parametros = parse_qs(partes.query)
+        formato = parametros.pop("formato", [""])[-1]
+        if not formato:
+            formato = "arrow" if TIPO_ARROW in self.headers.get("Accept", "") else "json"
+
+        try:
+            status, tipo, extras, corpo = self.server.servico.responder(
+                partes.path.rstrip("/") or "/", parametros, formato
+            )
+        except Exception as e:
+            status, tipo, extras, corpo = ServicoConsulta._erro(500, f"{type(e).__name__}: {e}")
+
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        for nome, valor in extras.items():
+            self.send_header(nome, str(valor))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *args):
+        if self.server.verboso:
+            super().log_message(formato, *args)
+
+
+def criar_servidor(servico: ServicoConsulta, host: str = HOST_PADRAO,
+                   porta: int = PORTA_PADRAO, verboso: bool = False) -> ThreadingHTTPServer:
+    """Servidor HTTP (uma thread por conexão) sobre o serviço de consulta."""
+    servidor = ThreadingHTTPServer((host, porta), _Manipulador)
+    servidor.daemon_threads = True
+    servidor.servico = servico
+    servidor.verboso = verboso
+    return servidor
+
+
+def iniciar_em_segundo_plano(servico: ServicoConsulta, host: str = HOST_PADRAO,
+                             porta: int = PORTA_PADRAO) -> ThreadingHTTPServer:
+    """Sobe o servidor numa thread daemon (usado dentro do dashboard)."""
+    servidor = criar_servidor(servico, host, porta)
+    threading.Thread(target=servidor.serve_forever, name="api-consulta", daemon=True).start()
+    return servidor
+
+
+# ─── 6. TESTE DE CARGA ──────────────────────────────────────────────
+def _get(conexao: http.client.HTTPConnection, caminho: str) -> tuple[int, bytes]:
+    conexao.request("GET", caminho)
+    resposta = conexao.getresponse()
+    return resposta.status, resposta.read()
+
+
+def consultas_representativas(url: str) -> list[str]:
+    """Caminhos de consulta variados, montados a partir de /modalidades e /opcoes."""
+    partes = urlsplit(url)
+    conexao = http.client.HTTPConnection(partes.hostname, partes.port)
+    _, corpo = _get(conexao, "/modalidades")
+    caminhos = []
+    for modalidade, info in json.loads(corpo).items():
+        for nivel_ui in info["niveis"]:
+            base = {"modalidade": modalidade, "nivel": nivel_ui}
+            status, corpo = _get(conexao, "/opcoes?" + urlencode(base))
+            if status != 200:
+                continue
+            opcoes = json.loads(corpo)
+            for ano in opcoes["anos"][:2]:
+                for pagina in (1, 2, 5):
+                    caminhos.append("/consulta?" + urlencode({**base, "ano": ano, "pagina": pagina}))
+                caminhos.append("/agregado?" + urlencode({**base, "ano": ano, "por": "Rede"}))
+            caminhos.append("/consulta?" + urlencode({**base, "formato": "arrow"}))
+    conexao.close()
+    return caminhos
+
+
+def carga(url: str, clientes: int, requisicoes: int) -> dict:
+    """Dispara `clientes` conexões keep-alive concorrentes e mede as latências."""
+    caminhos = consultas_representativas(url)
+    partes = urlsplit(url)
+    latencias: list[float] = []
+    erros = [0]
+    lock = threading.Lock()
+
+    def cliente(semente: int):
+        rng = np.random.default_rng(semente)
+        conexao = http.client.HTTPConnection(partes.hostname, partes.port)
+        proprias, falhas = [], 0
+        for _ in range(requisicoes):
+            caminho = caminhos[rng.integers(len(caminhos))]
+            t0 = time.perf_counter()
+            status, _ = _get(conexao, caminho)
+            proprias.append(time.perf_counter() - t0)
+            falhas += status != 200
+        conexao.close()
+        with lock:
+            latencias.extend(proprias)
+            erros[0] += falhas
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - t0
+
+    ms = np.array(latencias) * 1000
+    return {
+        "requisicoes": len(ms), "erros": erros[0], "segundos": round(duracao, 2),
+        "req_por_s": round(len(ms) / duracao, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+    }
+
+
+# ─── 7. LINHA DE COMANDO ────────────────────────────────────────────
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_servir = sub.add_parser("servir", help="sobe a API de consulta")
+    p_servir.add_argument("--host", default=HOST_PADRAO)
+    p_servir.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    p_servir.add_argument("--pasta", type=Path, default=Path("."),
+                          help="pasta dos Parquet de modalidade")
+    p_servir.add_argument("--verboso", action="store_true", help="registra cada requisição")
+
+    p_carga = sub.add_parser("carga", help="teste de carga com clientes concorrentes")
+    p_carga.add_argument("--url", default=f"http://{HOST_PADRAO}:{PORTA_PADRAO}")
+    p_carga.add_argument("--clientes", type=int, default=8)
+    p_carga.add_argument("--requisicoes", type=int, default=200, help="por cliente")
+
+    args = parser.parse_args(argv)
+    if args.comando == "servir":
+        servidor = criar_servidor(ServicoConsulta(carregador_local(args.pasta), pasta=args.pasta),
+                                  args.host, args.porta, args.verboso)
+        print(f"API em http://{args.host}:{args.porta}", file=sys.stderr)
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+    elif args.comando == "carga":
+        print(json.dumps(carga(args.url, args.clientes, args.requisicoes), indent=1))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
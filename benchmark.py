@@ -0,0 +1,414 @@
+# ─── BENCHMARK OFFLINE (sem servidor Streamlit) ─────────────────────
+"""Mede os caminhos críticos do dashboard com dados sintéticos.
+
+Uso:
+    python benchmark.py [--escalas 1 10] [--pasta DIR] [--saida resultado.json]
+                        [--comparar base.json] [--tolerancia 0.25]
+
+Gera um "Ensino Regular.parquet" sintético com o mesmo esquema dos arquivos
+reais (escolas × anos × redes × etapas, mais os níveis município e estado
+somados a partir das escolas) e cronometra carga (bruta, via cache Arrow e via
+Parquet otimizado), filtro, busca textual, paginação e exportação CSV/XLSX
+usando as funções de dados.py. Com --comparar, termina com código 1 se alguma etapa
+ficar mais lenta que a referência além da tolerância.
+
+A escala 1 tem ~1,3 milhão de linhas; a escala 10 (~13 milhões) precisa de
+algo como 6 GB de RAM livre, pois a carga ainda mantém cópias da tabela.
+"""
+import argparse
+import json
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import psutil
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from dados import (
+    MODALIDADES, Paginator, PerfilEtapas, TabelaModalidade, caminho_cache,
+    filtrar_dados, filtrar_indices, filtrar_texto, formatar_pagina,
+    gerar_csv, gerar_xlsx, ler_modalidade, montar_linhas,
+)
+from preparar_dados import caminho_manifesto, caminho_otimizado, otimizar
+
+# ─── 1. CONSTANTES ──────────────────────────────────────────────────
+MODALIDADE = "Ensino Regular"
+
+# Escala 1: ordem de grandeza do Censo Escolar em Pernambuco
+ESCOLAS_BASE = 3_000
+MUNICIPIOS_BASE = 185
+ANOS = list(range(2015, 2025))
+
+# Rede própria da escola (com peso) e as redes agregadas em que ela entra
+REDES_ESCOLA = {"Municipal": 0.60, "Estadual": 0.20, "Privada": 0.18, "Federal": 0.02}
+REDES_AGREGADAS = {
+    "Pública e Privada": {"Municipal", "Estadual", "Privada", "Federal"},
+    "Pública (Federal, Estadual e Municipal)": {"Municipal", "Estadual", "Federal"},
+    "Pública (Estadual e Municipal)": {"Municipal", "Estadual"},
+}
+
+# Etapa → {subetapa: [séries]} (None = linha sem série)
+ETAPAS = {
+    "Educação Infantil": {
+        "Educação Infantil - Total": [None],
+        "Creche": [None],
+        "Pré-Escola": [None],
+    },
+    "Ensino Fundamental": {
+        "Ensino Fundamental - Total": [None],
+        "Anos Iniciais": ["1º Ano", "2º Ano", "3º Ano", "4º Ano", "5º Ano"],
+        "Anos Finais": ["6º Ano", "7º Ano", "8º Ano", "9º Ano"],
+    },
+    "Ensino Médio": {
+        "Ensino Médio - Total": [None],
+        "Propedêutico": ["1ª Série", "2ª Série", "3ª Série"],
+        "Normal/Magistério": [None],
+    },
+}
+# Probabilidade de a escola oferecer cada etapa
+OFERTA = {"Educação Infantil": 0.55, "Ensino Fundamental": 0.75, "Ensino Médio": 0.25}
+
+PREFIXOS_MUNICIPIO = ["São", "Santa", "Bom", "Nova", "Lagoa", "Serra", "Água", "Belém", "Poço"]
+SUFIXOS_MUNICIPIO = ["Jardim", "da Mata", "do Norte", "Preta", "Grande", "de Goitá",
+                     "do Una", "Branca", "dos Gatos", "Dourada", "de São Félix"]
+PREFIXOS_ESCOLA = ["ESCOLA MUNICIPAL", "ESCOLA ESTADUAL", "COLEGIO", "CRECHE",
+                   "ESCOLA DE REFERENCIA EM ENSINO MEDIO", "CENTRO EDUCACIONAL"]
+NOMES_ESCOLA = ["JOSE DA SILVA", "MARIA DE LOURDES", "JOAQUIM NABUCO", "PAULO FREIRE",
+                "FREI CANECA", "ANTONIO CONSELHEIRO", "NOSSA SENHORA DO CARMO",
+                "DOM HELDER CAMARA", "MANUEL BANDEIRA", "CLARICE LISPECTOR"]
+
+
+# ─── 2. DADOS SINTÉTICOS ────────────────────────────────────────────
+def _combinacoes() -> list[tuple[str, str, str | None]]:
+    return [(etapa, sub, serie)
+            for etapa, subs in ETAPAS.items()
+            for sub, series in subs.items() for serie in series]
+
+
+def _dicionario(valores: list, codigos: np.ndarray) -> pa.Array:
+    """Coluna de texto a partir de códigos (decodificada, como nos arquivos reais)."""
+    return pa.DictionaryArray.from_arrays(
+        pa.array(codigos, pa.int32()), pa.array(valores, pa.string())
+    ).dictionary_decode()
+
+
+def gerar_parquet(destino: Path, escala: int, semente: int = 0) -> int:
+    """Grava o Parquet sintético da modalidade e devolve o número de linhas."""
+    rng = np.random.default_rng(semente)
+    n_escolas = ESCOLAS_BASE * escala
+    n_mun = MUNICIPIOS_BASE * escala
+
+    # Municípios e escolas
+    nomes_mun = [f"{PREFIXOS_MUNICIPIO[i % len(PREFIXOS_MUNICIPIO)]} "
+                 f"{SUFIXOS_MUNICIPIO[i // len(PREFIXOS_MUNICIPIO) % len(SUFIXOS_MUNICIPIO)]}"
+                 + (f" {i // (len(PREFIXOS_MUNICIPIO) * len(SUFIXOS_MUNICIPIO)) + 1}"
+                    if i >= len(PREFIXOS_MUNICIPIO) * len(SUFIXOS_MUNICIPIO) else "")
+                 for i in range(n_mun)]
+    mun_da_escola = rng.integers(0, n_mun, n_escolas)
+    redes = list(REDES_ESCOLA)
+    rede_da_escola = rng.choice(len(redes), n_escolas, p=list(REDES_ESCOLA.values()))
+    nomes_escola = [f"{PREFIXOS_ESCOLA[i % len(PREFIXOS_ESCOLA)]} "
+                    f"{NOMES_ESCOLA[i // len(PREFIXOS_ESCOLA) % len(NOMES_ESCOLA)]} {i}"
+                    for i in range(n_escolas)]
+
+    # Pares (escola, combinação etapa/subetapa/série) ofertados
+    combos = _combinacoes()
+    etapas = list(ETAPAS)
+    oferta = rng.random((n_escolas, len(etapas))) < np.array([OFERTA[e] for e in etapas])
+    etapa_do_combo = np.array([etapas.index(c[0]) for c in combos])
+    escola_par, combo_par = np.nonzero(oferta[:, etapa_do_combo])
+
+    # Cada par aparece na rede própria e nas redes agregadas que a incluem
+    todas_redes = redes + list(REDES_AGREGADAS)
+    pertence = np.zeros((len(redes), len(todas_redes)), dtype=bool)
+    for i, rede in enumerate(redes):
+        pertence[i, i] = True
+        for j, membros in enumerate(REDES_AGREGADAS.values()):
+            pertence[i, len(redes) + j] = rede in membros
+    par, rede_linha = np.nonzero(pertence[rede_da_escola[escola_par]])
+    escola, combo = escola_par[par], combo_par[par]
+
+    # Repete para cada ano
+    n = len(escola)
+    escola = np.tile(escola, len(ANOS))
+    combo = np.tile(combo, len(ANOS))
+    rede_linha = np.tile(rede_linha, len(ANOS))
+    ano = np.repeat(np.array(ANOS, dtype=np.int64), n)
+    matriculas = rng.poisson(40, len(escola)).astype(np.int64)
+
+    etapa_v, sub_v, serie_v = (sorted({c[k] for c in combos if c[k]}) for k in range(3))
+
+    def codigos(valores, k):
+        pos = {v: i for i, v in enumerate(valores)}
+        return np.array([pos.get(c[k], -1) for c in combos])[combo]
+
+    serie_codigos = codigos(serie_v, 2)
+    escolas = pa.table({
+        "Nível de agregação": pa.array(["escola"] * len(escola), pa.string()),
+        "Ano": ano,
+        "Cód. Município": (2_600_000 + mun_da_escola[escola] * 10).astype(np.float64),
+        "Nome do Município": _dicionario(nomes_mun, mun_da_escola[escola]),
+        "Cód. da Escola": (26_000_000 + escola).astype(np.float64),
+        "Nome da Escola": _dicionario(nomes_escola, escola),
+        "Modalidade": pa.array([MODALIDADE] * len(escola), pa.string()),
+        "Etapa": _dicionario(etapa_v, codigos(etapa_v, 0)),
+        "Subetapa": _dicionario(sub_v, codigos(sub_v, 1)),
+        "Ano/Série": pa.array(
+            np.array(serie_v + [None], dtype=object)[serie_codigos], pa.string()
+        ),
+        "Rede": _dicionario(todas_redes, rede_linha),
+        "Número de Matrículas": matriculas,
+    })
+
+    # Níveis município e estado: somas das escolas (como nos arquivos reais)
+    dims = ["Ano", "Etapa", "Subetapa", "Ano/Série", "Rede"]
+    medida = "Número de Matrículas"
+    municipios = (escolas.group_by(dims + ["Cód. Município", "Nome do Município"],
+                                   use_threads=False)
+                  .aggregate([(medida, "sum")]).rename_columns({f"{medida}_sum": medida}))
+    estado = (escolas.group_by(dims, use_threads=False)
+              .aggregate([(medida, "sum")]).rename_columns({f"{medida}_sum": medida}))
+
+    def completar(tabela: pa.Table, nivel: str) -> pa.Table:
+        colunas = {}
+        for campo in escolas.schema:
+            if campo.name == "Nível de agregação":
+                colunas[campo.name] = pa.array([nivel] * len(tabela), pa.string())
+            elif campo.name == "Modalidade":
+                colunas[campo.name] = pa.array([MODALIDADE] * len(tabela), pa.string())
+            elif campo.name in tabela.column_names:
+                colunas[campo.name] = tabela[campo.name]
+            else:
+                colunas[campo.name] = pa.nulls(len(tabela), campo.type)
+        return pa.table(colunas, schema=escolas.schema)
+
+    tabela = pa.concat_tables([escolas, completar(municipios, "município"),
+                               completar(estado, "estado")])
+    pq.write_table(tabela, destino)
+    return len(tabela)
+
+
+# ─── 3. MEDIÇÃO ─────────────────────────────────────────────────────
+class _PicoRSS:
+    """Amostra o RSS do processo em segundo plano e guarda o maior valor."""
+
+    def __init__(self, intervalo: float = 0.005):
+        self._processo = psutil.Process()
+        self._intervalo = intervalo
+        self._parar = threading.Event()
+        self.pico = 0
+
+    def __enter__(self):
+        self.pico = self._processo.memory_info().rss
+        self._thread = threading.Thread(target=self._amostrar, daemon=True)
+        self._thread.start()
+        return self
+
+    def _amostrar(self):
+        while not self._parar.wait(self._intervalo):
+            self.pico = max(self.pico, self._processo.memory_info().rss)
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+        self.pico = max(self.pico, self._processo.memory_info().rss)
+
+
+class Medidor:
+    """Cronometra etapas (melhor de N repetições) e acumula os resultados."""
+
+    def __init__(self, escala: int, repeticoes: int, perfil: PerfilEtapas):
+        self.escala = escala
+        self.repeticoes = repeticoes
+        self.perfil = perfil
+        self.resultados: list[dict] = []
+
+    def medir(self, etapa: str, funcao, linhas: int, repetir: bool = True):
+        """Executa `funcao`, registra tempo, vazão e pico de RSS; devolve o resultado."""
+        tempos = []
+        with _PicoRSS() as pico:
+            for _ in range(self.repeticoes if repetir else 1):
+                with self.perfil.medir(etapa, f"escala-{self.escala}", linhas) as registro:
+                    resultado = funcao()
+                    if hasattr(resultado, "__len__"):
+                        registro["linhas_saida"] = len(resultado)
+                tempos.append(registro["segundos"])
+        segundos = min(tempos)
+        self.resultados.append({
+            "escala": self.escala, "etapa": etapa, "linhas": linhas,
+            "segundos": segundos,
+            "linhas_por_s": linhas / segundos if segundos else float("inf"),
+            "pico_rss_mb": pico.pico / 1024 ** 2,
+        })
+        return resultado
+
+
+# ─── 4. CENÁRIOS ────────────────────────────────────────────────────
+def _filtros_representativos(opcoes) -> dict[str, tuple]:
+    """(anos, redes, filtros) como os que a interface produz."""
+    anos, redes = opcoes.anos, opcoes.redes
+    padrao = MODALIDADES[MODALIDADE].etapa_valores["padrao"]
+    fund = "Ensino Fundamental"
+    return {
+        "padrao": (anos[:1], redes, {"etapa": [padrao], "subetapa": [], "serie": []}),
+        "todos_anos": (anos, redes, {"etapa": [padrao], "subetapa": [], "serie": []}),
+        "uma_rede": (anos[:3], redes[:1], {"etapa": [fund], "subetapa": [], "serie": []}),
+        "subetapa": (anos, redes, {"etapa": [fund], "subetapa": ["Anos Iniciais"], "serie": []}),
+        "serie": (anos, redes, {"etapa": [fund], "subetapa": ["Anos Iniciais"],
+                                "serie": ["1º Ano", "5º Ano"]}),
+    }
+
+
+BUSCAS = {
+    "Nome da Escola": ["referencia", "jose", "NOSSA SENHORA"],
+    "Nome do Município": ["sao", "Belém"],
+    "Número de Matrículas": ["40"],
+}
+
+
+def executar(arquivo: Path, escala: int, repeticoes: int, perfil: PerfilEtapas,
+             linhas_xlsx: int) -> list[dict]:
+    m = Medidor(escala, repeticoes, perfil)
+    total = pq.read_metadata(arquivo).num_rows
+    serie_col = MODALIDADES[MODALIDADE].serie_col
+
+    # A primeira carga grava o cache Arrow IPC; a segunda só o mapeia
+    tabela = m.medir("carregar", lambda: TabelaModalidade(ler_modalidade(str(arquivo))),
+                     total, repetir=False)
+    m.medir("carregar_cache", lambda: TabelaModalidade(ler_modalidade(str(arquivo))),
+            total, repetir=False)
+    caminho_cache(arquivo).unlink()
+
+    # Mesma carga a partir do Parquet otimizado (preparar_dados.py otimizar)
+    m.medir("otimizar", lambda: otimizar(arquivo), total, repetir=False)
+    m.medir("carregar_otimizado", lambda: TabelaModalidade(ler_modalidade(str(arquivo))),
+            total, repetir=False)
+    for caminho in (caminho_cache(arquivo), caminho_otimizado(arquivo), caminho_manifesto(arquivo)):
+        caminho.unlink()
+
+    for nivel in ("escola", "município", "estado"):
+        inicio, fim = tabela.faixas[nivel]
+        df = m.medir(f"visao_pandas[{nivel}]", lambda: tabela.nivel(nivel),
+                     fim - inicio, repetir=False)
+        opcoes = m.medir(f"opcoes[{nivel}]", lambda: tabela.opcoes(nivel, serie_col),
+                         len(df), repetir=False)
+        motor = m.medir(f"motor[{nivel}]", lambda: tabela.motor(nivel, serie_col),
+                        len(df), repetir=False)
+
+        idx = None
+        for nome, (anos, redes, filtros) in _filtros_representativos(opcoes).items():
+            idx_nome = m.medir(f"filtrar_indices[{nivel}:{nome}]", lambda: filtrar_indices(
+                motor, MODALIDADE, anos, redes, filtros), len(df))
+            m.medir(f"filtrar_dados[{nivel}:{nome}]", lambda: filtrar_dados(
+                df, MODALIDADE, anos, redes, filtros, motor), len(df))
+            if nome == "todos_anos":
+                idx = idx_nome
+
+        # Busca textual sobre o resultado do filtro mais amplo
+        indice = m.medir(f"indice_texto[{nivel}]", lambda: tabela.indice_texto(nivel),
+                         len(df), repetir=False)
+        for col, consultas in BUSCAS.items():
+            if not indice.tem(col) or df[col].isna().all():
+                continue
+            # A primeira busca na coluna monta o índice de trigramas dela
+            m.medir(f"indexar[{nivel}:{col}]", lambda: filtrar_texto(
+                indice, idx, {col: consultas[0]}, {}), len(df), repetir=False)
+            for consulta in consultas:
+                m.medir(f"busca[{nivel}:{col}={consulta}]",
+                        lambda: filtrar_texto(indice, idx, {col: consulta}, {}), len(idx))
+
+        # Paginação: primeira, do meio e última página, já formatadas
+        vis_cols = [c for c in ("Ano", "Nome do Município", "Nome da Escola", "Etapa",
+                                "Subetapa", serie_col, "Rede", "Número de Matrículas")
+                    if c in df.columns]
+        pag_total = Paginator(len(idx), page_size=500).total_pages
+        for pagina in sorted({1, (pag_total + 1) // 2, pag_total}):
+            pag = Paginator(len(idx), page_size=500, current=pagina)
+            m.medir(f"pagina[{nivel}:{pagina}]", lambda: formatar_pagina(
+                montar_linhas(df, pag.indices(idx), vis_cols)), len(idx))
+
+        # Exportação do resultado do filtro (XLSX limitado: é bem mais lento)
+        df_export = montar_linhas(df, idx, vis_cols)
+        m.medir(f"gerar_csv[{nivel}]", lambda: gerar_csv(df_export),
+                len(df_export), repetir=False).close()
+        df_xlsx = df_export.iloc[:linhas_xlsx]
+        m.medir(f"gerar_xlsx[{nivel}]", lambda: gerar_xlsx(df_xlsx),
+                len(df_xlsx), repetir=False).close()
+
+    return m.resultados
+
+
+# ─── 5. RELATÓRIO ───────────────────────────────────────────────────
+def imprimir(resultados: list[dict]) -> None:
+    print(f"{'escala':>6}  {'etapa':<52} {'linhas':>10} {'ms':>10} "
+          f"{'linhas/s':>13} {'pico RSS (MB)':>14}")
+    for r in resultados:
+        print(f"{r['escala']:>6}  {r['etapa']:<52} {r['linhas']:>10,} "
+              f"{r['segundos'] * 1000:>10.1f} {r['linhas_por_s']:>13,.0f} "
+              f"{r['pico_rss_mb']:>14.0f}")
+
+
+def regressoes(resultados: list[dict], referencia: list[dict],
+               tolerancia: float) -> list[str]:
+    """Etapas mais lentas que a referência além da tolerância relativa."""
+    base = {(r["escala"], r["etapa"]): r["segundos"] for r in referencia}
+    lentas = []
+    for r in resultados:
+        anterior = base.get((r["escala"], r["etapa"]))
+        # Etapas muito curtas oscilam demais para serem comparadas
+        if anterior and anterior > 0.005 and r["segundos"] > anterior * (1 + tolerancia):
+            lentas.append(f"{r['etapa']} (escala {r['escala']}): "
+                          f"{anterior * 1000:.1f} → {r['segundos'] * 1000:.1f} ms")
+    return lentas
+
+
+# ─── 6. LINHA DE COMANDO ────────────────────────────────────────────
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escalas", type=int, nargs="+", default=[1, 10],
+                        help="multiplicadores do número de escolas e municípios")
+    parser.add_argument("--pasta", type=Path,
+                        help="onde gravar os Parquet sintéticos (padrão: temporária)")
+    parser.add_argument("--repeticoes", type=int, default=3,
+                        help="repetições das etapas rápidas (vale o melhor tempo)")
+    parser.add_argument("--linhas-xlsx", type=int, default=100_000,
+                        help="limite de linhas da exportação XLSX")
+    parser.add_argument("--saida", type=Path, help="grava os resultados em JSON")
+    parser.add_argument("--log", type=Path, help="grava os registros por etapa em JSONL")
+    parser.add_argument("--comparar", type=Path, help="JSON de referência (de --saida)")
+    parser.add_argument("--tolerancia", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    perfil = PerfilEtapas(capacidade=10_000, arquivo=args.log)
+    resultados = []
+    with tempfile.TemporaryDirectory() as tmp:
+        pasta = args.pasta or Path(tmp)
+        pasta.mkdir(parents=True, exist_ok=True)
+        for escala in args.escalas:
+            arquivo = pasta / f"escala-{escala}" / f"{MODALIDADE}.parquet"
+            arquivo.parent.mkdir(exist_ok=True)
+            t0 = time.perf_counter()
+            linhas = gerar_parquet(arquivo, escala)
+            print(f"# escala {escala}: {linhas:,} linhas sintéticas "
+                  f"({time.perf_counter() - t0:.1f}s para gerar)", file=sys.stderr)
+            resultados += executar(arquivo, escala, args.repeticoes, perfil, args.linhas_xlsx)
+
+    imprimir(resultados)
+    if args.saida:
+        args.saida.write_text(json.dumps(resultados, ensure_ascii=False, indent=2),
+                              encoding="utf-8")
+    if args.comparar:
+        referencia = json.loads(args.comparar.read_text(encoding="utf-8"))
+        lentas = regressoes(resultados, referencia, args.tolerancia)
+        for linha in lentas:
+            print(f"REGRESSÃO: {linha}", file=sys.stderr)
+        return 1 if lentas else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
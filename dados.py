@@ -0,0 +1,1446 @@
+# ─── CAMADA DE DADOS (sem Streamlit) ───────────────────────────────
+"""Leitura, filtro, busca, paginação e exportação dos dados do dashboard.
+
+Não depende do Streamlit: é usada pelo app (main.py), que acrescenta apenas
+o cache por processo e a interface, e pode ser importada por scripts.
+"""
+import hashlib
+import json
+import operator
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import reduce
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import psutil
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import xlsxwriter
+
+from preparar_dados import (
+    CHAVE_ORIGEM, colunas_usadas, converter_tipos, impressao_digital, ler_otimizado,
+    tabela_completa,
+)
+
+
+# ─── 1. FUNÇÕES UTIL ──────────────────────────────────────────────
+def beautify(col: str) -> str:
+    """Formata o nome de uma coluna para exibição"""
+    return " ".join(p.capitalize() for p in col.replace("\n", " ").lower().split())
+
+
+def beautify_column_header(col: str) -> str:
+    """Formata o cabeçalho de uma coluna com abreviações conhecidas"""
+    abreviacoes = {
+        "Número de Matrículas": "Matrículas",
+        "Nome do Município": "Município",
+        "Nome da Escola": "Escola",
+        "Etapa de Ensino": "Etapa",
+        "Cód. Município": "Cód. Mun.",
+        "Cód. da Escola": "Cód. Esc.",
+        "UF": "UF"
+    }
+
+    # Se a coluna está no dicionário, usar a abreviação
+    if col in abreviacoes:
+        return abreviacoes[col]
+
+    # Caso contrário, usar o comportamento da beautify original
+    return " ".join(p.capitalize() for p in col.replace("\n", " ").lower().split())
+
+
+def aplicar_padrao_numerico_brasileiro(num):
+    """Formata números no padrão brasileiro (1.234,56)"""
+    if pd.isna(num):
+        return "-"
+    n = float(num)
+    if n.is_integer():
+        return f"{int(n):,}".replace(",", ".")
+    inteiro, frac = str(f"{n:,.2f}").split('.')
+    return f"{inteiro.replace(',', '.')},{frac}"
+
+
+def format_number_br(num):
+    """Formata inteiros no padrão brasileiro (1.234)"""
+    try:
+        return f"{int(num):,}".replace(",", ".")
+    except:
+        return str(num)
+
+
+# ─── 1‑B. PAGINAÇÃO ───────────────────────────────────────────────
+class Paginator:
+    """Classe para gerenciar a paginação de DataFrames"""
+
+    def __init__(self, total, page_size=25, current=1):
+        # Limita o page_size a 10.000 se for maior
+        self.page_size = min(page_size, 10000)
+        self.total_pages = max(1, (total - 1) // self.page_size + 1)
+        self.current = max(1, min(current, self.total_pages))
+        self.start = (self.current - 1) * self.page_size
+        self.end = min(self.start + self.page_size, total)
+
+    def slice(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Retorna uma fatia do DataFrame correspondente à página atual"""
+        return df.iloc[self.start:self.end]
+
+    def indices(self, linhas: np.ndarray) -> np.ndarray:
+        """Retorna as posições de linha da página atual (sem tocar nos dados)"""
+        return linhas[self.start:self.end]
+
+
+def montar_linhas(df: pd.DataFrame, linhas: np.ndarray, colunas: list[str],
+                  constantes: dict | None = None) -> pd.DataFrame:
+    """Coleta as linhas pedidas do nível, já só com as colunas visíveis.
+
+    `constantes` são colunas de exibição com valor fixo (ex.: UF).
+    """
+    constantes = constantes or {}
+    resultado = df.iloc[
+        linhas, [df.columns.get_loc(c) for c in colunas if c not in constantes]
+    ].reset_index(drop=True)
+    for col, valor in constantes.items():
+        resultado.insert(colunas.index(col), col, valor)
+    return resultado
+
+
+def formatar_pagina(df_page: pd.DataFrame) -> pd.DataFrame:
+    """Aplica cabeçalhos abreviados à página.
+
+    Os números continuam numéricos (a grade ordena e alinha por valor); o
+    padrão brasileiro fica a cargo do column_config de quem exibe.
+    """
+    return df_page.rename(columns=beautify_column_header)
+
+
+def resumir_selecao(df_page: pd.DataFrame, linhas, colunas: list[str]) -> dict:
+    """Soma e estatísticas das células selecionadas na página, sem empilhar.
+
+    Cada coluna é tratada pelo dtype: as numéricas são lidas direto do array
+    NumPy; nas categóricas, cada categoria é convertida a número uma única
+    vez e as células saem dos códigos; texto só entra na contagem. O total
+    de células é linhas × colunas, e "distintos" conta os valores não nulos
+    diferentes (números e textos) entre todas as células.
+    """
+    linhas = np.asarray(linhas, dtype=np.intp)
+    numeros, textos = [], set()
+    for col in colunas:
+        s = df_page[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            codigos = s.cat.codes.to_numpy()[linhas]
+            por_categoria = pd.to_numeric(s.cat.categories, errors="coerce")
+            # O código -1 (nulo) aponta para o NaN acrescentado no fim
+            valores = np.append(np.asarray(por_categoria, dtype=np.float64), np.nan)[codigos]
+            texto = codigos[(codigos >= 0) & np.isnan(valores)]
+            textos.update(s.cat.categories[np.unique(texto)])
+        elif pd.api.types.is_numeric_dtype(s.dtype):
+            valores = s.iloc[linhas].to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            celulas = s.iloc[linhas]
+            valores = pd.to_numeric(celulas, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            textos.update(celulas[np.isnan(valores) & celulas.notna().to_numpy()])
+        numeros.append(valores)
+
+    validos = np.concatenate(numeros) if numeros else np.empty(0)
+    validos = validos[~np.isnan(validos)]
+    resumo = {
+        "celulas": len(linhas) * len(colunas),
+        "numericas": int(validos.size),
+        "distintos": int(np.unique(validos).size) + len(textos),
+        "soma": None, "media": None, "minimo": None, "maximo": None,
+    }
+    if validos.size:
+        soma = validos.sum()
+        resumo.update(soma=soma, media=soma / validos.size,
+                      minimo=validos.min(), maximo=validos.max())
+    return resumo
+
+
+# ─── 1‑C. MEDIÇÃO DAS ETAPAS ──────────────────────────────────────
+class PerfilEtapas:
+    """Registra tempo, linhas de entrada/saída e variação de RSS por etapa.
+
+    Os registros ficam num buffer circular (os mais recentes) e, se houver
+    `arquivo`, também são acrescentados em JSONL para análise offline. O
+    arquivo fica aberto (com buffer de linha) enquanto o perfil existir.
+    """
+
+    def __init__(self, capacidade: int = 500, arquivo: str | Path | None = None):
+        self.registros: deque[dict] = deque(maxlen=capacidade)
+        self.arquivo = Path(arquivo) if arquivo else None
+        self._saida = (open(self.arquivo, "a", encoding="utf-8", buffering=1)
+                       if self.arquivo is not None else None)
+        self._processo = psutil.Process(os.getpid())
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def medir(self, etapa: str, execucao: str = "", linhas_entrada: int | None = None):
+        """Mede o bloco; quem chama pode preencher registro["linhas_saida"]."""
+        registro = {
+            "etapa": etapa, "execucao": execucao, "inicio": time.time(),
+            "linhas_entrada": linhas_entrada, "linhas_saida": None,
+        }
+        rss_antes = self._processo.memory_info().rss
+        t0 = time.perf_counter()
+        try:
+            yield registro
+        finally:
+            registro["segundos"] = time.perf_counter() - t0
+            registro["rss_delta_mb"] = (self._processo.memory_info().rss - rss_antes) / 1024 ** 2
+            self._registrar(registro)
+
+    def _registrar(self, registro: dict) -> None:
+        # Serializa fora do lock; dentro dele, só o append e a escrita da linha
+        linha = (json.dumps(registro, ensure_ascii=False) + "\n"
+                 if self._saida is not None else None)
+        with self._lock:
+            self.registros.append(registro)
+            if linha is not None:
+                self._saida.write(linha)
+
+    def da_execucao(self, execucao: str) -> list[dict]:
+        """Registros de uma execução do script, na ordem em que ocorreram."""
+        with self._lock:
+            return [r for r in self.registros if r["execucao"] == execucao]
+
+
+# ─── 2. DEFINIÇÃO DE MODELO DE DADOS POR MODALIDADE ───────────────
+class ModalidadeConfig:
+    """Configuração específica de cada modalidade"""
+
+    def __init__(
+            self, arquivo: str,
+            etapa_valores: dict | None = None,
+            subetapa_valores: dict | None = None,
+            serie_col: str | None = None,
+            texto_ajuda: str | None = None,
+    ):
+        self.arquivo = arquivo
+        self.etapa_valores = etapa_valores or {}
+        self.subetapa_valores = subetapa_valores or {}
+        self.serie_col = serie_col
+        self.texto_ajuda = texto_ajuda
+
+
+# ─── 3. CONFIGURAÇÕES DE MODALIDADE ───────────────────────────────
+MODALIDADES: dict[str, ModalidadeConfig] = {
+    "Ensino Regular": ModalidadeConfig(
+        arquivo="Ensino Regular.parquet",
+        etapa_valores={"padrao": "Educação Infantil"},
+        serie_col="Ano/Série",
+        texto_ajuda=(
+            "No Ensino Regular, selecione primeiro a Etapa "
+            "(Infantil, Fundamental ou Médio), depois a Subetapa "
+            "e, se desejar, uma Série específica."
+        ),
+    ),
+    "EJA - Educação de Jovens e Adultos": ModalidadeConfig(
+        arquivo="EJA - Educação de Jovens e Adultos.parquet",
+        etapa_valores={
+            "padrao": "EJA - Total",
+            "totais": [
+                "EJA - Total",
+                "EJA Ensino Fundamental - Total",
+                "EJA Ensino Médio - Total",
+            ],
+        },
+        subetapa_valores={
+            "EJA Ensino Fundamental": [
+                "EJA Anos Iniciais",
+                "EJA Anos Finais",
+                "EJA Ensino Fundamental - Curso FIC",
+            ],
+            "EJA Ensino Médio": [
+                "EJA Ensino Médio - Sem componente profissionalizante",
+                "EJA Ensino Médio - Curso FIC",
+                "EJA Ensino Médio - Curso Técnico Integrado",
+            ],
+        },
+        texto_ajuda=(
+            "Selecione a Etapa (Total ou específica). "
+            "Para etapas específicas, escolha a Subetapa."
+        ),
+    ),
+    "Educação Profissional": ModalidadeConfig(
+        arquivo="Educação Profissional.parquet",
+        etapa_valores={
+            "padrao": "Educação Profissional - Total",
+            "totais": ["Educação Profissional - Total"],
+        },
+        texto_ajuda=(
+            "Na Educação Profissional, selecione a Etapa "
+            "(Total, FIC ou Técnico) e depois a Subetapa específica."
+        ),
+    ),
+}
+
+# Mapeamento comum (define apenas uma vez)
+nivel_map = {
+    "Escolas": "escola",
+    "Municípios": "município",
+    "Pernambuco": "estado"
+}
+
+# Mapeamento de modalidades para arquivos
+ARQ = {k: v.arquivo for k, v in MODALIDADES.items()}
+
+# Colunas de nome exibidas em cada nível (nos demais ficam fora da visão)
+NOMES_POR_NIVEL = {
+    "escola": ["Nome do Município", "Nome da Escola"],
+    "município": ["Nome do Município"],
+    "estado": [],
+}
+
+
+def plano_colunas(nivel: str, colunas: list[str]) -> list[str]:
+    """Colunas de `colunas` que um nível usa, na ordem de exibição.
+
+    É o mesmo conjunto para a tabela, os filtros e a exportação; o que fica
+    de fora (nomes de outros níveis, o próprio nível) não chega ao pandas.
+    """
+    series = [c for c in dict.fromkeys(m.serie_col for m in MODALIDADES.values()) if c]
+    ordem = ["Ano", *NOMES_POR_NIVEL.get(nivel, []), "Etapa", "Subetapa", *series,
+             "Rede", "Número de Matrículas"]
+    return [c for c in ordem if c in colunas]
+
+
+# ─── 4. FUNÇÃO DE CARREGAMENTO OTIMIZADA ──────────────────────────
+def _filtro_arrow(nivel: str | None = None,
+                  anos: tuple | None = None,
+                  redes: tuple | None = None) -> ds.Expression | None:
+    """Monta a expressão de filtro repassada ao leitor do Parquet (pushdown)."""
+    expr = None
+    for campo, valores in (
+            ("Nível de agregação", (nivel,) if nivel else None),
+            ("Ano", anos),
+            ("Rede", redes),
+    ):
+        if not valores:
+            continue
+        # OR de igualdades: o pyarrow consegue podar row groups pelas
+        # estatísticas min/max, o que não acontece com is_in
+        cond = reduce(operator.or_, (ds.field(campo) == v for v in valores))
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def _tipo_codigo(tamanho: int) -> pa.DataType:
+    """Mesma largura de código que o pandas usa em Categorical (int8/16/32)."""
+    return (pa.int8() if tamanho < 127
+            else pa.int16() if tamanho < 32767 else pa.int32())
+
+
+class DicionarioGlobal:
+    """Dicionários de texto do processo, compartilhados por modalidades e níveis.
+
+    Cada coluna tem uma lista de valores que só cresce: um valor recebe um
+    código na primeira vez que aparece e o mantém daí em diante, então o
+    mesmo município, escola ou rede tem o mesmo código em qualquer tabela
+    carregada. Os valores novos de cada carga entram em ordem alfabética.
+    """
+
+    def __init__(self):
+        self._valores: dict[str, pa.Array] = {}
+        self._dtypes: dict[tuple[str, int], pd.CategoricalDtype] = {}
+        self._lock = threading.Lock()
+
+    def codificar(self, col: str, arr: pa.ChunkedArray) -> pa.DictionaryArray:
+        """Codifica o texto pelos códigos globais, com índices do menor inteiro possível.
+
+        Se a coluna já vier como dicionário, só os dicionários locais (poucos
+        valores) são traduzidos; os índices são remapeados sem tocar no texto.
+        """
+        ja_codificado = pa.types.is_dictionary(arr.type)
+        if ja_codificado:
+            locais = [c.dictionary.cast(pa.string()) for c in arr.chunks]
+            distintos = pc.unique(pa.chunked_array(locais, pa.string()))
+        else:
+            arr = arr.combine_chunks().cast(pa.string())
+            distintos = pc.unique(arr.drop_null())
+
+        with self._lock:
+            valores = self._valores.get(col, pa.array([], pa.string()))
+            novos = distintos.filter(pc.invert(pc.is_in(distintos, value_set=valores)))
+            if len(novos):
+                valores = pa.concat_arrays([valores, novos.sort()])
+                self._valores[col] = valores
+
+        tipo = _tipo_codigo(len(valores))
+        if ja_codificado:
+            mapas = [pc.index_in(local, value_set=valores) for local in locais]
+            if (arr.num_chunks == 1 and arr.type.index_type == tipo
+                    and mapas[0].equals(pa.array(np.arange(len(mapas[0]), dtype=np.int32)))):
+                # Dicionário local é prefixo do global (ex.: cache ordenado
+                # carregado primeiro): os índices são usados como estão, sem cópia
+                return pa.DictionaryArray.from_arrays(arr.chunk(0).indices, valores)
+            indices = pa.chunked_array([
+                pc.take(mapa, c.indices) for mapa, c in zip(mapas, arr.chunks)
+            ], pa.int32()).combine_chunks()
+        else:
+            indices = pc.index_in(arr, value_set=valores)
+        return pa.DictionaryArray.from_arrays(indices.cast(tipo), valores)
+
+    def dtype(self, col: str, tamanho: int) -> pd.CategoricalDtype:
+        """CategoricalDtype dos `tamanho` primeiros valores da coluna (criado uma vez)."""
+        with self._lock:
+            chave = (col, tamanho)
+            if chave not in self._dtypes:
+                valores = self._valores[col].slice(0, tamanho)
+                self._dtypes[chave] = pd.CategoricalDtype(pd.Index(valores.to_pandas()))
+            return self._dtypes[chave]
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return (sum(v.nbytes for v in self._valores.values())
+                    + sum(d.categories.memory_usage(deep=True) for d in self._dtypes.values()))
+
+
+# Instância única do processo: todas as tabelas carregadas usam os mesmos códigos
+DICIONARIOS = DicionarioGlobal()
+
+
+def _ler_bruto(arquivo: str, nivel: str | None = None,
+               anos: tuple | None = None,
+               redes: tuple | None = None,
+               colunas: list[str] | None = None) -> pa.Table:
+    """Lê as colunas usadas do Parquet, com os predicados enviados ao leitor.
+
+    Os predicados de nível, ano e rede são enviados ao pyarrow como filtro
+    do dataset, de modo que row groups fora do filtro nem são decodificados.
+    """
+    # Carregamento do Parquet - apenas colunas e linhas necessárias
+    return ds.dataset(arquivo, format="parquet").to_table(
+        columns=colunas or colunas_usadas(arquivo),
+        filter=_filtro_arrow(nivel, anos, redes),
+    )
+
+
+def _codificar(tabela: pa.Table) -> pa.Table:
+    """Troca os dicionários de texto pelos códigos globais do processo."""
+    return pa.table({
+        col: DICIONARIOS.codificar(col, arr) if pa.types.is_dictionary(arr.type) else arr
+        for col, arr in zip(tabela.column_names, tabela.columns)
+    })
+
+
+def _normalizar(tabela: pa.Table) -> pa.Table:
+    """Converte as colunas para os dtypes compactos usados pelo dashboard."""
+    # Conversões de tipo ainda no Arrow, antes de chegar ao pandas
+    return _codificar(converter_tipos(tabela))
+
+
+def ler_parquet(arquivo: str, nivel: str | None = None,
+                anos: tuple | None = None,
+                redes: tuple | None = None) -> pa.Table:
+    """Lê o Parquet com dtypes compactos, já como tabela Arrow.
+
+    Havendo Parquet otimizado (preparar_dados.py otimizar), só os row groups
+    que o manifesto aponta como relevantes são lidos, já com os dtypes finais.
+    Com um nível definido, só as colunas do plano desse nível são lidas.
+    """
+    colunas = colunas_usadas(arquivo)
+    saida = plano_colunas(nivel, colunas) if nivel else colunas
+    filtros = {"Nível de agregação": (nivel,) if nivel else None, "Ano": anos, "Rede": redes}
+    # Colunas do filtro entram na leitura e saem depois de aplicado
+    otimizado = ler_otimizado(arquivo, filtros, list(dict.fromkeys(saida + list(filtros))))
+    if otimizado is not None:
+        expr = _filtro_arrow(nivel, anos, redes)
+        return _codificar((otimizado if expr is None else otimizado.filter(expr)).select(saida))
+    return _normalizar(_ler_bruto(arquivo, nivel, anos, redes, saida))
+
+
+# Cache Arrow IPC por modalidade, gravado na primeira carga
+SUFIXO_CACHE = ".cache.arrow"
+VERSAO_CACHE = b"3"  # incrementar quando converter_tipos ou o layout mudarem
+CHAVE_VERSAO = b"dashboard.versao_cache"
+CHAVE_ESTADO = b"dashboard.origem_mtime_tamanho"
+
+
+def caminho_cache(arquivo: str | Path) -> Path:
+    """Cache Arrow IPC (sem compressão), gravado ao lado do Parquet de origem."""
+    arquivo = Path(arquivo)
+    return arquivo.with_name(arquivo.name.removesuffix(".parquet") + SUFIXO_CACHE)
+
+
+def _estado_origem(arquivo: str | Path) -> bytes:
+    info = os.stat(arquivo)
+    return f"{info.st_mtime_ns}:{info.st_size}".encode()
+
+
+def _dicionario_ordenado(arr: pa.DictionaryArray) -> pa.DictionaryArray:
+    """Reordena o dicionário em ordem alfabética, com índices do menor inteiro."""
+    ordem = pc.array_sort_indices(arr.dictionary)
+    posicao = np.empty(len(ordem), dtype=np.int32)
+    posicao[ordem.to_numpy()] = np.arange(len(ordem), dtype=np.int32)
+    tipo = _tipo_codigo(len(ordem))
+    indices = pc.take(pa.array(posicao), arr.indices).cast(tipo)
+    return pa.DictionaryArray.from_arrays(indices, arr.dictionary.take(ordem))
+
+
+def _preparar_cache(tabela: pa.Table) -> pa.Table:
+    """Deixa a tabela no layout final de TabelaModalidade antes de gravá-la.
+
+    Um chunk por coluna, dicionários em ordem alfabética (os mesmos códigos
+    que o dicionário global atribui a valores novos) e linhas agrupadas por
+    nível. Lida do cache, a tabela passa por _codificar e TabelaModalidade
+    sem cópias quando o dicionário global ainda não conhece outros valores.
+    """
+    colunas = {}
+    for nome, col in zip(tabela.column_names, tabela.columns):
+        arr = col.combine_chunks()
+        colunas[nome] = _dicionario_ordenado(arr) if pa.types.is_dictionary(arr.type) else arr
+    tabela = pa.table(colunas)
+    codigos = tabela["Nível de agregação"].chunk(0).indices.to_numpy(zero_copy_only=False)
+    return tabela.take(np.argsort(codigos, kind="stable")).combine_chunks()
+
+
+def ler_cache_arrow(arquivo: str | Path) -> pa.Table | None:
+    """Tabela do cache, mapeada em memória; None se faltar ou estiver desatualizado.
+
+    As colunas apontam direto para as páginas do arquivo: nada é descomprimido
+    nem copiado para o heap, e processos no mesmo host compartilham o page
+    cache. Se mtime/tamanho da origem mudaram (ex.: novo checkout), o conteúdo
+    é conferido pelo SHA-256 antes de descartar o cache; se ele bate, o cache
+    é regravado com o novo mtime/tamanho, e as próximas cargas não recalculam
+    o hash.
+    """
+    destino = caminho_cache(arquivo)
+    if not destino.exists():
+        return None
+    try:
+        leitor = pa.ipc.open_file(pa.memory_map(str(destino)))
+    except (OSError, pa.ArrowInvalid):
+        return None
+    metadados = leitor.schema.metadata or {}
+    if metadados.get(CHAVE_VERSAO) != VERSAO_CACHE:
+        return None
+    if metadados.get(CHAVE_ESTADO) == _estado_origem(arquivo):
+        return leitor.read_all()
+    impressao = impressao_digital(arquivo)
+    if metadados.get(CHAVE_ORIGEM) != impressao.encode():
+        return None
+    tabela = leitor.read_all()
+    if gravar_cache_arrow(arquivo, tabela, impressao):
+        # Mapeia o cache regravado (o antigo some do disco ao ser liberado)
+        leitor = pa.ipc.open_file(pa.memory_map(str(destino)))
+        tabela = leitor.read_all()
+    return tabela
+
+
+def gravar_cache_arrow(arquivo: str | Path, tabela: pa.Table,
+                       impressao: str | None = None) -> bool:
+    """Grava o cache da modalidade; False se não foi possível.
+
+    O arquivo é escrito num temporário da mesma pasta e só então substitui o
+    cache, então outro processo nunca mapeia um arquivo pela metade. Pasta
+    só de leitura ou cache em uso apenas deixam a modalidade sem cache.
+    `impressao` evita recalcular o SHA-256 da origem quando já é conhecido.
+    """
+    destino = caminho_cache(arquivo)
+    tabela = tabela.replace_schema_metadata({
+        CHAVE_ORIGEM: impressao or impressao_digital(arquivo),
+        CHAVE_ESTADO: _estado_origem(arquivo),
+        CHAVE_VERSAO: VERSAO_CACHE,
+    })
+    temporario = None
+    try:
+        fd, temporario = tempfile.mkstemp(dir=destino.parent, prefix=destino.name, suffix=".tmp")
+        os.close(fd)
+        os.chmod(temporario, 0o644)  # mkstemp cria 0600; outros usuários do host também leem
+        with pa.OSFile(temporario, "wb") as f, pa.ipc.new_file(f, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+        os.replace(temporario, destino)
+        return True
+    except OSError:
+        if temporario:
+            Path(temporario).unlink(missing_ok=True)
+        return False
+
+
+def ler_modalidade(arquivo: str) -> pa.Table:
+    """Lê todos os níveis da modalidade.
+
+    Com cache Arrow IPC atualizado, a tabela é só mapeada em memória. Senão,
+    o Parquet otimizado, se estiver atualizado, já vem convertido e não passa
+    por nenhuma conversão; sem ele, havendo cubo atualizado (preparar_dados.py
+    cubos), o nível município sai do cubo e só as linhas de escola e de
+    estado vêm do Parquet. O resultado é gravado como cache para as próximas
+    cargas e para os outros processos.
+    """
+    tabela = ler_cache_arrow(arquivo)
+    if tabela is None:
+        otimizado = ler_otimizado(arquivo, colunas=colunas_usadas(arquivo))
+        tabela = _preparar_cache(otimizado if otimizado is not None
+                                 else converter_tipos(tabela_completa(arquivo)))
+        if gravar_cache_arrow(arquivo, tabela):
+            # Troca a cópia no heap pela versão mapeada, compartilhável
+            mapeada = ler_cache_arrow(arquivo)
+            tabela = tabela if mapeada is None else mapeada
+    return _codificar(tabela)
+
+
+class TabelaModalidade:
+    """Tabela Arrow única e imutável de uma modalidade.
+
+    As linhas ficam ordenadas por nível de agregação, então cada nível é uma
+    fatia contígua (sem cópia) da mesma tabela. A visão pandas de cada nível
+    reaproveita os buffers do Arrow e as categorias são criadas uma só vez.
+    """
+
+    def __init__(self, tabela: pa.Table):
+        niveis = tabela["Nível de agregação"].combine_chunks()
+        codigos = niveis.indices.to_numpy(zero_copy_only=False)
+        if np.all(codigos[:-1] <= codigos[1:]):
+            # Já agrupada por nível (ex.: vinda do cache Arrow): sem cópia
+            self.tabela = tabela.combine_chunks()
+        else:
+            ordem = np.argsort(codigos, kind="stable")
+            self.tabela = tabela.take(ordem).combine_chunks()
+
+        # Faixa [início, fim) de cada nível na tabela ordenada
+        contagem = np.bincount(codigos, minlength=len(niveis.dictionary))
+        fins = np.cumsum(contagem)
+        self.faixas = {
+            nivel: (int(fim - n), int(fim))
+            for nivel, n, fim in zip(niveis.dictionary.to_pylist(), contagem, fins)
+        }
+
+        # CategoricalDtype do dicionário global, criado na primeira visão que
+        # usa a coluna: o mesmo objeto para todos os níveis e modalidades
+        self._dtypes: dict[str, pd.CategoricalDtype] = {}
+        self._quadros: dict[str, pd.DataFrame] = {}
+        self._derivados: dict[tuple, object] = {}
+        self._bytes_copiados = 0
+        self._lock = threading.Lock()
+
+    def fatia(self, nivel: str) -> pa.Table:
+        """Retorna as linhas de um nível como fatia da tabela (sem cópia)."""
+        inicio, fim = self.faixas.get(nivel, (0, 0))
+        return self.tabela.slice(inicio, fim - inicio)
+
+    def nivel(self, nivel: str) -> pd.DataFrame:
+        """Retorna a visão pandas de um nível, criada na primeira chamada.
+
+        Só as colunas do plano do nível entram (ex.: Pernambuco não tem
+        nomes de município nem de escola).
+        """
+        with self._lock:
+            if nivel not in self._quadros:
+                fatia = self.fatia(nivel)
+                fatia = fatia.select(plano_colunas(nivel, fatia.column_names))
+                self._quadros[nivel] = self._para_pandas(fatia)
+            return self._quadros[nivel]
+
+    def _derivado(self, classe: type, nivel: str, *args):
+        """Estrutura derivada da visão de um nível, criada uma única vez."""
+        df = self.nivel(nivel)
+        chave = (classe.__name__, nivel, *args)
+        with self._lock:
+            if chave not in self._derivados:
+                self._derivados[chave] = classe(df, *args)
+            return self._derivados[chave]
+
+    def opcoes(self, nivel: str, serie_col: str | None = None) -> "IndiceOpcoes":
+        """Retorna o índice de opções dos filtros de um nível."""
+        return self._derivado(IndiceOpcoes, nivel, serie_col)
+
+    def motor(self, nivel: str, serie_col: str | None = None) -> "MotorFiltro":
+        """Retorna o motor de filtro por códigos de um nível."""
+        return self._derivado(MotorFiltro, nivel, serie_col)
+
+    def indice_texto(self, nivel: str) -> "IndiceTexto":
+        """Retorna o índice de busca textual das colunas de um nível."""
+        return self._derivado(IndiceTexto, nivel)
+
+    def _para_pandas(self, fatia: pa.Table) -> pd.DataFrame:
+        """Monta o DataFrame apontando para os buffers do Arrow sempre que possível."""
+        dados = {}
+        for nome, col in zip(fatia.column_names, fatia.columns):
+            # Fatia de tabela já consolidada tem um único chunk: sem cópia
+            arr = col.chunk(0) if col.num_chunks == 1 else col.combine_chunks()
+            if pa.types.is_dictionary(arr.type):
+                codigos = arr.indices
+                if codigos.null_count:
+                    # Nulo vira -1 (NaN no Categorical): exige cópia
+                    codigos = pc.fill_null(codigos, -1)
+                    self._bytes_copiados += codigos.nbytes
+                if nome not in self._dtypes:
+                    self._dtypes[nome] = DICIONARIOS.dtype(nome, len(arr.dictionary))
+                dados[nome] = pd.Categorical.from_codes(
+                    codigos.to_numpy(zero_copy_only=False),
+                    dtype=self._dtypes[nome], validate=False,
+                )
+            else:
+                if arr.null_count:
+                    self._bytes_copiados += arr.nbytes
+                dados[nome] = arr.to_numpy(zero_copy_only=False)
+        return pd.DataFrame(dados, copy=False)
+
+    @property
+    def nbytes(self) -> int:
+        """Memória própria: buffers Arrow + cópias feitas nas visões pandas.
+
+        Os dicionários de texto são globais e contados em DICIONARIOS.nbytes.
+        """
+        buffers = sum(
+            c.indices.get_total_buffer_size() if pa.types.is_dictionary(c.type)
+            else c.get_total_buffer_size()
+            for col in self.tabela.columns for c in col.chunks
+        )
+        return buffers + self._bytes_copiados
+
+
+# ─── 4‑B. ÍNDICE DE OPÇÕES DOS FILTROS ────────────────────────────
+class IndiceOpcoes:
+    """Opções de Ano, Rede e da hierarquia Etapa → Subetapa → Série de um nível.
+
+    É montado uma vez por nível a partir dos códigos das categorias, e as
+    listas dos filtros saem dele sem percorrer o DataFrame a cada rerun.
+    """
+
+    def __init__(self, df: pd.DataFrame, serie_col: str | None = None):
+        self.anos = sorted((int(a) for a in pd.unique(df["Ano"])), reverse=True)
+        self.redes = self._presentes(df["Rede"])
+        self.etapas = self._presentes(df["Etapa"])
+        self.serie_col = serie_col if serie_col in df.columns else None
+
+        # Hierarquia {etapa: {subetapa: [séries]}} com as combinações existentes
+        cols = ["Etapa", "Subetapa"] + ([self.serie_col] if self.serie_col else [])
+        cats = [df[c].cat.categories for c in cols]
+
+        # Cada combinação de códigos vira uma chave inteira única (+1 para o -1 dos nulos)
+        chave = np.zeros(len(df), dtype=np.int64)
+        for c, cat in zip(cols, cats):
+            chave = chave * (len(cat) + 1) + (df[c].array.codes.astype(np.int64) + 1)
+
+        self.hierarquia: dict[str, dict[str, list[str]]] = {}
+        for k in np.unique(chave):
+            linha = []
+            for cat in reversed(cats):
+                k, codigo = divmod(int(k), len(cat) + 1)
+                linha.insert(0, codigo - 1)
+            if linha[0] < 0 or linha[1] < 0:
+                continue
+            subs = self.hierarquia.setdefault(cats[0][linha[0]], {})
+            series = subs.setdefault(cats[1][linha[1]], [])
+            if self.serie_col and linha[2] >= 0:
+                series.append(cats[2][linha[2]])
+
+    @staticmethod
+    def _presentes(s: pd.Series) -> list[str]:
+        """Categorias que de fato aparecem na coluna, em ordem alfabética."""
+        codigos = np.unique(s.array.codes)
+        # Os códigos globais seguem a ordem de chegada, não a alfabética
+        return sorted(s.cat.categories[c] for c in codigos if c >= 0)
+
+    def subetapas(self, etapas: list[str]) -> list[str]:
+        """Subetapas (exceto totais) existentes para as etapas escolhidas."""
+        return sorted({
+            sub for etapa in etapas for sub in self.hierarquia.get(etapa, {})
+            if "Total" not in sub
+        })
+
+    def series(self, etapas: list[str], subetapas: list[str]) -> list[str]:
+        """Séries existentes para as combinações de etapa e subetapa escolhidas."""
+        return sorted({
+            serie for etapa in etapas for sub in subetapas
+            for serie in self.hierarquia.get(etapa, {}).get(sub, [])
+        })
+
+
+# ─── 5. FUNÇÃO DE FILTRO UNIFICADA ────────────────────────────────
+class MotorFiltro:
+    """Filtra um nível combinando máscaras sobre os códigos das categorias.
+
+    Cada filtro vira uma tabela de consulta booleana (uma posição por
+    categoria) indexada pelos códigos das linhas, e as máscaras são
+    combinadas com AND sem copiar o DataFrame.
+    """
+
+    def __init__(self, df: pd.DataFrame, serie_col: str | None = None):
+        self.n = len(df)
+        self.serie_col = serie_col if serie_col in df.columns else None
+        self._colunas: dict[str, tuple[np.ndarray, pd.Index]] = {}
+        for col in ("Ano", "Rede", "Etapa", "Subetapa", self.serie_col):
+            if col is None or col not in df.columns:
+                continue
+            s = df[col]
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                self._colunas[col] = (s.array.codes, s.cat.categories)
+            else:
+                codigos, valores = pd.factorize(s, sort=True)
+                self._colunas[col] = (codigos, pd.Index(valores))
+
+        # Subetapas de total ("... - Total"), usadas no Ensino Regular
+        _, cats = self._colunas["Subetapa"]
+        self._lut_total = np.append(cats.str.contains("Total", regex=False), False)
+
+    def mascara(self, col: str, valores) -> np.ndarray:
+        """Máscara booleana das linhas cujo valor em `col` está em `valores`."""
+        codigos, cats = self._colunas[col]
+        # Posição extra no fim: o código -1 (nulo) cai nela e nunca casa
+        lut = np.zeros(len(cats) + 1, dtype=bool)
+        pos = cats.get_indexer(list(valores))
+        lut[pos[pos >= 0]] = True
+        return lut[codigos]
+
+    def mascara_total(self) -> np.ndarray:
+        """Máscara das linhas cuja Subetapa é um total."""
+        return self._lut_total[self._colunas["Subetapa"][0]]
+
+
+def filtrar_indices(motor: MotorFiltro, modalidade_key, anos, redes, filtros) -> np.ndarray:
+    """Posições (no DataFrame do nível) das linhas que passam nos filtros."""
+    config = MODALIDADES[modalidade_key]
+    totais = config.etapa_valores.get("totais", [])
+
+    etapa_sel = filtros.get("etapa", [])
+    subetapa_sel = filtros.get("subetapa", [])
+    serie_sel = filtros.get("serie", [])
+    is_etapa_total = any(e in totais for e in etapa_sel)
+
+    # Filtros básicos (comuns a todas as modalidades)
+    mask = motor.mascara("Ano", anos)
+
+    if redes:
+        mask &= motor.mascara("Rede", redes)
+
+    # Etapa / Subetapa / Série: mesma regra para EJA, Profissional e Regular
+    if etapa_sel:
+        mask &= motor.mascara("Etapa", etapa_sel)
+
+        # Ensino Regular sem subetapa escolhida: apenas as linhas de total
+        if modalidade_key == "Ensino Regular" and not is_etapa_total and not subetapa_sel:
+            mask &= motor.mascara_total()
+
+        # Subetapa (só aplicar se não for total)
+        if subetapa_sel and not is_etapa_total:
+            mask &= motor.mascara("Subetapa", subetapa_sel)
+
+        # Série - apenas para Ensino Regular e se não for total
+        if (
+                serie_sel
+                and modalidade_key == "Ensino Regular"
+                and not is_etapa_total
+                and not any("Total" in sub for sub in subetapa_sel)
+                and motor.serie_col
+        ):
+            mask &= motor.mascara(motor.serie_col, serie_sel)
+
+    # int32 basta para as posições e ocupa metade do espaço no cache
+    return np.flatnonzero(mask).astype(np.int32)
+
+
+def filtrar_dados(df, modalidade_key, anos, redes, filtros, motor: MotorFiltro | None = None):
+    """Filtra dados de forma unificada para qualquer modalidade"""
+    if motor is None:
+        serie_col = MODALIDADES[modalidade_key].serie_col
+        motor = MotorFiltro(df, serie_col)
+
+    # As linhas são materializadas uma única vez, no final
+    return df.iloc[filtrar_indices(motor, modalidade_key, anos, redes, filtros)]
+
+
+# ─── 5‑B. CACHE DE RESULTADOS DE FILTRO ───────────────────────────
+class CacheFiltros:
+    """Cache LRU dos índices filtrados, limitado pelo total de bytes.
+
+    A chave é a modalidade, o nível e a forma canônica dos filtros, então
+    trocar de página ou selecionar linhas reaproveita o resultado.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self._itens: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = self.falhas = 0
+
+    @staticmethod
+    def chave(arquivo: str, nivel: str, anos, redes, filtros: dict) -> tuple:
+        """Forma canônica (ordenada e sem repetições) do estado dos filtros."""
+        def norm(valores):
+            return tuple(sorted(set(valores), key=str))
+
+        return (
+            arquivo, nivel, norm(anos), norm(redes),
+            tuple(sorted((k, norm(v)) for k, v in filtros.items())),
+        )
+
+    def obter(self, chave: tuple, calcular) -> np.ndarray:
+        """Retorna o índice em cache ou o calcula, descartando os mais antigos."""
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+            self.falhas += 1
+
+        idx = calcular()
+        idx.setflags(write=False)
+
+        with self._lock:
+            if chave not in self._itens:
+                self._itens[chave] = idx
+                self._bytes += idx.nbytes
+            # Sempre mantém ao menos o resultado mais recente
+            while self._bytes > self.max_bytes and len(self._itens) > 1:
+                _, antigo = self._itens.popitem(last=False)
+                self._bytes -= antigo.nbytes
+        return idx
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+
+# ─── 5‑C. ÍNDICE DE BUSCA TEXTUAL ─────────────────────────────────
+def normalizar_busca(texto: str) -> str:
+    """Minúsculas e sem acentos, para comparar textos na busca."""
+    decomposto = unicodedata.normalize("NFKD", str(texto).casefold())
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+class IndiceTexto:
+    """Busca por substring nos valores distintos de cada coluna de um nível.
+
+    Para cada coluna guarda os códigos das linhas, os valores distintos
+    normalizados (minúsculas, sem acento) e um índice de trigramas. A busca
+    casa o texto contra os valores distintos e chega às linhas pelos códigos,
+    sem converter a coluna inteira para texto.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+        self._colunas: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def tem(self, col: str) -> bool:
+        return col in self._df.columns
+
+    def _coluna(self, col: str) -> tuple:
+        """Entrada do índice de uma coluna, montada na primeira busca."""
+        with self._lock:
+            if col not in self._colunas:
+                self._colunas[col] = self._indexar(self._df[col])
+            return self._colunas[col]
+
+    @staticmethod
+    def _indexar(s: pd.Series) -> tuple:
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            codigos, valores = s.array.codes, s.cat.categories
+        else:
+            codigos, valores = pd.factorize(s)
+        chaves = [normalizar_busca(v) for v in valores]
+
+        trigramas: dict[str, list[int]] = {}
+        for i, chave in enumerate(chaves):
+            for g in {chave[j:j + 3] for j in range(len(chave) - 2)}:
+                trigramas.setdefault(g, []).append(i)
+        trigramas = {g: np.array(p, dtype=np.int32) for g, p in trigramas.items()}
+        return codigos, np.asarray(valores), chaves, trigramas
+
+    @staticmethod
+    def _valores_que_casam(entrada: tuple, consulta: str, numerica: bool) -> np.ndarray:
+        """Tabela booleana (uma posição por valor distinto + nulo) dos que casam."""
+        _, valores, chaves, trigramas = entrada
+        lut = np.zeros(len(chaves) + 1, dtype=bool)
+
+        v = consulta.replace(",", ".")
+        if numerica and re.fullmatch(r"-?\d+(\.\d+)?", v):
+            # Filtro exato para números
+            lut[:-1] = valores == float(v)
+            return lut
+
+        q = normalizar_busca(consulta)
+        if len(q) >= 3:
+            # Candidatos: valores que contêm todos os trigramas da consulta
+            candidatos = None
+            for g in {q[j:j + 3] for j in range(len(q) - 2)}:
+                postagens = trigramas.get(g)
+                if postagens is None:
+                    return lut
+                candidatos = (postagens if candidatos is None
+                              else np.intersect1d(candidatos, postagens, assume_unique=True))
+        else:
+            candidatos = range(len(chaves))
+        for i in candidatos:
+            if q in chaves[i]:
+                lut[i] = True
+        return lut
+
+    def mascara(self, col: str, consulta: str, linhas: np.ndarray) -> np.ndarray:
+        """Máscara, sobre as posições `linhas` do nível, das que casam com a busca."""
+        entrada = self._coluna(col)
+        s = self._df[col]
+        numerica = col.startswith("Número de") or pd.api.types.is_numeric_dtype(s)
+        return self._valores_que_casam(entrada, consulta, numerica)[entrada[0][linhas]]
+
+    @classmethod
+    def mascara_serie(cls, s: pd.Series, consulta: str) -> np.ndarray:
+        """Mesma busca para uma coluna avulsa (fora do nível indexado)."""
+        numerica = s.name.startswith("Número de") or pd.api.types.is_numeric_dtype(s)
+        entrada = cls._indexar(s)
+        return cls._valores_que_casam(entrada, consulta, numerica)[entrada[0]]
+
+
+def filtrar_texto(indice: IndiceTexto, linhas: np.ndarray, filtros: dict,
+                  colunas_fixas: dict) -> np.ndarray:
+    """Posições de `linhas` que casam com todos os filtros de texto ativos."""
+    mask = np.ones(len(linhas), dtype=bool)
+    for col, val in filtros.items():
+        if col in colunas_fixas:
+            # Coluna de valor fixo: basta testar o próprio valor
+            mask &= IndiceTexto.mascara_serie(
+                pd.Series([colunas_fixas[col]], name=col), val
+            )[0]
+        else:
+            mask &= indice.mascara(col, val, linhas)
+    return linhas[mask]
+
+
+# ─── 5‑D. PRÉ-AQUECIMENTO EM SEGUNDO PLANO ────────────────────────
+def combinacoes_preaquecimento(config: str = "*") -> list[tuple[str, str]]:
+    """Combinações (modalidade, nível da interface) a pré-carregar.
+
+    `config` é uma lista separada por ";" de itens "modalidade[:nível]",
+    em que a modalidade pode ser "*" (todas) e, sem nível, valem todos.
+    Exemplos: "*" (tudo), "Ensino Regular", "*:Municípios;*:Pernambuco".
+    Vazio, "0" ou "nenhum" desativa o pré-aquecimento. Modalidades sem o
+    arquivo Parquet no disco ficam de fora (não há o que pré-carregar).
+    """
+    config = config.strip()
+    if config.lower() in ("", "0", "nenhum"):
+        return []
+    pedidas = set()
+    for item in filter(None, (i.strip() for i in config.split(";"))):
+        modalidade, _, nivel = (p.strip() for p in item.partition(":"))
+        if modalidade != "*" and modalidade not in MODALIDADES:
+            raise ValueError(f"Modalidade desconhecida no pré-aquecimento: {modalidade!r}")
+        if nivel and nivel not in nivel_map:
+            raise ValueError(f"Nível desconhecido no pré-aquecimento: {nivel!r}")
+        pedidas.update(
+            (m, n) for m in MODALIDADES for n in nivel_map
+            if modalidade in ("*", m) and nivel in ("", n)
+        )
+    # Ordem estável: nível por nível, para que cada modalidade comece cedo
+    return [(m, n) for n in nivel_map for m in MODALIDADES
+            if (m, n) in pedidas and Path(ARQ[m]).exists()]
+
+
+class Preaquecimento:
+    """Executa tarefas de carga num pool de threads, sem bloquear o app.
+
+    Cada tarefa é um par (descrição, função). O progresso fica em
+    `concluidas`/`total`, a tarefa em andamento em `andamento` e as falhas
+    em `erros`, para a interface mostrar enquanto a primeira página é servida.
+    `ignoradas` lista o que ficou de fora (ex.: modalidade sem arquivo).
+    """
+
+    def __init__(self, tarefas: list[tuple], max_threads: int = 2,
+                 ignoradas: list[str] | None = None):
+        self.total = len(tarefas)
+        self.ignoradas = ignoradas or []
+        self.concluidas = 0
+        self.andamento: set[str] = set()
+        self.erros: dict[str, str] = {}
+        self.inicio = time.perf_counter()
+        self.segundos: float | None = None if tarefas else 0.0
+        self._lock = threading.Lock()
+        executor = ThreadPoolExecutor(max_workers=max_threads,
+                                      thread_name_prefix="preaquecimento")
+        for descricao, funcao in tarefas:
+            executor.submit(self._executar, descricao, funcao)
+        # Não espera: as threads terminam sozinhas quando a fila esvazia
+        executor.shutdown(wait=False)
+
+    def _executar(self, descricao: str, funcao) -> None:
+        with self._lock:
+            self.andamento.add(descricao)
+        try:
+            funcao()
+        except Exception as e:
+            with self._lock:
+                self.erros[descricao] = str(e)
+        finally:
+            with self._lock:
+                self.andamento.discard(descricao)
+                self.concluidas += 1
+                if self.concluidas == self.total:
+                    self.segundos = time.perf_counter() - self.inicio
+
+    @property
+    def terminado(self) -> bool:
+        return self.concluidas >= self.total
+
+
+# ─── 6. EXPORTAÇÃO ────────────────────────────────────────────────
+# Linhas de uma planilha do Excel, contando a do cabeçalho
+LIMITE_LINHAS_XLSX = 1_048_576
+
+
+def _lotes_arrow(df: pd.DataFrame, tamanho_lote: int = 50_000):
+    """Converte o DataFrame em RecordBatches, um pedaço de cada vez."""
+    for inicio in range(0, max(len(df), 1), tamanho_lote):
+        lote = pa.RecordBatch.from_pandas(
+            df.iloc[inicio:inicio + tamanho_lote], preserve_index=False
+        )
+        # Categorias voltam a ser texto simples para o escritor de CSV
+        yield pa.RecordBatch.from_arrays(
+            [c.dictionary_decode() if pa.types.is_dictionary(c.type) else c
+             for c in lote.columns],
+            names=lote.schema.names,
+        )
+
+
+def gerar_csv(df, arquivo=None, progresso=None):
+    """Prepara os dados para download em formato CSV
+
+    O arquivo é escrito em lotes num temporário em disco pelo escritor de CSV
+    do pyarrow, sem montar o texto inteiro em memória. `progresso`, se
+    informado, recebe o total de linhas já gravadas após cada lote.
+    """
+    if arquivo is None:
+        arquivo = tempfile.TemporaryFile(buffering=0)
+    escritor, gravadas = None, 0
+    for lote in _lotes_arrow(df):
+        if escritor is None:
+            escritor = pacsv.CSVWriter(
+                arquivo, lote.schema,
+                write_options=pacsv.WriteOptions(quoting_style="needed"),
+            )
+        escritor.write_batch(lote)
+        gravadas += lote.num_rows
+        if progresso:
+            progresso(gravadas)
+    escritor.close()
+    arquivo.seek(0)
+    return arquivo
+
+
+def _largura_coluna(s: pd.Series, amostra: int = 1000) -> int:
+    """Largura (em caracteres) de uma coluna sem percorrê-la inteira."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # Basta olhar o dicionário de categorias
+        valores = s.cat.categories
+    elif pd.api.types.is_numeric_dtype(s):
+        valores = [s.min(), s.max()] if len(s) else []
+    else:
+        valores = s.iloc[:amostra].dropna()
+    return max((len(str(v)) for v in valores), default=0)
+
+
+def gerar_xlsx(df, arquivo=None, progresso=None):
+    """Prepara os dados para download em formato Excel
+
+    Usa o modo constant_memory do xlsxwriter, que grava cada linha em disco
+    assim que ela é escrita; os valores saem dos buffers Arrow em lotes.
+    `arquivo` permite gravar num destino já aberto (ex.: processo trabalhador)
+    e `progresso` recebe o total de linhas gravadas após cada lote.
+
+    O xlsxwriter não levanta erro ao passar do limite de linhas do Excel (só
+    devolve um código negativo), então seleções maiores são recusadas antes.
+    """
+    if len(df) + 1 > LIMITE_LINHAS_XLSX:
+        raise ValueError(
+            f"{format_number_br(len(df))} linhas excedem o limite do Excel "
+            f"({format_number_br(LIMITE_LINHAS_XLSX - 1)}); use CSV, Parquet ou Arrow"
+        )
+    if arquivo is None:
+        arquivo = tempfile.TemporaryFile(buffering=0)
+    book = xlsxwriter.Workbook(arquivo, {"constant_memory": True})
+    worksheet = book.add_worksheet("Dados")
+    header_format = book.add_format({
+        'bold': True,
+        'bg_color': '#FFDFBA',
+        'border': 1,
+        'align': 'center',
+        'valign': 'vcenter'
+    })
+    # Separador de milhar exibido conforme o idioma do Excel (1.234 em pt-BR)
+    numero_format = book.add_format({'num_format': '#,##0'})
+
+    for i, col in enumerate(df.columns):
+        max_len = max(_largura_coluna(df[col]), len(str(col))) + 2
+        fmt = numero_format if col.startswith("Número de") else None
+        worksheet.set_column(i, i, max_len, fmt)
+        worksheet.write_string(0, i, str(col), header_format)
+
+    # Escritor específico por coluna, escolhido uma única vez
+    escritores = [
+        worksheet.write_number if pd.api.types.is_numeric_dtype(df[col])
+        else worksheet.write_string
+        for col in df.columns
+    ]
+
+    linha = 1
+    for lote in _lotes_arrow(df):
+        for valores in zip(*(c.to_pylist() for c in lote.columns)):
+            for i, v in enumerate(valores):
+                # Nulos (e NaN) ficam como célula vazia
+                if v is not None and v == v and escritores[i](linha, i, v) < 0:
+                    raise ValueError(
+                        f"Célula não gravada no XLSX (linha {linha + 1}, "
+                        f"coluna {df.columns[i]!r})"
+                    )
+            linha += 1
+        if progresso:
+            progresso(linha - 1)
+
+    book.close()
+    arquivo.seek(0)
+    return arquivo
+
+
+def _tabela_colunar(df: pd.DataFrame) -> pa.Table:
+    """Tabela Arrow da seleção, mantendo os tipos e a codificação por dicionário.
+
+    As categorias usam o dicionário global da coluna; só os valores presentes
+    na seleção vão para o arquivo (remapeamento de códigos, sem formatar texto).
+    """
+    colunas = {
+        col: (s.cat.remove_unused_categories()
+              if isinstance(s.dtype, pd.CategoricalDtype) else s)
+        for col, s in df.items()
+    }
+    return pa.Table.from_pandas(pd.DataFrame(colunas, copy=False), preserve_index=False)
+
+
+def _gravar_em_lotes(tabela: pa.Table, escrever, progresso, tamanho_lote: int) -> None:
+    for inicio in range(0, tabela.num_rows, tamanho_lote):
+        escrever(tabela.slice(inicio, tamanho_lote))
+        if progresso:
+            progresso(min(inicio + tamanho_lote, tabela.num_rows))
+
+
+def gerar_parquet(df, arquivo=None, progresso=None, tamanho_lote: int = 100_000):
+    """Prepara os dados para download em Parquet (zstd, com dicionário)
+
+    Tipos preservados (Ano e matrículas inteiros, textos como dicionário),
+    um grupo de linhas por lote.
+    """
+    if arquivo is None:
+        arquivo = tempfile.TemporaryFile(buffering=0)
+    tabela = _tabela_colunar(df)
+    with pq.ParquetWriter(arquivo, tabela.schema, compression="zstd",
+                          use_dictionary=True) as escritor:
+        _gravar_em_lotes(tabela, escritor.write_table, progresso, tamanho_lote)
+    arquivo.seek(0)
+    return arquivo
+
+
+def gerar_arrow(df, arquivo=None, progresso=None, tamanho_lote: int = 100_000):
+    """Prepara os dados para download em Arrow IPC (formato de arquivo, zstd)
+
+    Lido direto por pyarrow/pandas/polars sem conversão de tipos; os
+    dicionários são os mesmos em todos os lotes, como o formato exige.
+    """
+    if arquivo is None:
+        arquivo = tempfile.TemporaryFile(buffering=0)
+    tabela = _tabela_colunar(df)
+    with pa.ipc.new_file(arquivo, tabela.schema,
+                         options=pa.ipc.IpcWriteOptions(compression="zstd")) as escritor:
+        _gravar_em_lotes(tabela, escritor.write_table, progresso, tamanho_lote)
+    arquivo.seek(0)
+    return arquivo
+
+
+# ─── 6‑B. FILA DE EXPORTAÇÕES EM SEGUNDO PLANO ───────────────────
+class ExportacaoCancelada(Exception):
+    """Levantada dentro da geração quando o trabalho é cancelado."""
+
+
+def chave_exportacao(arquivo: str, formato: str, *partes) -> str:
+    """Impressão digital de uma exportação: origem, seleção e formato.
+
+    Inclui o estado do arquivo de origem (mtime e tamanho), então dados
+    regravados geram outra chave e o artefato antigo expira sozinho.
+    """
+    h = hashlib.sha256(_estado_origem(arquivo))
+    h.update(repr((str(arquivo), formato, partes)).encode())
+    return h.hexdigest()[:32]
+
+
+class CacheExportacoes:
+    """Artefatos prontos em disco, por chave, com limite total de bytes (LRU).
+
+    Cada artefato é o arquivo `<chave>.<formato>` na pasta. Os já existentes
+    são reaproveitados ao reiniciar o processo; ao passar do limite, saem
+    os usados há mais tempo.
+    """
+
+    def __init__(self, pasta: str | Path, max_bytes: int = 512 * 1024 ** 2):
+        self.pasta = Path(pasta)
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._itens: OrderedDict[str, tuple[Path, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        existentes = sorted(
+            (e for e in os.scandir(self.pasta)
+             if e.is_file() and not e.name.startswith(".")),
+            key=lambda e: e.stat().st_mtime,
+        )
+        for entrada in existentes:
+            chave = entrada.name.partition(".")[0]
+            self._itens[chave] = (Path(entrada.path), entrada.stat().st_size)
+            self._bytes += entrada.stat().st_size
+        self._podar()
+
+    def obter(self, chave: str) -> Path | None:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            if not item[0].exists():
+                # Removido por fora (ex.: limpeza do /tmp)
+                del self._itens[chave]
+                self._bytes -= item[1]
+                return None
+            self._itens.move_to_end(chave)
+            return item[0]
+
+    def temporario(self, formato: str) -> Path:
+        """Arquivo temporário na própria pasta (o os.replace final é atômico)."""
+        fd, caminho = tempfile.mkstemp(prefix=".gerando-", suffix=f".{formato}", dir=self.pasta)
+        os.close(fd)
+        return Path(caminho)
+
+    def guardar(self, chave: str, formato: str, temporario: Path) -> Path:
+        destino = self.pasta / f"{chave}.{formato}"
+        os.replace(temporario, destino)
+        tamanho = destino.stat().st_size
+        with self._lock:
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._itens[chave] = (destino, tamanho)
+            self._bytes += tamanho
+            self._podar(manter=chave)
+        return destino
+
+    def _podar(self, manter: str | None = None) -> None:
+        while self._bytes > self.max_bytes and len(self._itens) > (manter is not None):
+            chave = next(iter(self._itens))
+            if chave == manter:
+                self._itens.move_to_end(chave)
+                continue
+            caminho, tamanho = self._itens.pop(chave)
+            caminho.unlink(missing_ok=True)
+            self._bytes -= tamanho
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+
+class TrabalhoExportacao:
+    """Uma exportação na fila: estado, progresso e artefato pronto."""
+
+    def __init__(self, chave: str, formato: str, total: int):
+        self.chave = chave
+        self.formato = formato
+        self.total = total
+        self.gravadas = 0
+        self.estado = "na fila"  # na fila → gerando → pronto | cancelado | erro
+        self.erro: str | None = None
+        self.caminho: Path | None = None
+        self.segundos: float | None = None
+        self.do_cache = False
+        self.interessados = 1
+        self._cancelar = threading.Event()
+        self._futuro = None
+
+    @property
+    def ativo(self) -> bool:
+        return self.estado in ("na fila", "gerando")
+
+    @property
+    def fracao(self) -> float:
+        return min(self.gravadas / self.total, 1.0) if self.total else 0.0
+
+    def _progresso(self, gravadas: int) -> None:
+        if self._cancelar.is_set():
+            raise ExportacaoCancelada()
+        self.gravadas = gravadas
+
+
+class FilaExportacao:
+    """Gera exportações num pool de threads, fora do rerun do app.
+
+    Uma seleção já exportada sai direto do CacheExportacoes; pedidos iguais
+    em andamento (ex.: duas sessões com o mesmo filtro) viram um só trabalho,
+    que só é cancelado quando todos os interessados desistem.
+    """
+
+    def __init__(self, cache: CacheExportacoes, max_threads: int = 1):
+        self.cache = cache
+        self._ativos: dict[str, TrabalhoExportacao] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_threads,
+                                            thread_name_prefix="exportacao")
+
+    def enviar(self, chave: str, formato: str, total: int, gerar) -> TrabalhoExportacao:
+        """Enfileira `gerar(arquivo, progresso)`, salvo se já houver artefato ou trabalho."""
+        with self._lock:
+            pronto = self.cache.obter(chave)
+            if pronto is not None:
+                trabalho = TrabalhoExportacao(chave, formato, total)
+                trabalho.estado, trabalho.caminho = "pronto", pronto
+                trabalho.gravadas, trabalho.segundos = total, 0.0
+                trabalho.do_cache = True
+                return trabalho
+            trabalho = self._ativos.get(chave)
+            if trabalho is not None:
+                trabalho.interessados += 1
+                return trabalho
+            trabalho = TrabalhoExportacao(chave, formato, total)
+            self._ativos[chave] = trabalho
+            trabalho._futuro = self._executor.submit(self._executar, trabalho, gerar)
+            return trabalho
+
+    def cancelar(self, trabalho: TrabalhoExportacao) -> None:
+        with self._lock:
+            if not trabalho.ativo:
+                return
+            trabalho.interessados -= 1
+            if trabalho.interessados > 0:
+                return
+            trabalho._cancelar.set()
+            if trabalho._futuro.cancel():
+                # Ainda não tinha começado
+                trabalho.estado = "cancelado"
+                self._ativos.pop(trabalho.chave, None)
+
+    def _executar(self, trabalho: TrabalhoExportacao, gerar) -> None:
+        inicio = time.perf_counter()
+        trabalho.estado = "gerando"
+        temporario = self.cache.temporario(trabalho.formato)
+        try:
+            with open(temporario, "w+b") as f:
+                gerar(f, trabalho._progresso)
+            trabalho.caminho = self.cache.guardar(trabalho.chave, trabalho.formato, temporario)
+            trabalho.gravadas = trabalho.total
+            trabalho.estado = "pronto"
+        except ExportacaoCancelada:
+            trabalho.estado = "cancelado"
+        except Exception as e:
+            trabalho.erro, trabalho.estado = str(e), "erro"
+        finally:
+            temporario.unlink(missing_ok=True)
+            trabalho.segundos = time.perf_counter() - inicio
+            with self._lock:
+                self._ativos.pop(trabalho.chave, None)
@@ -1,12 +1,24 @@
 # ─── 1. IMPORTS ──────────────────────────────────────────────────────
 import streamlit as st
 import pandas as pd
-import io, re, time
-import base64, os
+import time, uuid
+import base64, os, tempfile
+from contextlib import nullcontext
 from pathlib import Path
 import streamlit.components.v1 as components
 import psutil
 from datetime import datetime
+from api import HOST_PADRAO, ServicoConsulta, iniciar_em_segundo_plano
+from processos import PoolTrabalhadores
+from dados import (
+    MODALIDADES, ARQ, nivel_map, DICIONARIOS,
+    beautify_column_header, aplicar_padrao_numerico_brasileiro, format_number_br,
+    Paginator, montar_linhas, formatar_pagina, resumir_selecao, PerfilEtapas,
+    plano_colunas, ler_modalidade, TabelaModalidade, IndiceOpcoes,
+    MotorFiltro, filtrar_indices, CacheFiltros, IndiceTexto, filtrar_texto,
+    gerar_csv, gerar_xlsx, gerar_parquet, gerar_arrow, Preaquecimento, combinacoes_preaquecimento,
+    CacheExportacoes, FilaExportacao, TrabalhoExportacao, chave_exportacao, normalizar_busca,
+)
 
 # ─── 2. PAGE CONFIG (primeiro comando Streamlit!) ───────────────────
 st.set_page_config(
@@ -31,216 +43,247 @@ st.markdown(f"<style>{css_path.read_text(encoding='utf-8')}</style>",
             unsafe_allow_html=True)
 
 
-# ─── 4. FUNÇÕES UTIL ────────────────────────────────────────────────
-def beautify(col: str) -> str:
-    """Formata o nome de uma coluna para exibição"""
-    return " ".join(p.capitalize() for p in col.replace("\n", " ").lower().split())
+# ─── 4. CACHE DOS DADOS (por processo) ────────────────────────────
+# Arquivo JSONL dos registros, só para análise offline: desativado por
+# padrão (ex.: DASHBOARD_PERFIL_LOG=perfil_etapas.jsonl para ligar)
+ARQUIVO_PERFIL = os.environ.get("DASHBOARD_PERFIL_LOG", "")
 
 
-def beautify_column_header(col: str) -> str:
-    """Formata o cabeçalho de uma coluna com abreviações conhecidas"""
-    abreviacoes = {
-        "Número de Matrículas": "Matrículas",
-        "Nome do Município": "Município",
-        "Nome da Escola": "Escola",
-        "Etapa de Ensino": "Etapa",
-        "Cód. Município": "Cód. Mun.",
-        "Cód. da Escola": "Cód. Esc.",
-        "UF": "UF"
-    }
+@st.cache_resource
+def obter_perfil() -> PerfilEtapas:
+    """Perfil compartilhado por todas as sessões do processo."""
+    return PerfilEtapas(arquivo=ARQUIVO_PERFIL or None)
 
-    # Se a coluna está no dicionário, usar a abreviação
-    if col in abreviacoes:
-        return abreviacoes[col]
 
-    # Caso contrário, usar o comportamento da beautify original
-    return " ".join(p.capitalize() for p in col.replace("\n", " ").lower().split())
+@st.cache_resource
+def _tabelas_carregadas() -> dict[str, TabelaModalidade]:
+    """Registro (por processo) das tabelas de modalidade já carregadas."""
+    return {}
 
 
-def aplicar_padrao_numerico_brasileiro(num):
-    """Formata números no padrão brasileiro (1.234,56)"""
-    if pd.isna(num):
-        return "-"
-    n = float(num)
-    if n.is_integer():
-        return f"{int(n):,}".replace(",", ".")
-    inteiro, frac = str(f"{n:,.2f}").split('.')
-    return f"{inteiro.replace(',', '.')},{frac}"
+# Sem spinner próprio: a seção 8 já mostra um, e o pré-aquecimento chama
+# esta função de threads sem contexto de script
+@st.cache_resource(show_spinner=False)
+def carregar_modalidade(arquivo: str) -> TabelaModalidade:
+    """Carrega a modalidade inteira uma única vez e a registra no cache."""
+    tabela = TabelaModalidade(ler_modalidade(arquivo))
+    _tabelas_carregadas()[arquivo] = tabela
+    return tabela
 
 
-def format_number_br(num):
-    """Formata inteiros no padrão brasileiro (1.234)"""
-    try:
-        return f"{int(num):,}".replace(",", ".")
-    except:
-        return str(num)
-
-
-# ─── 4‑B. PAGINAÇÃO ────────────────────────────────────────────────
-class Paginator:
-    """Classe para gerenciar a paginação de DataFrames"""
-
-    def __init__(self, total, page_size=25, current=1):
-        # Limita o page_size a 10.000 se for maior
-        self.page_size = min(page_size, 10000)
-        self.total_pages = max(1, (total - 1) // self.page_size + 1)
-        self.current = max(1, min(current, self.total_pages))
-        self.start = (self.current - 1) * self.page_size
-        self.end = min(self.start + self.page_size, total)
-
-    def slice(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Retorna uma fatia do DataFrame correspondente à página atual"""
-        return df.iloc[self.start:self.end]
-
-
-# ─── 5. DEFINIÇÃO DE MODELO DE DADOS POR MODALIDADE ─────────────────
-class ModalidadeConfig:
-    """Configuração específica de cada modalidade"""
-
-    def __init__(
-            self, arquivo: str,
-            etapa_valores: dict | None = None,
-            subetapa_valores: dict | None = None,
-            serie_col: str | None = None,
-            texto_ajuda: str | None = None,
-    ):
-        self.arquivo = arquivo
-        self.etapa_valores = etapa_valores or {}
-        self.subetapa_valores = subetapa_valores or {}
-        self.serie_col = serie_col
-        self.texto_ajuda = texto_ajuda
-
-
-# ─── 6. CONFIGURAÇÕES DE MODALIDADE ─────────────────────────────────
-MODALIDADES: dict[str, ModalidadeConfig] = {
-    "Ensino Regular": ModalidadeConfig(
-        arquivo="Ensino Regular.parquet",
-        etapa_valores={"padrao": "Educação Infantil"},
-        serie_col="Ano/Série",
-        texto_ajuda=(
-            "No Ensino Regular, selecione primeiro a Etapa "
-            "(Infantil, Fundamental ou Médio), depois a Subetapa "
-            "e, se desejar, uma Série específica."
-        ),
-    ),
-    "EJA - Educação de Jovens e Adultos": ModalidadeConfig(
-        arquivo="EJA - Educação de Jovens e Adultos.parquet",
-        etapa_valores={
-            "padrao": "EJA - Total",
-            "totais": [
-                "EJA - Total",
-                "EJA Ensino Fundamental - Total",
-                "EJA Ensino Médio - Total",
-            ],
-        },
-        subetapa_valores={
-            "EJA Ensino Fundamental": [
-                "EJA Anos Iniciais",
-                "EJA Anos Finais",
-                "EJA Ensino Fundamental - Curso FIC",
-            ],
-            "EJA Ensino Médio": [
-                "EJA Ensino Médio - Sem componente profissionalizante",
-                "EJA Ensino Médio - Curso FIC",
-                "EJA Ensino Médio - Curso Técnico Integrado",
-            ],
-        },
-        texto_ajuda=(
-            "Selecione a Etapa (Total ou específica). "
-            "Para etapas específicas, escolha a Subetapa."
-        ),
-    ),
-    "Educação Profissional": ModalidadeConfig(
-        arquivo="Educação Profissional.parquet",
-        etapa_valores={
-            "padrao": "Educação Profissional - Total",
-            "totais": ["Educação Profissional - Total"],
-        },
-        texto_ajuda=(
-            "Na Educação Profissional, selecione a Etapa "
-            "(Total, FIC ou Técnico) e depois a Subetapa específica."
-        ),
-    ),
-}
+def memoria_cache_dados() -> int:
+    """Total de bytes ocupados pelas tabelas de modalidade em cache."""
+    return DICIONARIOS.nbytes + sum(t.nbytes for t in list(_tabelas_carregadas().values()))
 
-# Mapeamento comum (define apenas uma vez)
-nivel_map = {
-    "Escolas": "escola",
-    "Municípios": "município",
-    "Pernambuco": "estado"
-}
 
-# Mapeamento de modalidades para arquivos
-ARQ = {k: v.arquivo for k, v in MODALIDADES.items()}
+def carregar_opcoes(arquivo: str, nivel: str, serie_col: str | None = None) -> IndiceOpcoes:
+    """Índice de opções dos filtros para a modalidade/nível escolhidos."""
+    return carregar_modalidade(arquivo).opcoes(nivel, serie_col)
+
+
+def carregar_motor(arquivo: str, nivel: str, serie_col: str | None = None) -> MotorFiltro:
+    """Motor de filtro por códigos para a modalidade/nível escolhidos."""
+    return carregar_modalidade(arquivo).motor(nivel, serie_col)
+
+
+def carregar_indice_texto(arquivo: str, nivel: str) -> IndiceTexto:
+    """Índice de busca textual para a modalidade/nível escolhidos."""
+    return carregar_modalidade(arquivo).indice_texto(nivel)
 
 
-# ─── 7. FUNÇÃO DE CARREGAMENTO OTIMIZADA ─────────────────────────
-@st.cache_resource(show_spinner="⏳ Carregando dados…")
 def carregar_parquet_otimizado(arquivo: str, nivel: str | None = None) -> pd.DataFrame:
-    """Lê o Parquet com dtypes compactos e retorna apenas o nível desejado."""
+    """Retorna os dados do nível desejado a partir da tabela da modalidade."""
     try:
-        # Definir colunas a carregar
-        use_cols = [
-            "Nível de agregação", "Ano",
-            "Cód. Município", "Nome do Município",
-            "Cód. da Escola", "Nome da Escola",
-            "Etapa", "Subetapa", "Rede",
-            "Número de Matrículas",
-        ]
-
-        # Adicionar coluna específica para Ensino Regular
-        if "Ensino Regular" in arquivo:
-            use_cols.append("Ano/Série")
-
-        # Carregamento do Parquet - apenas com colunas selecionadas
-        df = pd.read_parquet(
-            arquivo,
-            columns=use_cols,
-            engine="pyarrow"
+        tabela = carregar_modalidade(arquivo)
+        return tabela.nivel(nivel) if nivel else tabela.tabela.to_pandas()
+
+    except FileNotFoundError:
+        st.error(f"Erro ao carregar arquivo '{arquivo}': arquivo não encontrado")
+        return pd.DataFrame()
+    except Exception as e:
+        st.error(f"Erro ao carregar arquivo '{arquivo}': {type(e).__name__}: {e}")
+        return pd.DataFrame()
+
+
+@st.cache_resource
+def obter_cache_filtros() -> CacheFiltros:
+    """Cache de filtros compartilhado por todas as sessões do processo."""
+    return CacheFiltros()
+
+
+# Combinações pré-carregadas ao subir o servidor ("*" = todas). Em hosts com
+# pouca memória, restrinja: "*:Municípios;*:Pernambuco", "Ensino Regular"
+# ou "0" para desativar (formato em combinacoes_preaquecimento)
+PREAQUECER = os.environ.get("DASHBOARD_PREAQUECER", "*")
+THREADS_PREAQUECIMENTO = int(os.environ.get("DASHBOARD_PREAQUECER_THREADS", "2"))
+
+
+def _preaquecer(modalidade: str, nivel_ui: str) -> None:
+    """Carrega a modalidade, a visão do nível e o índice de opções dos filtros."""
+    with obter_perfil().medir("preaquecer", "preaquecimento") as registro:
+        carregar_opcoes(
+            ARQ[modalidade], nivel_map[nivel_ui],
+            serie_col=MODALIDADES[modalidade].serie_col
         )
+        tabela = carregar_modalidade(ARQ[modalidade])
+        registro["linhas_saida"] = len(tabela.nivel(nivel_map[nivel_ui]))
+        registro["combinacao"] = f"{modalidade} · {nivel_ui}"
+
+
+@st.cache_resource
+def iniciar_preaquecimento() -> Preaquecimento:
+    """Dispara o pré-aquecimento uma única vez por processo."""
+    # Arquivo ausente não é falha do pré-aquecimento: só aparece no painel
+    ignoradas = [m for m in MODALIDADES if not Path(ARQ[m]).exists()]
+    try:
+        combinacoes = combinacoes_preaquecimento(PREAQUECER)
+    except ValueError as e:
+        preaquecimento = Preaquecimento([], ignoradas=ignoradas)
+        preaquecimento.erros["DASHBOARD_PREAQUECER"] = str(e)
+        return preaquecimento
+    return Preaquecimento(
+        [(f"{m} · {n}", lambda m=m, n=n: _preaquecer(m, n)) for m, n in combinacoes],
+        max_threads=THREADS_PREAQUECIMENTO,
+        ignoradas=ignoradas,
+    )
+
 
-        # Aplicar conversões de tipo após carregamento
-        # Converter números para tipos menores
-        if "Ano" in df.columns:
-            df["Ano"] = pd.to_numeric(df["Ano"], downcast="integer")
+def mostrar_preaquecimento(preaquecimento: Preaquecimento):
+    """Progresso do pré-aquecimento na barra lateral, atualizado a cada segundo."""
+    ativo = not preaquecimento.terminado
 
-        if "Número de Matrículas" in df.columns:
-            df["Número de Matrículas"] = pd.to_numeric(
-                df["Número de Matrículas"], downcast="unsigned"
+    @st.fragment(run_every=1 if ativo else None)
+    def painel():
+        if ativo and preaquecimento.terminado:
+            st.rerun()  # execução completa registra o painel sem o timer
+        if not preaquecimento.terminado:
+            st.progress(
+                preaquecimento.concluidas / preaquecimento.total,
+                text=f"🔥 Pré-carregando dados: {preaquecimento.concluidas}/"
+                     f"{preaquecimento.total} · {', '.join(sorted(preaquecimento.andamento))}"
+            )
+            return
+        if preaquecimento.total:
+            st.caption(
+                f"🔥 {preaquecimento.total} combinações pré-carregadas "
+                f"em {preaquecimento.segundos:.1f}s"
+            )
+        if preaquecimento.ignoradas:
+            st.caption(
+                "Sem arquivo de dados, não pré-carregadas: "
+                + ", ".join(preaquecimento.ignoradas)
             )
+        for descricao, erro in preaquecimento.erros.items():
+            st.warning(f"Pré-aquecimento ({descricao}): {erro}")
 
-        if "Cód. Município" in df.columns:
-            df["Cód. Município"] = pd.to_numeric(df["Cód. Município"], errors="coerce")
+    painel()
 
-        if "Cód. da Escola" in df.columns:
-            df["Cód. da Escola"] = pd.to_numeric(df["Cód. da Escola"], errors="coerce")
 
-        # Tratamento de valores nulos em Subetapa ANTES de converter para category
-        if "Subetapa" in df.columns:
-            # Importante: preencher nulos antes de converter para category
-            df["Subetapa"] = df["Subetapa"].fillna("N/A")
+# API de consulta (api.py) no mesmo processo, sobre as mesmas tabelas e o
+# mesmo cache de filtros da interface; sem DASHBOARD_API_PORTA ela não sobe
+PORTA_API = os.environ.get("DASHBOARD_API_PORTA", "")
+HOST_API = os.environ.get("DASHBOARD_API_HOST", HOST_PADRAO)
 
-        # Converter texto para category para economizar mais RAM
-        for col in ["Nome do Município", "Nome da Escola", "Etapa",
-                    "Subetapa", "Rede", "Nível de agregação"]:
-            if col in df.columns:
-                df[col] = df[col].astype("category")
 
-        # Converter Ano/Série para category no caso do Ensino Regular
-        if "Ano/Série" in df.columns:
-            # Tratar possíveis nulos antes de converter para category
-            df["Ano/Série"] = df["Ano/Série"].fillna("N/A").astype("category")
+@st.cache_resource
+def iniciar_api() -> str | None:
+    """Sobe a API uma única vez por processo e retorna a mensagem de status."""
+    if not PORTA_API:
+        return None
+    servico = ServicoConsulta(carregar_modalidade, obter_cache_filtros())
+    try:
+        iniciar_em_segundo_plano(servico, HOST_API, int(PORTA_API))
+    except (OSError, ValueError) as e:
+        return f"⚠️ API de consulta não iniciada ({PORTA_API}): {e}"
+    return f"🔌 API de consulta em http://{HOST_API}:{PORTA_API}"
 
-        # Filtrar por nível se especificado
-        return df[df["Nível de agregação"].eq(nivel)] if nivel else df
 
-    except Exception as e:
-        st.error(f"Erro ao carregar arquivo '{arquivo}': {str(e)}")
-        return pd.DataFrame()
+# Processos trabalhadores (processos.py) para filtro, busca textual e XLSX,
+# fora do GIL do servidor; "0" (padrão) mantém tudo nas threads das sessões
+PROCESSOS = int(os.environ.get("DASHBOARD_PROCESSOS", "0"))
+
+
+@st.cache_resource
+def obter_pool() -> PoolTrabalhadores | None:
+    """Pool de processos compartilhado por todas as sessões (None = desligado)."""
+    return PoolTrabalhadores(PROCESSOS) if PROCESSOS > 0 else None
 
 
-# ─── 8. CONSTRUÇÃO DOS FILTROS DINÂMICOS ───────────────────────────
-def construir_filtros_ui(df: pd.DataFrame, modalidade_key: str, nivel_ui: str):
+# Exportações geradas em segundo plano e guardadas em disco pela impressão
+# digital da seleção; a pasta sobrevive a reinícios do servidor
+PASTA_EXPORTACOES = os.environ.get(
+    "DASHBOARD_EXPORTACOES", os.path.join(tempfile.gettempdir(), "dashboard_exportacoes")
+)
+MB_EXPORTACOES = int(os.environ.get("DASHBOARD_EXPORTACOES_MB", "512"))
+THREADS_EXPORTACAO = int(os.environ.get("DASHBOARD_EXPORTACOES_THREADS", "1"))
+FORMATOS_EXPORTACAO = {
+    "csv": ("CSV", "text/csv"),
+    "xlsx": ("Excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet"),
+    "arrow": ("Arrow", "application/vnd.apache.arrow.file"),
+}
+GERADORES = {"csv": gerar_csv, "xlsx": gerar_xlsx, "parquet": gerar_parquet, "arrow": gerar_arrow}
+
+
+@st.cache_resource
+def obter_fila_exportacao() -> FilaExportacao:
+    """Fila de exportações compartilhada por todas as sessões do processo."""
+    return FilaExportacao(
+        CacheExportacoes(PASTA_EXPORTACOES, MB_EXPORTACOES * 1024 ** 2),
+        max_threads=THREADS_EXPORTACAO,
+    )
+
+
+def mostrar_exportacoes(fila: FilaExportacao, nome_arquivo: str):
+    """Progresso, cancelamento e download das exportações desta sessão.
+
+    `nome_arquivo` (sem extensão) identifica a seleção exportada.
+    """
+    trabalhos: dict[str, TrabalhoExportacao] = st.session_state.setdefault("exportacoes", {})
+    ativo = any(t.ativo for t in trabalhos.values())
+
+    @st.fragment(run_every=1 if ativo else None)
+    def painel():
+        if ativo and not any(t.ativo for t in trabalhos.values()):
+            st.rerun()  # execução completa registra o painel sem o timer
+        for formato, trabalho in list(trabalhos.items()):
+            rotulo, mime = FORMATOS_EXPORTACAO[formato]
+            if trabalho.ativo:
+                st.progress(
+                    trabalho.fracao,
+                    text=f"⏳ {rotulo} {trabalho.estado}: "
+                         f"{format_number_br(trabalho.gravadas)} de "
+                         f"{format_number_br(trabalho.total)} linhas"
+                )
+                if st.button("Cancelar", key=f"{formato}_cancelar"):
+                    fila.cancelar(trabalho)
+                    del trabalhos[formato]
+                    st.rerun()
+            elif trabalho.estado == "pronto" and trabalho.caminho.exists():
+                # Lido só no clique, numa thread à parte
+                st.download_button(
+                    f"Baixar {rotulo}",
+                    data=trabalho.caminho.read_bytes,
+                    mime=mime,
+                    file_name=f"{nome_arquivo}_{datetime.now().strftime('%Y%m%d')}.{formato}",
+                    key=f"{formato}_download"
+                )
+                st.caption(
+                    f"{format_number_br(trabalho.total)} linhas · "
+                    + ("do cache" if trabalho.do_cache
+                       else f"gerado em {trabalho.segundos:.1f}s")
+                )
+            elif trabalho.estado == "erro":
+                st.error(f"Falha ao gerar {rotulo}: {trabalho.erro}")
+            else:
+                # Cancelado por outra via ou expulso do cache
+                del trabalhos[formato]
+
+    painel()
+
+
+# ─── 5. CONSTRUÇÃO DOS FILTROS DINÂMICOS ──────────────────────────
+def construir_filtros_ui(opcoes: IndiceOpcoes, modalidade_key: str, nivel_ui: str):
     """Cria filtros de ano, rede, etapa, etc., para a modalidade escolhida."""
     config = MODALIDADES[modalidade_key]
 
@@ -249,7 +292,7 @@ def construir_filtros_ui(df: pd.DataFrame, modalidade_key: str, nivel_ui: str):
     with c_left:
         # Ano(s)
         st.markdown('<div class="filter-title">Ano(s)</div>', unsafe_allow_html=True)
-        anos_disp = sorted(df["Ano"].unique(), reverse=True)
+        anos_disp = opcoes.anos
         anos_sel = st.multiselect(
             "Ano(s)", anos_disp,
             default=[anos_disp[0]] if anos_disp else [],
@@ -259,7 +302,7 @@ def construir_filtros_ui(df: pd.DataFrame, modalidade_key: str, nivel_ui: str):
         # Rede(s)
         st.markdown('<div class="filter-title" style="margin-top:-12px;">Rede(s)</div>',
                     unsafe_allow_html=True)
-        redes_disp = sorted(df["Rede"].dropna().unique())
+        redes_disp = opcoes.redes
         default_redes = ["Pública e Privada"] if "Pública e Privada" in redes_disp else []
         redes_sel = st.multiselect(
             "Rede(s)", redes_disp,
@@ -273,7 +316,7 @@ def construir_filtros_ui(df: pd.DataFrame, modalidade_key: str, nivel_ui: str):
 
         # Etapa
         st.markdown('<div class="filter-title">Etapa</div>', unsafe_allow_html=True)
-        etapas_disp = sorted(df["Etapa"].unique())
+        etapas_disp = opcoes.etapas
         padrao = config.etapa_valores.get("padrao", "")
         default_etapas = [padrao] if padrao in etapas_disp else etapas_disp[:1]
 
@@ -290,11 +333,7 @@ def construir_filtros_ui(df: pd.DataFrame, modalidade_key: str, nivel_ui: str):
         is_total = etapa_sel and etapa_sel[0] in config.etapa_valores.get("totais", [])
 
         if etapa_sel and not is_total:
-            sub_disp = sorted(
-                df.loc[df["Etapa"].isin(etapa_sel) & df["Subetapa"].notna(), "Subetapa"]
-                .pipe(lambda s: s[~s.astype(str).str.contains("Total", na=False)])
-                .unique()
-            )
+            sub_disp = opcoes.subetapas(etapa_sel)
             sub_sel = st.multiselect(
                 "Subetapa", sub_disp,
                 default=[], label_visibility="collapsed", key="sub_sel"
@@ -310,18 +349,11 @@ def construir_filtros_ui(df: pd.DataFrame, modalidade_key: str, nivel_ui: str):
             st.markdown('<div class="filter-title" style="margin-top:-12px;">Série</div>',
                         unsafe_allow_html=True)
 
-            # Verificar o nome correto da coluna de série
-            serie_col = config.serie_col if config.serie_col in df.columns else "Série"
-
-            if serie_col in df.columns:  # Verificar se a coluna existe
-                serie_disp = sorted(
-                    df.loc[
-                        df["Etapa"].isin(etapa_sel) &
-                        df["Subetapa"].isin(sub_sel) &
-                        df[serie_col].notna(),
-                        serie_col
-                    ].unique()
-                )
+            # Coluna de série resolvida no índice de opções
+            serie_col = opcoes.serie_col or config.serie_col or "Série"
+
+            if opcoes.serie_col:  # Verificar se a coluna existe
+                serie_disp = opcoes.series(etapa_sel, sub_sel)
                 serie_sel = st.multiselect(
                     "Série", serie_disp,
                     default=[], label_visibility="collapsed", key="serie_sel"
@@ -336,75 +368,50 @@ def construir_filtros_ui(df: pd.DataFrame, modalidade_key: str, nivel_ui: str):
     return anos_sel, redes_sel, filtros
 
 
-# ─── 9. FUNÇÃO DE FILTRO UNIFICADA ─────────────────────────────────
-def filtrar_dados(df, modalidade_key, anos, redes, filtros):
-    """Filtra dados de forma unificada para qualquer modalidade"""
-    config = MODALIDADES[modalidade_key]
-
-    # Aplicamos os filtros sequencialmente
-    result_df = df.copy()
-
-    # Filtros básicos (comuns a todas as modalidades)
-    result_df = result_df[result_df["Ano"].isin(anos)]
-
-    if redes:
-        result_df = result_df[result_df["Rede"].isin(redes)]
-
-    # ─── LÓGICA ESPECÍFICA PARA EJA ────────────────────────────────
-    if modalidade_key == "EJA - Educação de Jovens e Adultos":
-        etapa_sel = filtros.get("etapa", [])
-        subetapa_sel = filtros.get("subetapa", [])
-
-        # Aplica filtro de etapa
-        if etapa_sel:
-            result_df = result_df[result_df["Etapa"].isin(etapa_sel)]
-
-        # Aplica subetapa apenas se não for total
-        if (etapa_sel and
-                not any(e in config.etapa_valores.get("totais", []) for e in etapa_sel) and
-                subetapa_sel):
-            result_df = result_df[result_df["Subetapa"].isin(subetapa_sel)]
-
-    # ─── LÓGICA PARA DEMAIS MODALIDADES ────────────────────────────
-    else:
-        # Etapa
-        etapa_sel = filtros.get("etapa", [])
-        if etapa_sel:
-            result_df = result_df[result_df["Etapa"].isin(etapa_sel)]
-            is_etapa_total = any(e in config.etapa_valores.get("totais", []) for e in etapa_sel)
-
-            # Lógica específica para Ensino Regular
-            if modalidade_key == "Ensino Regular" and not is_etapa_total and not filtros.get("subetapa"):
-                result_df = result_df[result_df["Subetapa"].astype(str).str.contains("Total", na=False)]
-
-        # Subetapa (só aplicar se não for total)
-        subetapa_sel = filtros.get("subetapa", [])
-        if subetapa_sel and etapa_sel and not any(e in config.etapa_valores.get("totais", []) for e in etapa_sel):
-            result_df = result_df[result_df["Subetapa"].isin(subetapa_sel)]
-
-        # Série - apenas para Ensino Regular e se não for total
-        serie_sel = filtros.get("serie", [])
-        if (
-                serie_sel
-                and modalidade_key == "Ensino Regular"
-                and etapa_sel
-                and not any(e in config.etapa_valores.get("totais", []) for e in etapa_sel)
-                and not any("Total" in sub for sub in subetapa_sel)
-        ):
-            # Verificar o nome correto da coluna de série
-            serie_col = config.serie_col if config.serie_col in result_df.columns else "Série"
-
-            if serie_col in result_df.columns:  # Verificar se a coluna existe
-                result_df = result_df[result_df[serie_col].isin(serie_sel)]
-
-    return result_df
-
-
-# ─── 10. INICIALIZAÇÃO E CARREGAMENTO ──────────────────────────────
-if "tempo_inicio" not in st.session_state:
-    st.session_state["tempo_inicio"] = time.time()
-
-# ─── 11. SELEÇÃO DE MODALIDADE / NÍVEL ─────────────────────────────
+# ─── 6. ETAPAS INCREMENTAIS DO RERUN ──────────────────────────────
+class EtapasRerun:
+    """Guarda, por sessão, o último resultado de cada etapa do script.
+
+    Cada etapa é identificada por uma chave com as entradas de que depende
+    (e a chave da etapa anterior). Se a chave não mudou desde o último rerun,
+    o resultado é reaproveitado; assim uma seleção na tabela ou a troca de
+    altura não refazem filtro, busca, paginação nem formatação.
+    """
+
+    def __init__(self, estado, perfil: PerfilEtapas | None = None, execucao: str = ""):
+        self._etapas: dict[str, tuple] = estado.setdefault("_etapas_rerun", {})
+        self._perfil = perfil
+        self._execucao = execucao
+
+    def executar(self, nome: str, chave: tuple, calcular, linhas_entrada: int | None = None):
+        medicao = (self._perfil.medir(nome, self._execucao, linhas_entrada)
+                   if self._perfil else nullcontext({}))
+        with medicao as registro:
+            anterior = self._etapas.get(nome)
+            if anterior is not None and anterior[0] == chave:
+                resultado = anterior[1]
+                registro["reaproveitada"] = True
+            else:
+                resultado = calcular()
+                self._etapas[nome] = (chave, resultado)
+                registro["reaproveitada"] = False
+            registro["linhas_saida"] = len(resultado)
+        return resultado
+
+
+# ─── 7. INICIALIZAÇÃO E CARREGAMENTO ──────────────────────────────
+# Identifica esta execução do script nos registros de desempenho
+perfil = obter_perfil()
+preaquecimento = iniciar_preaquecimento()
+status_api = iniciar_api()
+pool = obter_pool()
+fila_exportacao = obter_fila_exportacao()
+sessao_id = st.session_state.setdefault("sessao_id", uuid.uuid4().hex[:8])
+st.session_state["num_execucao"] = st.session_state.get("num_execucao", 0) + 1
+execucao = f"{sessao_id}-{st.session_state['num_execucao']}"
+inicio_execucao = time.perf_counter()
+
+# ─── 8. SELEÇÃO DE MODALIDADE / NÍVEL ─────────────────────────────
 with st.sidebar:
     st.sidebar.title("Modalidade")
     tipo_ensino = st.radio(
@@ -426,10 +433,12 @@ with st.sidebar:
 with st.spinner("Carregando dados otimizados…"):
 
     # Carregar dados
-    df_base = carregar_parquet_otimizado(
-        ARQ[tipo_ensino],
-        nivel=nivel_map[nivel_ui]
-    )
+    with perfil.medir("carregar", execucao) as registro:
+        df_base = carregar_parquet_otimizado(
+            ARQ[tipo_ensino],
+            nivel=nivel_map[nivel_ui]
+        )
+        registro["linhas_saida"] = len(df_base)
 if df_base.empty:
     st.warning(f"Não há dados disponíveis para o nível '{nivel_ui}'.")
     st.stop()
@@ -438,23 +447,33 @@ if df_base.empty:
 with st.sidebar:
     # Primeiro exibe o indicador de RAM
     ram_mb = psutil.Process(os.getpid()).memory_info().rss / 1024 ** 2
+    cache_mb = memoria_cache_dados() / 1024 ** 2
     st.markdown(
-        f'<div class="ram-indicator">💾 RAM usada: <b>{ram_mb:.0f} MB</b></div>',
+        f'<div class="ram-indicator">💾 RAM usada: <b>{ram_mb:.0f} MB</b><br>'
+        f'📦 Dados em cache: <b>{cache_mb:.0f} MB</b></div>',
         unsafe_allow_html=True
     )
+    mostrar_preaquecimento(preaquecimento)
+    if status_api:
+        st.caption(status_api)
 
-# ─── 12. PAINEL DE FILTROS DINÂMICOS ─────────────────────────────
+# ─── 9. PAINEL DE FILTROS DINÂMICOS ─────────────────────────────
 with st.container():
     st.markdown(
         '<div class="panel-filtros" style="margin-top:-30px">',
         unsafe_allow_html=True
     )
-    anos_sel, redes_sel, filtros_especificos = construir_filtros_ui(
-        df_base, tipo_ensino, nivel_ui
+    opcoes = carregar_opcoes(
+        ARQ[tipo_ensino], nivel_map[nivel_ui],
+        serie_col=MODALIDADES[tipo_ensino].serie_col
     )
+    with perfil.medir("filtros_ui", execucao):
+        anos_sel, redes_sel, filtros_especificos = construir_filtros_ui(
+            opcoes, tipo_ensino, nivel_ui
+        )
     st.markdown('</div>', unsafe_allow_html=True)
 
-# ─── 13. VALIDAÇÃO E FILTRAGEM ────────────────────────────────────
+# ─── 10. VALIDAÇÃO E FILTRAGEM ────────────────────────────────────
 if not anos_sel:
     st.warning("Por favor, selecione pelo menos um ano.")
     st.stop()
@@ -462,11 +481,26 @@ if not redes_sel:
     st.warning("Por favor, selecione pelo menos uma rede.")
     st.stop()
 
-df_filtrado = filtrar_dados(
-    df_base, tipo_ensino, anos_sel, redes_sel, filtros_especificos
+motor = carregar_motor(
+    ARQ[tipo_ensino], nivel_map[nivel_ui],
+    serie_col=MODALIDADES[tipo_ensino].serie_col
 )
+tabela = carregar_modalidade(ARQ[tipo_ensino])
+etapas = EtapasRerun(st.session_state, perfil, execucao)
 
-num_total, num_filtrado = len(df_base), len(df_filtrado)
+# Etapa "filtro": depende só da modalidade, do nível e dos filtros da barra lateral
+chave_filtro = CacheFiltros.chave(
+    ARQ[tipo_ensino], nivel_map[nivel_ui], anos_sel, redes_sel, filtros_especificos
+)
+idx_filtrado = etapas.executar("filtro", chave_filtro, lambda: obter_cache_filtros().obter(
+    chave_filtro,
+    lambda: pool.filtrar(
+        tabela, ARQ[tipo_ensino], tipo_ensino, nivel_map[nivel_ui],
+        anos_sel, redes_sel, filtros_especificos
+    ) if pool else filtrar_indices(motor, tipo_ensino, anos_sel, redes_sel, filtros_especificos)
+), linhas_entrada=len(df_base))
+
+num_total, num_filtrado = len(df_base), len(idx_filtrado)
 if num_filtrado == 0:
     ajuda = MODALIDADES[tipo_ensino].texto_ajuda or ""
     st.warning("Não há dados para essa combinação de filtros.\n\n" + ajuda)
@@ -481,7 +515,7 @@ st.markdown(
     </div>""", unsafe_allow_html=True
 )
 
-# ─── 14. CONFIGURAÇÕES (altura + linhas por página) ───────────────
+# ─── 11. CONFIGURAÇÕES (altura + linhas por página) ───────────────
 with st.sidebar.expander("Configurações", False):
     st.markdown("""<style>
     [data-testid="stExpander"] [data-testid="stSlider"] > div:first-child,
@@ -497,25 +531,13 @@ with st.sidebar.expander("Configurações", False):
     )
     st.session_state["page_size"] = page_size
 
-# ─── 15. PREPARAÇÃO DA TABELA ──────────────────────────────────────
-vis_cols = ["Ano"]
+# ─── 12. PREPARAÇÃO DA TABELA ──────────────────────────────────────
+# Mesmo plano de colunas usado na carga do nível (dados.plano_colunas)
+vis_cols = plano_colunas(nivel_map[nivel_ui], list(df_base.columns))
+colunas_fixas = {}
 if nivel_ui == "Pernambuco":
-    df_filtrado = df_filtrado.copy()
-    df_filtrado["UF"] = "Pernambuco"
-    vis_cols += ["UF"]
-if nivel_ui == "Escolas":
-    vis_cols += ["Nome do Município", "Nome da Escola"]
-elif nivel_ui == "Municípios":
-    vis_cols += ["Nome do Município"]
-
-vis_cols += ["Etapa", "Subetapa"]
-if tipo_ensino == "Ensino Regular":
-    serie_col = MODALIDADES[tipo_ensino].serie_col or "Série"
-    if serie_col in df_filtrado.columns:
-        vis_cols.append(serie_col)
-vis_cols += ["Rede", "Número de Matrículas"]
-
-df_tabela = df_filtrado[vis_cols].copy()
+    colunas_fixas["UF"] = "Pernambuco"
+    vis_cols.insert(1, "UF")
 
 # --- estilização da tabela ---
 st.markdown("""<style>
@@ -548,32 +570,24 @@ for i, col in enumerate(vis_cols):
             placeholder=f"Filtrar {header_name.lower()}..."
         )
 
-# Aplicação dos filtros de texto
-mask = pd.Series(True, index=df_tabela.index)
-filtros_ativos = False
-
-for col, val in filter_values.items():
-    if val.strip():
-        filtros_ativos = True
-        s = df_tabela[col]
-        if col.startswith("Número de") or pd.api.types.is_numeric_dtype(s):
-            v = val.replace(",", ".")
-            if re.fullmatch(r"-?\d+(\.\d+)?", v):
-                # Filtro exato para números
-                mask &= s == float(v)
-            else:
-                # Filtro por texto em valores numéricos convertidos
-                mask &= s.astype(str).str.contains(val, case=False)
-        else:
-            # Filtro por texto em colunas de texto
-            mask &= s.astype(str).str.contains(val, case=False)
+# Etapa "texto": filtros de cabeçalho (via índice dos valores distintos do nível)
+filtros_texto = {col: val for col, val in filter_values.items() if val.strip()}
+filtros_ativos = bool(filtros_texto)
+chave_texto = (chave_filtro, tuple(filtros_texto.items()))
 
-df_texto = df_tabela[mask]
+# Posições (no nível) das linhas que passaram em todos os filtros
+idx_texto = etapas.executar("texto", chave_texto, lambda: pool.filtrar_texto(
+    tabela, ARQ[tipo_ensino], nivel_map[nivel_ui],
+    idx_filtrado, filtros_texto, colunas_fixas
+) if pool else filtrar_texto(
+    carregar_indice_texto(ARQ[tipo_ensino], nivel_map[nivel_ui]),
+    idx_filtrado, filtros_texto, colunas_fixas
+), linhas_entrada=len(idx_filtrado))
 
 # Feedback visual para filtros ativos
 if filtros_ativos:
-    num_filtrados = len(df_texto)
-    num_total = len(df_tabela)
+    num_filtrados = len(idx_texto)
+    num_total = len(idx_filtrado)
     st.markdown(
         f"<div style='margin-top:-10px;margin-bottom:10px;'>"
         f"<span style='font-size:0.85rem;color:#666;background:#f5f5f5;padding:2px 8px;border-radius:4px;'>"
@@ -583,45 +597,50 @@ if filtros_ativos:
         unsafe_allow_html=True
     )
 
-# Paginação
+# Paginação: só as linhas da página atual são coletadas e formatadas
 pag = Paginator(
-    len(df_texto),
+    len(idx_texto),
     page_size=st.session_state["page_size"],
     current=st.session_state.get("current_page", 1)
 )
-df_page = pag.slice(df_texto)
-
-# Formatar colunas numéricas
-df_show = df_page.copy()
-colunas_numericas = df_show.filter(like="Número de").columns.tolist()
-df_show.columns = [beautify_column_header(col) for col in df_show.columns]
+chave_pagina = (chave_texto, pag.start, pag.end)
+df_page = etapas.executar("pagina", chave_pagina, lambda: montar_linhas(
+    df_base, pag.indices(idx_texto), vis_cols, colunas_fixas
+), linhas_entrada=len(idx_texto))
+df_show = etapas.executar("formato", chave_pagina, lambda: formatar_pagina(df_page),
+                          linhas_entrada=len(df_page))
 
-for col in colunas_numericas:
-    col_beautificada = beautify_column_header(col)
-    if col_beautificada in df_show.columns:
-        df_show[col_beautificada] = df_show[col_beautificada].apply(aplicar_padrao_numerico_brasileiro)
+# Cabeçalho exibido → coluna original (para interpretar a seleção)
+coluna_original = dict(zip(df_show.columns, df_page.columns))
 
 # Configuração de larguras de coluna
-num_colunas = len(df_show.columns)
 largura_base = 150
 config_colunas = {
-    col: {"width": f"{largura_base}px"} for col in df_show.columns
+    col: st.column_config.Column(width=largura_base) for col in df_show.columns
 }
 
-# Coluna de matrículas mais estreita
-col_matriculas = beautify_column_header("Número de Matrículas")
-if col_matriculas in config_colunas:
-    config_colunas[col_matriculas] = {"width": "120px"}
+# Contagens ficam numéricas (ordenação por valor); o separador de milhar
+# segue o idioma do navegador (1.234 em pt-BR), como no XLSX
+for col in df_page.columns:
+    if col.startswith("Número de"):
+        # Coluna de matrículas mais estreita
+        largura = 120 if col == "Número de Matrículas" else largura_base
+        config_colunas[beautify_column_header(col)] = st.column_config.NumberColumn(
+            format="localized", width=largura
+        )
+if "Ano" in config_colunas:
+    config_colunas["Ano"] = st.column_config.NumberColumn(format="%d", width=largura_base)
 
 # ─── PLACEHOLDER DO SOMATÓRIO (acima da tabela) ────────────────────
 soma_placeholder = st.empty()          # cria espaço antes da grade
 
 # ─── TABELA PRINCIPAL ──────────────────────────────────────────────
 event = st.dataframe(
-    df_page,
+    df_show,
     height=altura_tabela,
     use_container_width=True,
     hide_index=True,
+    column_config=config_colunas,
     selection_mode=["multi-row", "multi-column"],
     on_select="rerun",
     key="tabela_principal"
@@ -629,24 +648,26 @@ event = st.dataframe(
 
 # ─── RESULTADO DO SELECIONADO: SOMA ou CONTAGEM ───────────────────
 sel_rows = event.selection.rows
-sel_cols = event.selection.columns
+sel_cols = [coluna_original.get(c, c) for c in event.selection.columns]
 
 if sel_rows and sel_cols:
-    # Empilha todas as células escolhidas numa única Série
-    sel_vals = df_page.iloc[sel_rows][sel_cols].stack()
-
-    # Converte a números (texto vira NaN)
-    sel_num  = pd.to_numeric(sel_vals, errors="coerce")
+    # Agrega coluna a coluna pelo dtype (sem empilhar as células)
+    resumo = resumir_selecao(df_page, sel_rows, sel_cols)
+    fmt = aplicar_padrao_numerico_brasileiro
 
-    if sel_num.notna().any():  # há pelo menos 1 número
-        total = sel_num.sum()
+    if resumo["numericas"]:  # há pelo menos 1 número
         msg = (
-            f"➕ <b>Soma das células numéricas selecionadas:</b> "
-            f"{aplicar_padrao_numerico_brasileiro(total)}"
+            f"➕ <b>Soma das células numéricas selecionadas:</b> {fmt(resumo['soma'])}"
+            f'<br><span style="font-size:0.85rem">'
+            f"Média {fmt(resumo['media'])} · Mín {fmt(resumo['minimo'])} · "
+            f"Máx {fmt(resumo['maximo'])} · Distintos {fmt(resumo['distintos'])} · "
+            f"Células {fmt(resumo['celulas'])}</span>"
         )
     else:  # tudo é não‑numérico
-        total = sel_vals.size  # qtde de células
-        msg = f"🔢 <b>Contagem de células selecionadas:</b> {aplicar_padrao_numerico_brasileiro(total)}"
+        msg = (
+            f"🔢 <b>Contagem de células selecionadas:</b> {fmt(resumo['celulas'])}"
+            f'<br><span style="font-size:0.85rem">Distintos {fmt(resumo["distintos"])}</span>'
+        )
 
     # Exibe o banner alinhado à direita
     soma_placeholder.markdown(
@@ -664,7 +685,7 @@ if sel_rows and sel_cols:
 else:
     soma_placeholder.empty()
 
-# ─── 16. NAVEGAÇÃO DE PÁGINAS ──────────────────────────────────────
+# ─── 13. NAVEGAÇÃO DE PÁGINAS ──────────────────────────────────────
 if pag.total_pages > 1:
     b1, b2, b3, b4 = st.columns([1, 1, 1, 2])
     with b1:
@@ -697,7 +718,7 @@ if pag.total_pages > 1:
             f"<div style='text-align:right;padding-top:8px;'>"
             f"<span style='font-weight:500;'>"
             f"Página {pag.current}/{pag.total_pages} · "
-            f"{format_number_br(len(df_texto))} linhas</span></div>",
+            f"{format_number_br(len(idx_texto))} linhas</span></div>",
             unsafe_allow_html=True
         )
 
@@ -707,44 +728,14 @@ else:
         f"""
         <div style="text-align: right; padding: 8px 0;">
             <span style="font-family: Arial, sans-serif; font-weight: 600;">Total:</span>
-            <span>{format_number_br(len(df_texto))} linhas</span>
+            <span>{format_number_br(len(idx_texto))} linhas</span>
         </div>
         """,
         unsafe_allow_html=True
     )
 
 
-# ─── 17. DOWNLOADS (sob demanda) ───────────────────────────────────
-def gerar_csv(df):
-    """Prepara os dados para download em formato CSV"""
-    return df.to_csv(index=False).encode("utf-8")
-
-
-def gerar_xlsx(df):
-    """Prepara os dados para download em formato Excel"""
-    buf = io.BytesIO()
-    with pd.ExcelWriter(buf, engine="xlsxwriter") as w:
-        df.to_excel(w, index=False, sheet_name="Dados")
-        worksheet = w.sheets["Dados"]
-        header_format = w.book.add_format({
-            'bold': True,
-            'bg_color': '#FFDFBA',
-            'border': 1,
-            'align': 'center',
-            'valign': 'vcenter'
-        })
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-        for i, col in enumerate(df.columns):
-            max_len = max(
-                df[col].astype(str).apply(len).max(),
-                len(str(col))
-            ) + 2
-            worksheet.set_column(i, i, max_len)
-    return buf.getvalue()
-
-
-# ------ SEÇÃO DE DOWNLOAD AJUSTADA ------
+# ─── 14. DOWNLOADS (sob demanda) ──────────────────────────────────
 with st.sidebar:
     # Container para agrupar os elementos de download
     with st.container():
@@ -753,37 +744,65 @@ with st.sidebar:
         # Texto informativo com margem aumentada
         st.markdown(
             f'<div class="download-info" style="margin-bottom:25px">'
-            f'Download de <b>{format_number_br(len(df_texto))}</b> linhas</div>',
+            f'Download de <b>{format_number_br(len(idx_texto))}</b> linhas</div>',
             unsafe_allow_html=True
         )
 
-        # Botões em colunas com margem superior
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("Em CSV", disabled=len(df_texto) == 0, key="csv_btn"):
-                csv_data = gerar_csv(df_texto)
-                st.download_button(
-                    "Baixar CSV",
-                    data=csv_data,
-                    mime="text/csv",
-                    file_name=f"dados_{datetime.now().strftime('%Y%m%d')}.csv",
-                    key="csv_download"
-                )
-                del csv_data
-
-        with col2:
-            if st.button("Em Excel", disabled=len(df_texto) == 0, key="xlsx_btn"):
-                xlsx_data = gerar_xlsx(df_texto)
-                st.download_button(
-                    "Baixar Excel",
-                    data=xlsx_data,
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    file_name=f"dados_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                    key="xlsx_download"
-                )
-                del xlsx_data
-
-# ─── 18. RODAPÉ ────────────────────────────────────────────────────
+        # Botões em colunas com margem superior; Parquet e Arrow mantêm os
+        # tipos e saem direto das colunas, sem formatar texto
+        colunas_botoes = st.columns(2) + st.columns(2)
+        pedidos = {
+            formato: coluna.button(
+                f"Em {FORMATOS_EXPORTACAO[formato][0]}",
+                disabled=len(idx_texto) == 0, key=f"{formato}_btn"
+            )
+            for formato, coluna in zip(FORMATOS_EXPORTACAO, colunas_botoes)
+        }
+        chaves = {
+            formato: chave_exportacao(
+                ARQ[tipo_ensino], formato, chave_texto,
+                tuple(vis_cols), tuple(colunas_fixas.items())
+            )
+            for formato in FORMATOS_EXPORTACAO
+        }
+        trabalhos = st.session_state.setdefault("exportacoes", {})
+        # Exportações de uma seleção anterior (filtros, nível ou modalidade)
+        # não correspondem mais à tabela: param e saem do painel
+        for formato, trabalho in list(trabalhos.items()):
+            if trabalho.chave != chaves[formato]:
+                fila_exportacao.cancelar(trabalho)
+                del trabalhos[formato]
+
+        for formato in (f for f, pedido in pedidos.items() if pedido):
+            chave = chaves[formato]
+            anterior = trabalhos.get(formato)
+            if (anterior is not None and anterior.chave == chave
+                    and (anterior.ativo or anterior.estado == "pronto")):
+                continue
+            if anterior is not None:
+                fila_exportacao.cancelar(anterior)
+
+            # As linhas só são coletadas no trabalho, fora do rerun
+            def gerar(arquivo, progresso, formato=formato, linhas=idx_texto,
+                      colunas=list(vis_cols), fixas=dict(colunas_fixas),
+                      arq=ARQ[tipo_ensino], nivel=nivel_map[nivel_ui], df=df_base, tab=tabela):
+                with perfil.medir(f"exportar_{formato}", execucao, len(linhas)) as registro:
+                    if formato == "xlsx" and pool:
+                        # O trabalhador monta as linhas a partir das posições
+                        pool.gravar_xlsx(tab, arq, nivel, linhas, colunas, fixas, arquivo.name, progresso)
+                    else:
+                        df_export = montar_linhas(df, linhas, colunas, fixas)
+                        GERADORES[formato](df_export, arquivo, progresso)
+                    registro["linhas_saida"] = len(linhas)
+
+            trabalhos[formato] = fila_exportacao.enviar(chave, formato, len(idx_texto), gerar)
+
+        mostrar_exportacoes(fila_exportacao, "dados_" + "_".join(
+            "-".join(normalizar_busca(parte).replace("-", " ").split())
+            for parte in (tipo_ensino, nivel_ui)
+        ))
+
+# ─── 15. RODAPÉ ────────────────────────────────────────────────────
 st.markdown("---")
 
 # Layout de rodapé em colunas
@@ -792,13 +811,30 @@ footer_left, footer_right = st.columns([3, 1])
 with footer_left:
     st.caption("© Dashboard Educacional – atualização: Mai 2025")
 
-    # Informações de desempenho
-    delta = time.time() - st.session_state.get("tempo_inicio", time.time())
-    st.caption(f"⏱️ Tempo de processamento: {delta:.2f}s")
+    # Tempo desta execução do script (detalhe por etapa na barra lateral)
+    delta = time.perf_counter() - inicio_execucao
+    st.caption(f"⏱️ Execução: {delta:.2f}s")
 
 with footer_right:
     # Build info mais visível
     st.caption(f"Build: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} UTC")
 
-# Reinicia o timer para a próxima atualização
-st.session_state["tempo_inicio"] = time.time()
\ No newline at end of file
+# ─── 16. PAINEL DE DESEMPENHO ──────────────────────────────────────
+with st.sidebar.expander("⏱️ Desempenho por etapa", False):
+    registros = perfil.da_execucao(execucao)
+    st.dataframe(
+        pd.DataFrame({
+            "Etapa": [r["etapa"] for r in registros],
+            "ms": [round(r["segundos"] * 1000, 1) for r in registros],
+            "Entrada": [r["linhas_entrada"] for r in registros],
+            "Saída": [r["linhas_saida"] for r in registros],
+            "Δ RSS (MB)": [round(r["rss_delta_mb"], 1) for r in registros],
+            "Cache": ["✔" if r.get("reaproveitada") else "" for r in registros],
+        }),
+        hide_index=True,
+        use_container_width=True,
+    )
+    st.caption(
+        f"Total da execução: {delta:.2f}s"
+        + (f" · registros em `{perfil.arquivo}`" if perfil.arquivo else "")
+    )
@@ -0,0 +1,345 @@
+# ─── PREPARAÇÃO DOS DADOS (etapa de build) ──────────────────────────
+"""Gera arquivos auxiliares a partir dos Parquet das modalidades.
+
+Uso:
+    python preparar_dados.py cubos [arquivo.parquet ...]
+    python preparar_dados.py otimizar [--linhas-por-grupo N] [arquivo.parquet ...]
+
+Sem arquivos, processa todos os Parquet de modalidade da pasta atual.
+"""
+import argparse
+import hashlib
+import json
+import sys
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# ─── 1. CONSTANTES ──────────────────────────────────────────────────
+SUFIXO_CUBO = ".cubo.parquet"
+SUFIXO_OTIMIZADO = ".otimizado.parquet"
+SUFIXO_MANIFESTO = ".manifesto.json"
+# Incrementar quando as linhas gravadas pelo otimizar mudarem
+VERSAO_OTIMIZADO = 2
+
+# Colunas lidas pelo dashboard ("Ano/Série" só existe no Ensino Regular).
+# Os códigos (Cód. Município, Cód. da Escola) não são exibidos nem filtrados
+COLUNAS_DASHBOARD = [
+    "Nível de agregação", "Ano",
+    "Nome do Município", "Nome da Escola",
+    "Etapa", "Subetapa", "Rede",
+    "Número de Matrículas",
+]
+
+# Ordem das linhas no Parquet otimizado: cada nível/ano/rede fica em
+# poucos row groups, e as estatísticas min/max deles permitem pulá-los
+ORDEM_OTIMIZADA = ["Nível de agregação", "Ano", "Rede", "Etapa"]
+LINHAS_POR_GRUPO = 16_384
+
+# Dimensões do cubo, na ordem de ordenação (as ausentes no arquivo são ignoradas)
+DIMENSOES_CUBO = [
+    "Ano", "Rede", "Etapa", "Subetapa", "Ano/Série",
+    "Cód. Município", "Nome do Município",
+]
+MEDIDA = "Número de Matrículas"
+
+# Chave de metadados com a impressão digital do Parquet de origem
+CHAVE_ORIGEM = b"dashboard.origem_sha256"
+
+
+# ─── 2. FUNÇÕES UTIL ────────────────────────────────────────────────
+def impressao_digital(arquivo: str | Path) -> str:
+    """SHA-256 do conteúdo do arquivo (independe de mtime/checkout)."""
+    h = hashlib.sha256()
+    with open(arquivo, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _chave_alfabetica(texto: str | None) -> str:
+    """Chave de ordenação sem acentos/maiúsculas ("Água" junto de "Agrestina")."""
+    if texto is None:
+        return ""
+    decomposto = unicodedata.normalize("NFKD", texto.casefold())
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def arquivos_modalidade(pasta: str | Path = ".") -> list[Path]:
+    """Parquet de modalidade da pasta (exclui os arquivos auxiliares)."""
+    return sorted(
+        p for p in Path(pasta).glob("*.parquet")
+        if not p.name.endswith((SUFIXO_CUBO, SUFIXO_OTIMIZADO))
+    )
+
+
+def colunas_usadas(arquivo: str | Path) -> list[str]:
+    """Colunas do Parquet de origem que o dashboard carrega."""
+    colunas = list(COLUNAS_DASHBOARD)
+    # Adicionar coluna específica para Ensino Regular
+    if "Ensino Regular" in str(arquivo):
+        colunas.append("Ano/Série")
+    return colunas
+
+
+def _menor_inteiro(arr: pa.ChunkedArray, sem_sinal: bool = False) -> pa.ChunkedArray:
+    """Converte para o menor tipo inteiro que comporta os valores (downcast)."""
+    if len(arr) == 0 or arr.null_count == len(arr):
+        return arr
+    faixa = pc.min_max(arr).as_py()
+    tipos = ([pa.uint8(), pa.uint16(), pa.uint32(), pa.uint64()]
+             if sem_sinal and faixa["min"] >= 0
+             else [pa.int8(), pa.int16(), pa.int32(), pa.int64()])
+    for tipo in tipos:
+        info = np.iinfo(tipo.to_pandas_dtype())
+        if info.min <= faixa["min"] and faixa["max"] <= info.max:
+            return arr.cast(tipo)
+    return arr
+
+
+def converter_tipos(tabela: pa.Table) -> pa.Table:
+    """Converte as colunas para os dtypes compactos usados pelo dashboard.
+
+    Texto vira dicionário (com dicionário local; o dashboard ainda traduz
+    para os códigos globais do processo).
+    """
+    colunas = {}
+    for col in tabela.column_names:
+        arr = tabela[col]
+        if col == "Ano":
+            arr = _menor_inteiro(arr)
+        elif col == MEDIDA:
+            arr = _menor_inteiro(arr, sem_sinal=True)
+        elif col in ("Subetapa", "Ano/Série"):
+            # Importante: preencher nulos antes de virar category
+            arr = pc.fill_null(arr, "N/A").dictionary_encode()
+        else:
+            arr = arr.dictionary_encode()
+        colunas[col] = arr
+    return pa.table(colunas)
+
+
+def tabela_completa(arquivo: str | Path) -> pa.Table:
+    """Todas as linhas da modalidade, só com as colunas usadas (sem conversões).
+
+    Havendo cubo atualizado, as linhas de município saem dele. As de estado
+    (poucas centenas) vêm do próprio Parquet: a origem rotula algumas delas
+    de outro jeito que as escolas, e uma soma do cubo não reproduziria isso.
+    """
+    dataset = ds.dataset(arquivo, format="parquet")
+    colunas = colunas_usadas(arquivo)
+    cubo = ler_cubo(arquivo)
+    if cubo is None:
+        return dataset.to_table(columns=colunas)
+
+    escolas_estado = dataset.to_table(
+        columns=colunas, filter=ds.field("Nível de agregação").isin(["escola", "estado"])
+    )
+    # O cubo também traz dimensões que o dashboard não lê (Cód. Município)
+    return (pa.concat_tables([escolas_estado, municipios_do_cubo(cubo)],
+                             promote_options="default")
+            .select(escolas_estado.column_names))
+
+
+# ─── 3. CUBOS DE AGREGAÇÃO ──────────────────────────────────────────
+def caminho_cubo(arquivo: str | Path) -> Path:
+    """Arquivo do cubo, gravado ao lado do Parquet de origem."""
+    arquivo = Path(arquivo)
+    return arquivo.with_name(arquivo.name.removesuffix(".parquet") + SUFIXO_CUBO)
+
+
+def construir_cubo(arquivo: str | Path) -> pa.Table:
+    """Soma as matrículas das escolas por Ano × Rede × Etapa × Subetapa (× Série) × município."""
+    dataset = ds.dataset(arquivo, format="parquet")
+    dims = [c for c in DIMENSOES_CUBO if c in dataset.schema.names]
+
+    escolas = dataset.to_table(
+        columns=dims + [MEDIDA],
+        filter=ds.field("Nível de agregação") == "escola",
+    )
+    cubo = (
+        escolas.group_by(dims, use_threads=False)
+        .aggregate([(MEDIDA, "sum")])
+        .rename_columns({f"{MEDIDA}_sum": MEDIDA})
+        .select(dims + [MEDIDA])
+    )
+
+    # Municípios em ordem alfabética "humana", como no Parquet original
+    nomes = cubo["Nome do Município"].to_pylist()
+    ordem_nomes = {n: i for i, n in enumerate(sorted(set(nomes), key=_chave_alfabetica))}
+    cubo = cubo.append_column("_ordem", pa.array([ordem_nomes[n] for n in nomes]))
+    chaves = [c for c in dims if c not in ("Cód. Município", "Nome do Município")]
+    cubo = cubo.sort_by([(c, "ascending") for c in chaves + ["_ordem"]])
+    return cubo.drop_columns(["_ordem"])
+
+
+def salvar_cubo(arquivo: str | Path) -> Path:
+    """Gera o cubo de um Parquet de modalidade e o grava ao lado dele."""
+    cubo = construir_cubo(arquivo)
+    cubo = cubo.replace_schema_metadata({CHAVE_ORIGEM: impressao_digital(arquivo)})
+    destino = caminho_cubo(arquivo)
+    pq.write_table(cubo, destino, compression="zstd")
+    return destino
+
+
+def ler_cubo(arquivo: str | Path) -> pa.Table | None:
+    """Lê o cubo da modalidade; None se não existir ou estiver desatualizado."""
+    destino = caminho_cubo(arquivo)
+    if not destino.exists():
+        return None
+    metadados = pq.read_schema(destino).metadata or {}
+    if metadados.get(CHAVE_ORIGEM) != impressao_digital(arquivo).encode():
+        return None
+    return pq.read_table(destino)
+
+
+def municipios_do_cubo(cubo: pa.Table) -> pa.Table:
+    """Linhas do nível município reconstruídas a partir do cubo."""
+    return cubo.append_column(
+        "Nível de agregação", pa.array(["município"] * len(cubo), pa.string())
+    )
+
+
+def agregar_cubo(cubo: pa.Table, por: list[str]) -> pa.Table:
+    """Soma as matrículas do cubo (ou de linhas dele) pelas dimensões pedidas.
+
+    Como o cubo soma as escolas por todas as dimensões de filtro, qualquer
+    agrupamento por elas sai daqui sem tocar nas linhas de escola.
+    """
+    if not por:
+        return pa.table({MEDIDA: [pc.sum(cubo[MEDIDA]).as_py() or 0]})
+    return (
+        cubo.group_by(por, use_threads=False)
+        .aggregate([(MEDIDA, "sum")])
+        .rename_columns({f"{MEDIDA}_sum": MEDIDA})
+        .select(por + [MEDIDA])
+        .sort_by([(c, "ascending") for c in por])
+    )
+
+
+# ─── 4. PARQUET OTIMIZADO ───────────────────────────────────────────
+def caminho_otimizado(arquivo: str | Path) -> Path:
+    """Arquivo otimizado, gravado ao lado do Parquet de origem."""
+    arquivo = Path(arquivo)
+    return arquivo.with_name(arquivo.name.removesuffix(".parquet") + SUFIXO_OTIMIZADO)
+
+
+def caminho_manifesto(arquivo: str | Path) -> Path:
+    arquivo = Path(arquivo)
+    return arquivo.with_name(arquivo.name.removesuffix(".parquet") + SUFIXO_MANIFESTO)
+
+
+def otimizar(arquivo: str | Path, linhas_por_grupo: int = LINHAS_POR_GRUPO) -> Path:
+    """Regrava a modalidade já convertida, ordenada e em row groups menores.
+
+    O resultado tem exatamente as linhas que o dashboard carregaria (inclusive
+    o nível município do cubo, se houver), com os dtypes finais e texto em dicionário.
+    Ao lado fica um manifesto JSON com o min/max de cada row group.
+    """
+    tabela = tabela_completa(arquivo)
+    ordem = [c for c in ORDEM_OTIMIZADA if c in tabela.column_names]
+    tabela = converter_tipos(tabela.sort_by([(c, "ascending") for c in ordem]))
+
+    origem = impressao_digital(arquivo)
+    tabela = tabela.replace_schema_metadata({CHAVE_ORIGEM: origem})
+    destino = caminho_otimizado(arquivo)
+    pq.write_table(tabela, destino, row_group_size=linhas_por_grupo,
+                   compression="zstd", use_dictionary=True, write_statistics=True)
+
+    metadados = pq.read_metadata(destino)
+    posicao = {nome: i for i, nome in enumerate(metadados.schema.names)}
+    grupos = []
+    for g in range(metadados.num_row_groups):
+        grupo = metadados.row_group(g)
+        faixas = {}
+        for col in ordem:
+            estat = grupo.column(posicao[col]).statistics
+            if estat is not None and estat.has_min_max:
+                faixas[col] = [estat.min, estat.max]
+        grupos.append({"linhas": grupo.num_rows, "min_max": faixas})
+
+    caminho_manifesto(arquivo).write_text(json.dumps({
+        "origem_sha256": origem,
+        "versao": VERSAO_OTIMIZADO,
+        "ordem": ordem,
+        "linhas": metadados.num_rows,
+        "grupos": grupos,
+    }, ensure_ascii=False, indent=1), encoding="utf-8")
+    return destino
+
+
+def ler_manifesto(arquivo: str | Path) -> dict | None:
+    """Manifesto do Parquet otimizado; None se faltar algo ou estiver desatualizado."""
+    manifesto, destino = caminho_manifesto(arquivo), caminho_otimizado(arquivo)
+    if not (manifesto.exists() and destino.exists()):
+        return None
+    dados = json.loads(manifesto.read_text(encoding="utf-8"))
+    if dados.get("versao") != VERSAO_OTIMIZADO:
+        return None
+    if dados.get("origem_sha256") != impressao_digital(arquivo):
+        return None
+    return dados
+
+
+def grupos_relevantes(manifesto: dict, filtros: dict[str, tuple]) -> list[int]:
+    """Row groups cujo min/max pode conter algum dos valores pedidos por coluna."""
+    relevantes = []
+    for g, grupo in enumerate(manifesto["grupos"]):
+        faixas = grupo["min_max"]
+        if all(
+            col not in faixas or any(faixas[col][0] <= v <= faixas[col][1] for v in valores)
+            for col, valores in filtros.items() if valores
+        ):
+            relevantes.append(g)
+    return relevantes
+
+
+def ler_otimizado(arquivo: str | Path, filtros: dict[str, tuple] | None = None,
+                  colunas: list[str] | None = None) -> pa.Table | None:
+    """Lê o Parquet otimizado (só os row groups e colunas pedidos); None se não houver."""
+    manifesto = ler_manifesto(arquivo)
+    if manifesto is None:
+        return None
+    grupos = (grupos_relevantes(manifesto, filtros) if filtros
+              else range(len(manifesto["grupos"])))
+    arquivo_otimizado = pq.ParquetFile(caminho_otimizado(arquivo))
+    if colunas is not None:
+        colunas = [c for c in colunas if c in arquivo_otimizado.schema_arrow.names]
+    return arquivo_otimizado.read_row_groups(list(grupos), columns=colunas)
+
+
+# ─── 5. LINHA DE COMANDO ────────────────────────────────────────────
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_cubos = sub.add_parser("cubos", help="gera os cubos de agregação (*.cubo.parquet)")
+    p_cubos.add_argument("arquivos", nargs="*", type=Path)
+
+    p_otim = sub.add_parser("otimizar", help="gera o Parquet otimizado (*.otimizado.parquet)")
+    p_otim.add_argument("--linhas-por-grupo", type=int, default=LINHAS_POR_GRUPO)
+    p_otim.add_argument("arquivos", nargs="*", type=Path)
+
+    args = parser.parse_args(argv)
+    arquivos = args.arquivos or arquivos_modalidade()
+
+    if args.comando == "cubos":
+        for arquivo in arquivos:
+            destino = salvar_cubo(arquivo)
+            print(f"{arquivo.name} → {destino.name} ({pq.read_metadata(destino).num_rows} linhas)")
+    elif args.comando == "otimizar":
+        for arquivo in arquivos:
+            destino = otimizar(arquivo, args.linhas_por_grupo)
+            metadados = pq.read_metadata(destino)
+            print(f"{arquivo.name} → {destino.name} "
+                  f"({metadados.num_rows} linhas, {metadados.num_row_groups} row groups)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+# ─── PROCESSOS TRABALHADORES (filtro, busca e XLSX fora do GIL) ────
+"""Executa as etapas pesadas do dashboard num pool de processos.
+
+O Streamlit roda as sessões em threads de um único processo, então filtros,
+buscas e exportações de usuários simultâneos disputam o GIL. Aqui essas
+etapas vão para processos trabalhadores, que abrem as mesmas tabelas pelo
+cache Arrow mapeado em memória (dados.ler_modalidade): os dados ficam no
+page cache compartilhado e só parâmetros e posições de linhas trafegam.
+
+Uso (medição de vazão, threads × processos):
+    python processos.py medir [--processos 4] [--usuarios 32] [--consultas 10]
+                              [--modalidade "Ensino Regular"]
+"""
+import argparse
+import multiprocessing as mp
+import os
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+
+from dados import (
+    ARQ, MODALIDADES, ExportacaoCancelada, TabelaModalidade, filtrar_indices,
+    filtrar_texto, gerar_xlsx, ler_modalidade, montar_linhas, nivel_map,
+)
+
+# ─── 1. LADO DO TRABALHADOR ─────────────────────────────────────────
+# Tabelas abertas por este processo trabalhador (mapeadas do cache Arrow)
+_TABELAS: dict[str, TabelaModalidade] = {}
+_LOCK = threading.Lock()
+
+# Estado de uma exportação entre app e trabalhador: dois int64 num bloco de
+# memória compartilhada (linhas gravadas e pedido de cancelamento)
+_GRAVADAS, _CANCELAR = 0, 8
+
+
+def _iniciar(arquivos: list[str]) -> None:
+    """Inicializador do trabalhador: já abre as modalidades pedidas."""
+    for arquivo in arquivos:
+        _tabela(arquivo)
+
+
+def _tabela(arquivo: str) -> TabelaModalidade:
+    with _LOCK:
+        if arquivo not in _TABELAS:
+            _TABELAS[arquivo] = TabelaModalidade(ler_modalidade(arquivo))
+        return _TABELAS[arquivo]
+
+
+def _nivel(arquivo: str, nivel: str, linhas_nivel: int) -> TabelaModalidade:
+    """Tabela do trabalhador, conferindo que o nível tem as mesmas linhas do app.
+
+    As posições de linha só valem entre processos se os dois lados leram o
+    mesmo arquivo; uma origem trocada no meio do caminho vira erro explícito.
+    """
+    tabela = _tabela(arquivo)
+    inicio, fim = tabela.faixas.get(nivel, (0, 0))
+    if fim - inicio != linhas_nivel:
+        raise RuntimeError(
+            f"{arquivo} ({nivel}): {fim - inicio} linhas no trabalhador, "
+            f"{linhas_nivel} no app"
+        )
+    return tabela
+
+
+def tarefa_filtrar(arquivo: str, modalidade_key: str, nivel: str, linhas_nivel: int,
+                   anos, redes, filtros: dict) -> np.ndarray:
+    tabela = _nivel(arquivo, nivel, linhas_nivel)
+    motor = tabela.motor(nivel, MODALIDADES[modalidade_key].serie_col)
+    return filtrar_indices(motor, modalidade_key, anos, redes, filtros)
+
+
+def tarefa_texto(arquivo: str, nivel: str, linhas_nivel: int, linhas: np.ndarray,
+                 filtros: dict, colunas_fixas: dict) -> np.ndarray:
+    tabela = _nivel(arquivo, nivel, linhas_nivel)
+    return filtrar_texto(tabela.indice_texto(nivel), linhas, filtros, colunas_fixas)
+
+
+def tarefa_xlsx(arquivo: str, nivel: str, linhas_nivel: int, linhas: np.ndarray,
+                colunas: list[str], constantes: dict, destino: str,
+                estado: str | None = None) -> int:
+    """Grava o XLSX em `destino` (no disco, sem voltar pelo pipe); retorna as linhas.
+
+    `estado` é o nome do bloco compartilhado: a cada lote o trabalhador
+    publica as linhas gravadas e, se o app pediu, para com ExportacaoCancelada.
+    """
+    tabela = _nivel(arquivo, nivel, linhas_nivel)
+    df_export = montar_linhas(tabela.nivel(nivel), linhas, colunas, constantes)
+    bloco = shared_memory.SharedMemory(name=estado) if estado else None
+
+    def progresso(gravadas: int) -> None:
+        if struct.unpack_from("q", bloco.buf, _CANCELAR)[0]:
+            raise ExportacaoCancelada()
+        struct.pack_into("q", bloco.buf, _GRAVADAS, gravadas)
+
+    try:
+        with open(destino, "w+b") as f:
+            gerar_xlsx(df_export, f, progresso if bloco else None)
+    finally:
+        if bloco:
+            bloco.close()
+    return len(df_export)
+
+
+# ─── 2. LADO DO APP ─────────────────────────────────────────────────
+_LOCK_INICIO = threading.Lock()
+# Intervalo (s) entre leituras do progresso de uma exportação no trabalhador
+INTERVALO_PROGRESSO = 0.25
+
+
+class _ProcessoTrabalhador(mp.get_context("spawn").Process):
+    """Processo "spawn" que não reexecuta o script do app no filho.
+
+    O Streamlit registra o script (main.py) como módulo __main__, e o spawn
+    reimporta o __main__ do pai em cada filho: o dashboard inteiro rodaria
+    de novo. Durante a partida, este módulo faz o papel de __main__.
+    """
+
+    def start(self):
+        with _LOCK_INICIO:
+            principal = sys.modules["__main__"]
+            sys.modules["__main__"] = sys.modules[__name__]
+            try:
+                super().start()
+            finally:
+                sys.modules["__main__"] = principal
+
+
+class _ContextoTrabalhador(type(mp.get_context("spawn"))):
+    Process = _ProcessoTrabalhador
+
+
+class PoolTrabalhadores:
+    """Pool de processos que executa filtro, busca textual e XLSX.
+
+    Os processos são criados com "spawn" (o servidor do Streamlit tem
+    threads, e fork com threads pode travar) e cada um abre as modalidades
+    no início. As chamadas bloqueiam só a thread da sessão que as fez; as
+    demais sessões seguem rodando enquanto os trabalhadores calculam.
+    """
+
+    def __init__(self, processos: int, arquivos: list[str] | None = None):
+        self.processos = processos
+        self._executor = ProcessPoolExecutor(
+            max_workers=processos,
+            mp_context=_ContextoTrabalhador(),
+            initializer=_iniciar,
+            initargs=(list(arquivos or []),),
+        )
+
+    def filtrar(self, tabela: TabelaModalidade, arquivo: str, modalidade_key: str,
+                nivel: str, anos, redes, filtros: dict) -> np.ndarray:
+        return self._executor.submit(
+            tarefa_filtrar, arquivo, modalidade_key, nivel, self._linhas(tabela, nivel),
+            list(anos), list(redes), filtros,
+        ).result()
+
+    def filtrar_texto(self, tabela: TabelaModalidade, arquivo: str, nivel: str,
+                      linhas: np.ndarray, filtros: dict, colunas_fixas: dict) -> np.ndarray:
+        if not filtros:
+            return linhas
+        return self._executor.submit(
+            tarefa_texto, arquivo, nivel, self._linhas(tabela, nivel),
+            linhas, filtros, colunas_fixas,
+        ).result()
+
+    def gravar_xlsx(self, tabela: TabelaModalidade, arquivo: str, nivel: str,
+                    linhas: np.ndarray, colunas: list[str], constantes: dict,
+                    destino: str, progresso=None) -> int:
+        """Grava o XLSX direto em `destino`; retorna o número de linhas.
+
+        `progresso`, como nos geradores de dados.py, recebe as linhas já
+        gravadas pelo trabalhador. Se ele levantar (ex.: ExportacaoCancelada),
+        o trabalhador para no próximo lote e a exceção sobe daqui.
+        """
+        bloco = shared_memory.SharedMemory(create=True, size=16)
+        try:
+            futuro = self._executor.submit(
+                tarefa_xlsx, arquivo, nivel, self._linhas(tabela, nivel),
+                linhas, colunas, constantes, destino, bloco.name,
+            )
+            while True:
+                try:
+                    return futuro.result(timeout=INTERVALO_PROGRESSO)
+                except TimeoutError:
+                    pass
+                if progresso:
+                    try:
+                        progresso(struct.unpack_from("q", bloco.buf, _GRAVADAS)[0])
+                    except BaseException:
+                        # Avisa o trabalhador e espera ele largar o bloco e o destino
+                        struct.pack_into("q", bloco.buf, _CANCELAR, 1)
+                        futuro.cancel()
+                        wait((futuro,))
+                        raise
+        finally:
+            bloco.close()
+            bloco.unlink()
+
+    @staticmethod
+    def _linhas(tabela: TabelaModalidade, nivel: str) -> int:
+        inicio, fim = tabela.faixas.get(nivel, (0, 0))
+        return fim - inicio
+
+    def encerrar(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ─── 3. MEDIÇÃO DE VAZÃO ────────────────────────────────────────────
+def _consultas(tabela: TabelaModalidade, modalidade_key: str, nivel: str,
+               quantidade: int, semente: int) -> list[tuple]:
+    """Filtros aleatórios (anos, redes, busca por município) de um nível."""
+    rng = np.random.default_rng(semente)
+    opcoes = tabela.opcoes(nivel, MODALIDADES[modalidade_key].serie_col)
+    df = tabela.nivel(nivel)
+    municipios = (list(df["Nome do Município"].cat.categories[:50])
+                  if "Nome do Município" in df.columns else [])
+    consultas = []
+    for _ in range(quantidade):
+        anos = list(rng.choice(opcoes.anos, rng.integers(1, len(opcoes.anos) + 1), replace=False))
+        redes = list(rng.choice(opcoes.redes, rng.integers(1, len(opcoes.redes) + 1), replace=False))
+        busca = ({"Nome do Município": str(rng.choice(municipios))[:4]}
+                 if municipios and rng.random() < 0.5 else {})
+        consultas.append(([int(a) for a in anos], [str(r) for r in redes], busca))
+    return consultas
+
+
+def medir(processos: int, usuarios: int, consultas: int,
+          modalidade_key: str | None = None) -> dict:
+    """Vazão de `usuarios` threads simultâneas, no próprio processo e no pool."""
+    modalidade_key = modalidade_key or next(m for m in MODALIDADES if Path(ARQ[m]).exists())
+    arquivo, nivel = ARQ[modalidade_key], nivel_map["Escolas"]
+    tabela = TabelaModalidade(ler_modalidade(arquivo))
+    roteiro = [_consultas(tabela, modalidade_key, nivel, consultas, u) for u in range(usuarios)]
+    serie_col = MODALIDADES[modalidade_key].serie_col
+
+    def local(anos, redes, busca):
+        linhas = filtrar_indices(tabela.motor(nivel, serie_col), modalidade_key, anos, redes, {})
+        return filtrar_texto(tabela.indice_texto(nivel), linhas, busca, {})
+
+    pool = PoolTrabalhadores(processos, [arquivo])
+
+    def no_pool(anos, redes, busca):
+        linhas = pool.filtrar(tabela, arquivo, modalidade_key, nivel, anos, redes, {})
+        return pool.filtrar_texto(tabela, arquivo, nivel, linhas, busca, {})
+
+    # Aquece índices e trabalhadores antes de cronometrar
+    for funcao in (local, no_pool):
+        for _ in range(processos):
+            funcao(*roteiro[0][0])
+
+    resultado = {"modalidade": modalidade_key, "usuarios": usuarios,
+                 "consultas": usuarios * consultas, "processos": processos}
+    for nome, funcao in (("threads", local), ("pool", no_pool)):
+        def usuario(consultas_usuario):
+            for consulta in consultas_usuario:
+                funcao(*consulta)
+
+        threads = [threading.Thread(target=usuario, args=(r,)) for r in roteiro]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        resultado[f"{nome}_consultas_por_s"] = round(usuarios * consultas / (time.perf_counter() - t0), 1)
+    pool.encerrar()
+    return resultado
+
+
+# ─── 4. LINHA DE COMANDO ────────────────────────────────────────────
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_medir = sub.add_parser("medir", help="compara a vazão em threads e no pool")
+    p_medir.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    p_medir.add_argument("--usuarios", type=int, default=32)
+    p_medir.add_argument("--consultas", type=int, default=10, help="por usuário")
+    p_medir.add_argument("--modalidade", choices=list(MODALIDADES),
+                         help="padrão: a primeira com arquivo presente")
+
+    args = parser.parse_args(argv)
+    if args.comando == "medir":
+        print(medir(args.processos, args.usuarios, args.consultas, args.modalidade))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,494 @@
+# ─── RELATÓRIO DOS MUNICÍPIOS (index.html gerado) ──────────────────
+"""Gera o index.html ("Relatório dos Municípios") a partir dos Parquet.
+
+Usa as mesmas tabelas e os mesmos agregados de município do dashboard
+(dados.ler_modalidade, nível "município"); só a contagem de escolas lê o
+Parquet de origem, que ainda tem o "Cód. da Escola". A página leva os dados
+como JSON colunar compacto e uma tabela virtualizada: só as linhas visíveis
+viram DOM e a busca compara chaves já normalizadas, sem ler o texto das
+células.
+
+A impressão digital das origens fica gravada na página; sem mudança nos
+Parquet (nem no gerador), o arquivo não é reescrito.
+
+Uso:
+    python relatorio.py [--saida index.html] [--forcar] [arquivo.parquet ...]
+
+Sem arquivos, usa as modalidades de dados.MODALIDADES presentes na pasta.
+"""
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+from string import Template
+
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from dados import (
+    MODALIDADES, TabelaModalidade, format_number_br, ler_modalidade, nivel_map, normalizar_busca,
+)
+from preparar_dados import MEDIDA, impressao_digital
+
+# ─── 1. CONSTANTES ──────────────────────────────────────────────────
+# Sobe quando o formato do JSON, o modelo HTML ou as regras mudam
+VERSAO_GERADOR = "2"
+SAIDA_PADRAO = "index.html"
+REDE_TOTAL = "Pública e Privada"
+REDE_PUBLICA = "Pública (Federal, Estadual e Municipal)"
+META_ORIGEM = "dashboard-origem"
+NIVEL_MUNICIPIO = nivel_map["Municípios"]
+NIVEL_ESCOLA = nivel_map["Escolas"]
+
+
+# ─── 2. AGREGADOS POR MUNICÍPIO ─────────────────────────────────────
+def _mascara_total(tabela: TabelaModalidade, modalidade_key: str, nivel: str,
+                   redes: list[str]) -> np.ndarray:
+    """Linhas do total geral da modalidade (sem dupla contagem de etapas).
+
+    EJA e Profissional têm uma Etapa de total geral; no Ensino Regular o
+    total é a soma das linhas "... - Total" de cada etapa, como no filtro.
+    """
+    config = MODALIDADES[modalidade_key]
+    motor = tabela.motor(nivel, config.serie_col)
+    mascara = motor.mascara("Rede", redes)
+    totais = config.etapa_valores.get("totais", [])
+    return mascara & (motor.mascara("Etapa", totais[:1]) if totais else motor.mascara_total())
+
+
+def _por_municipio(tabela: TabelaModalidade, modalidade_key: str, rede: str,
+                   anos: list[int]) -> pd.DataFrame:
+    """Matrículas (município × ano) do total geral da modalidade numa rede."""
+    df = tabela.nivel(NIVEL_MUNICIPIO)
+    linhas = np.flatnonzero(
+        _mascara_total(tabela, modalidade_key, NIVEL_MUNICIPIO, [rede])
+        & df["Ano"].isin(anos).to_numpy()
+    )
+    sub = df.iloc[linhas]
+    soma = (sub.groupby(["Nome do Município", "Ano"], observed=True)[MEDIDA]
+            .sum().unstack("Ano").reindex(columns=anos))
+    # Índice de texto: os dicionários de categoria variam entre modalidades
+    soma.index = soma.index.astype(str)
+    return soma
+
+
+def _escolas_por_municipio(arquivo: Path, modalidade_key: str, ano: int) -> pd.DataFrame:
+    """Escolas (município, código) com matrícula no ano, para contar escolas.
+
+    Sai do Parquet de origem: as tabelas do dashboard não trazem o
+    "Cód. da Escola", e escolas homônimas no mesmo município são distintas.
+    """
+    dataset = ds.dataset(arquivo, format="parquet")
+    colunas = ["Nome do Município", "Cód. da Escola"]
+    if not set(colunas) <= set(dataset.schema.names):
+        return pd.DataFrame(columns=colunas)
+    totais = MODALIDADES[modalidade_key].etapa_valores.get("totais", [])
+    filtro = ((ds.field("Nível de agregação") == NIVEL_ESCOLA) & (ds.field("Ano") == ano)
+              & (ds.field(MEDIDA) > 0))
+    # Mesmas linhas de total geral de _mascara_total
+    filtro &= (ds.field("Etapa") == totais[0] if totais
+               else pc.match_substring(ds.field("Subetapa"), "Total"))
+    return dataset.to_table(columns=colunas, filter=filtro).to_pandas()
+
+
+def agregar(tabelas: dict[str, TabelaModalidade],
+            arquivos: dict[str, Path]) -> tuple[pd.DataFrame, int]:
+    """Uma linha por município com matrículas do último ano e indicadores.
+
+    `arquivos` são os Parquet de origem, de onde sai a contagem de escolas.
+
+    Retorna o DataFrame e o ano de referência (o mais recente em comum).
+    """
+    ano = min(int(t.nivel(NIVEL_MUNICIPIO)["Ano"].max()) for t in tabelas.values())
+    anos = [ano - 1, ano]
+
+    colunas, totais, publicas, escolas = {}, [], [], []
+    for modalidade_key, tabela in tabelas.items():
+        total = _por_municipio(tabela, modalidade_key, REDE_TOTAL, anos)
+        colunas[modalidade_key] = total[ano]
+        totais.append(total)
+        publicas.append(_por_municipio(tabela, modalidade_key, REDE_PUBLICA, [ano])[ano])
+        escolas.append(_escolas_por_municipio(arquivos[modalidade_key], modalidade_key, ano))
+
+    relatorio = pd.DataFrame(colunas)
+    soma = pd.concat(totais).groupby(level=0).sum(min_count=1)
+    publica = pd.concat(publicas).groupby(level=0).sum(min_count=1)
+    relatorio["Total"] = soma[ano]
+    anterior = soma[ano - 1].where(soma[ano - 1] > 0)
+    relatorio["Variação (%)"] = (soma[ano] / anterior - 1) * 100
+    relatorio["Rede pública (%)"] = publica.reindex(relatorio.index) / soma[ano].where(soma[ano] > 0) * 100
+    pares = pd.concat(escolas).drop_duplicates()
+    relatorio["Escolas"] = (pares["Nome do Município"].value_counts()
+                            .reindex(relatorio.index).fillna(0).astype(int))
+
+    # Ordem alfabética "humana" (sem acento), como no dashboard
+    relatorio = relatorio.loc[sorted(relatorio.index, key=normalizar_busca)]
+    relatorio.index.name = "Município"
+    return relatorio.reset_index(), ano
+
+
+# ─── 3. DADOS COMPACTOS PARA A PÁGINA ───────────────────────────────
+def _coluna_json(s: pd.Series, casas: int | None) -> list:
+    """Valores da coluna como lista JSON (inteiros ou arredondados, nulo = None)."""
+    valores = s.to_numpy(dtype=float, na_value=np.nan)
+    if casas is None:
+        return [None if np.isnan(v) else int(v) for v in valores]
+    return [None if np.isnan(v) else round(float(v), casas) for v in valores]
+
+
+def dados_pagina(relatorio: pd.DataFrame, ano: int) -> dict:
+    """JSON colunar: uma lista por coluna, mais as chaves de busca e tendência.
+
+    `chaves` já vem normalizada (minúsculas, sem acento) e `tendencia`
+    (1 cresce, -1 cai, 0 estável/sem base) indexa o filtro da página.
+    """
+    formatos = {"Variação (%)": ("pct_sinal", 1), "Rede pública (%)": ("pct", 1)}
+    colunas, tipos, valores = [], [], []
+    for col in relatorio.columns:
+        colunas.append(col)
+        if col == "Município":
+            tipos.append("texto")
+            valores.append(relatorio[col].tolist())
+            continue
+        tipo, casas = formatos.get(col, ("inteiro", None))
+        tipos.append(tipo)
+        valores.append(_coluna_json(relatorio[col], casas))
+    variacao = relatorio["Variação (%)"].fillna(0).to_numpy()
+    return {
+        "ano": ano,
+        "colunas": colunas,
+        "tipos": tipos,
+        "valores": valores,
+        "chaves": [normalizar_busca(m) for m in relatorio["Município"]],
+        "tendencia": np.sign(np.round(variacao, 1)).astype(int).tolist(),
+    }
+
+
+def json_compacto(dados: dict) -> str:
+    """JSON sem espaços, seguro dentro de <script> (sem "</")."""
+    texto = json.dumps(dados, ensure_ascii=False, separators=(",", ":"))
+    return texto.replace("</", "<\\/")
+
+
+def _estatisticas(relatorio: pd.DataFrame) -> list[tuple[str, str]]:
+    total = relatorio["Total"].sum()
+    publica = (relatorio["Total"] * relatorio["Rede pública (%)"] / 100).sum()
+    percentual = publica / total * 100 if total else 0.0
+    return [
+        ("Municípios", format_number_br(len(relatorio))),
+        ("Matrículas", format_number_br(total)),
+        ("Em crescimento", format_number_br((relatorio["Variação (%)"] > 0).sum())),
+        ("Rede pública", f"{percentual:.1f}%".replace(".", ",")),
+    ]
+
+
+# ─── 4. MODELO HTML ─────────────────────────────────────────────────
+# string.Template ($nome): o CSS e o JS não usam "$"
+MODELO = Template("""<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <meta name="$meta" content="$origem">
+    <title>$titulo</title>
+    <style>
+        *{box-sizing:border-box;margin:0;padding:0}
+        body{font-family:Arial,sans-serif;background:#f5f5f5;color:#333}
+        .container{max-width:1200px;margin:0 auto;padding:20px;background:white}
+        .header{text-align:center;margin-bottom:20px;padding:15px;border-bottom:3px solid #2c5aa0}
+        .header h1{color:#2c5aa0;font-size:1.8em;margin-bottom:5px}
+        .stats{display:grid;grid-template-columns:repeat(auto-fit,minmax(150px,1fr));gap:10px;margin-bottom:20px}
+        .stat{background:linear-gradient(135deg,#2c5aa0,#3d6bb0);color:white;padding:10px;border-radius:5px;text-align:center}
+        .stat h3{font-size:0.8em;margin-bottom:5px}
+        .stat .num{font-size:1.5em;font-weight:bold}
+        .filters{margin-bottom:15px;padding:10px;background:#f9f9f9;border-radius:5px}
+        .filters input,.filters select{padding:5px;margin:0 5px;border:1px solid #ddd;border-radius:3px}
+        .filters .contagem{float:right;color:#666;font-size:0.9em;line-height:28px}
+        .table-container{background:white;border-radius:5px;overflow:hidden;box-shadow:0 2px 5px rgba(0,0,0,0.1)}
+        .table-scroll{height:500px;overflow:auto}
+        .tabela{width:100%;border-collapse:collapse;font-size:12px;table-layout:fixed}
+        .tabela th{background:#2c5aa0;color:white;padding:8px 6px;position:sticky;top:0;z-index:10;cursor:pointer;user-select:none}
+        .tabela th.asc::after{content:" \\25B2"}
+        .tabela th.desc::after{content:" \\25BC"}
+        .tabela td{height:28px;padding:0 6px;border-bottom:1px solid #eee;white-space:nowrap;overflow:hidden;text-overflow:ellipsis}
+        .tabela td.num{text-align:right}
+        .tabela tr.par{background:#fafafa}
+        .tabela tr:hover{background:#f8f9fa}
+        .tabela tr.espaco td{padding:0;border:0}
+        .positivo{color:#28a745;font-weight:bold}
+        .negativo{color:#dc3545;font-weight:bold}
+        .footer{margin-top:20px;text-align:center;color:#666;font-size:0.9em;padding-top:15px;border-top:1px solid #eee}
+        @media (max-width:768px){.tabela{font-size:10px}.filters{text-align:center}.filters input,.filters select{margin:2px;width:100px}}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>📊 $titulo</h1>
+            <p>$subtitulo</p>
+        </div>
+
+        <div class="stats">
+$estatisticas
+        </div>
+
+        <div class="filters">
+            🔍 <input type="text" id="busca" placeholder="Buscar município...">
+            📈 <select id="tendencia"><option value="">Todas tendências</option><option value="1">Crescimento</option><option value="-1">Queda</option><option value="0">Estável</option></select>
+            <span class="contagem" id="contagem"></span>
+        </div>
+
+        <div class="table-container">
+            <div class="table-scroll" id="rolagem">
+                <table class="tabela" id="tabela-municipios">
+                    <thead><tr>$cabecalho</tr></thead>
+                    <tbody></tbody>
+                </table>
+            </div>
+        </div>
+
+        <div class="footer">
+            <p>📅 Relatório gerado em $gerado</p>
+            <p><strong>Fonte: Censo Escolar (INEP) · Dashboard Educacional de Pernambuco</strong></p>
+        </div>
+    </div>
+
+    <script type="application/json" id="dados">$dados</script>
+    <script>
+        (function(){
+            const D=JSON.parse(document.getElementById('dados').textContent);
+            const ALTURA=28, FOLGA=10;
+            const n=D.chaves.length, ncol=D.colunas.length;
+            const rolagem=document.getElementById('rolagem');
+            const corpo=document.querySelector('#tabela-municipios tbody');
+            const cabecalhos=document.querySelectorAll('#tabela-municipios th');
+            const busca=document.getElementById('busca');
+            const tendencia=document.getElementById('tendencia');
+            const contagem=document.getElementById('contagem');
+
+            // Células já formatadas, uma vez só: a rolagem só concatena texto
+            const inteiro=new Intl.NumberFormat('pt-BR');
+            const decimal=new Intl.NumberFormat('pt-BR',{minimumFractionDigits:1,maximumFractionDigits:1});
+            function escapar(t){return String(t).replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;');}
+            const celulas=D.valores.map(function(col,c){
+                const tipo=D.tipos[c];
+                return col.map(function(v){
+                    if(v===null)return '<td class="num">–</td>';
+                    if(tipo==='texto')return '<td title="'+escapar(v)+'">'+escapar(v)+'</td>';
+                    if(tipo==='inteiro')return '<td class="num">'+inteiro.format(v)+'</td>';
+                    if(tipo==='pct')return '<td class="num">'+decimal.format(v)+'%</td>';
+                    const classe=v>0?'num positivo':v<0?'num negativo':'num';
+                    return '<td class="'+classe+'">'+(v>0?'+':'')+decimal.format(v)+'%</td>';
+                });
+            });
+            const linhasHtml=new Array(n);
+            function linha(i,pos){
+                if(linhasHtml[i]===undefined){
+                    let h='';
+                    for(let c=0;c<ncol;c++)h+=celulas[c][i];
+                    linhasHtml[i]=h;
+                }
+                return '<tr'+(pos%2?' class="par"':'')+'>'+linhasHtml[i]+'</tr>';
+            }
+
+            // Ordens por coluna, calculadas no primeiro clique e reaproveitadas
+            const ordens={};
+            let ordem=Int32Array.from({length:n},function(_,i){return i;});
+            let visiveis=ordem;
+            function ordenar(c,desc){
+                const k=c+(desc?'d':'a');
+                if(!ordens[k]){
+                    const col=D.valores[c], chaves=D.tipos[c]==='texto'?D.chaves:null;
+                    const o=Int32Array.from({length:n},function(_,i){return i;});
+                    o.sort(function(a,b){
+                        const x=chaves?chaves[a]:col[a], y=chaves?chaves[b]:col[b];
+                        if(x===y)return a-b;
+                        if(x===null)return 1;
+                        if(y===null)return -1;
+                        return (x<y?-1:1)*(desc?-1:1);
+                    });
+                    ordens[k]=o;
+                }
+                return ordens[k];
+            }
+
+            function normalizar(t){return t.normalize('NFKD').replace(/[\\u0300-\\u036f]/g,'').toLowerCase();}
+            function filtrar(){
+                const q=normalizar(busca.value.trim());
+                const t=tendencia.value===''?null:Number(tendencia.value);
+                if(!q&&t===null){visiveis=ordem;}
+                else{
+                    const saida=new Int32Array(n);
+                    let m=0;
+                    for(let p=0;p<n;p++){
+                        const i=ordem[p];
+                        if((t===null||D.tendencia[i]===t)&&(!q||D.chaves[i].includes(q)))saida[m++]=i;
+                    }
+                    visiveis=saida.subarray(0,m);
+                }
+                contagem.textContent='Exibindo '+inteiro.format(visiveis.length)+' de '+inteiro.format(n)+' municípios';
+                rolagem.scrollTop=0;
+                desenhar();
+            }
+
+            // Tabela virtualizada: espaçadores acima/abaixo e só as linhas na tela
+            let pedido=0;
+            function desenhar(){
+                pedido=0;
+                const total=visiveis.length;
+                const inicio=Math.max(0,Math.floor(rolagem.scrollTop/ALTURA)-FOLGA);
+                const fim=Math.min(total,inicio+Math.ceil(rolagem.clientHeight/ALTURA)+2*FOLGA);
+                let h='<tr class="espaco"><td colspan="'+ncol+'" style="height:'+(inicio*ALTURA)+'px"></td></tr>';
+                for(let p=inicio;p<fim;p++)h+=linha(visiveis[p],p);
+                h+='<tr class="espaco"><td colspan="'+ncol+'" style="height:'+((total-fim)*ALTURA)+'px"></td></tr>';
+                corpo.innerHTML=h;
+            }
+            function agendar(){if(!pedido)pedido=requestAnimationFrame(desenhar);}
+
+            let agendado=0;
+            busca.addEventListener('input',function(){
+                cancelAnimationFrame(agendado);
+                agendado=requestAnimationFrame(filtrar);
+            });
+            tendencia.addEventListener('change',filtrar);
+            rolagem.addEventListener('scroll',agendar,{passive:true});
+            window.addEventListener('resize',agendar);
+            cabecalhos.forEach(function(th,c){
+                th.addEventListener('click',function(){
+                    const desc=th.classList.contains('asc');
+                    cabecalhos.forEach(function(o){o.classList.remove('asc','desc');});
+                    th.classList.add(desc?'desc':'asc');
+                    ordem=ordenar(c,desc);
+                    filtrar();
+                });
+            });
+            filtrar();
+        })();
+    </script>
+</body>
+</html>
+""")
+
+
+def montar_html(relatorio: pd.DataFrame, ano: int, origem: str) -> str:
+    """Página completa: estatísticas e cabeçalho no HTML, linhas no JSON."""
+    estatisticas = "\n".join(
+        f'            <div class="stat">\n'
+        f'                <h3>{html.escape(rotulo)}</h3>\n'
+        f'                <div class="num">{html.escape(valor)}</div>\n'
+        f'            </div>'
+        for rotulo, valor in _estatisticas(relatorio)
+    )
+    titulo = f"Relatório dos {len(relatorio)} Municípios"
+    return MODELO.substitute(
+        meta=META_ORIGEM,
+        origem=origem,
+        titulo=html.escape(titulo),
+        subtitulo=html.escape(
+            f"Matrículas {ano} | variação sobre {ano - 1} | "
+            + " · ".join(c for c in relatorio.columns[1:] if c in MODALIDADES)
+        ),
+        estatisticas=estatisticas,
+        cabecalho="".join(f"<th>{html.escape(c)}</th>" for c in relatorio.columns),
+        gerado=time.strftime("%d/%m/%Y às %H:%M"),
+        dados=json_compacto(dados_pagina(relatorio, ano)),
+    )
+
+
+# ─── 5. GERAÇÃO INCREMENTAL ─────────────────────────────────────────
+def impressao_origens(arquivos: dict[str, Path]) -> str:
+    """SHA-256 do conteúdo das origens e da versão do gerador (e do modelo)."""
+    h = hashlib.sha256(VERSAO_GERADOR.encode())
+    h.update(MODELO.template.encode())
+    for modalidade_key, arquivo in sorted(arquivos.items()):
+        h.update(f"{modalidade_key}={impressao_digital(arquivo)};".encode())
+    return h.hexdigest()
+
+
+def impressao_gravada(saida: str | Path) -> str | None:
+    """Impressão digital gravada numa página já gerada (None se não houver)."""
+    try:
+        with open(saida, encoding="utf-8") as f:
+            cabecalho = f.read(4096)
+    except FileNotFoundError:
+        return None
+    achado = re.search(rf'<meta name="{META_ORIGEM}" content="([0-9a-f]+)">', cabecalho)
+    return achado.group(1) if achado else None
+
+
+def _modalidades(arquivos: list[Path] | None) -> dict[str, Path]:
+    """Modalidades a usar: as pedidas (pelo arquivo) ou todas as presentes."""
+    if not arquivos:
+        return {k: Path(m.arquivo) for k, m in MODALIDADES.items() if Path(m.arquivo).exists()}
+    por_nome = {Path(m.arquivo).name: k for k, m in MODALIDADES.items()}
+    escolhidas = {}
+    for arquivo in arquivos:
+        if arquivo.name not in por_nome:
+            raise ValueError(f"{arquivo} não é o Parquet de uma modalidade")
+        escolhidas[por_nome[arquivo.name]] = arquivo
+    return escolhidas
+
+
+def gerar(saida: str | Path = SAIDA_PADRAO, arquivos: list[Path] | None = None,
+          forcar: bool = False) -> bool:
+    """Gera a página; retorna False se ela já estava atualizada.
+
+    A escrita é atômica (temporário + os.replace), então um servidor que
+    esteja entregando o arquivo nunca vê uma página pela metade.
+    """
+    modalidades = _modalidades(arquivos)
+    if not modalidades:
+        raise ValueError("Nenhum Parquet de modalidade encontrado")
+    origem = impressao_origens(modalidades)
+    if not forcar and impressao_gravada(saida) == origem:
+        return False
+
+    # Ordem de MODALIDADES, para as colunas saírem sempre na mesma sequência
+    tabelas = {k: TabelaModalidade(ler_modalidade(str(modalidades[k])))
+               for k in MODALIDADES if k in modalidades}
+    relatorio, ano = agregar(tabelas, modalidades)
+    pagina = montar_html(relatorio, ano, origem)
+
+    saida = Path(saida)
+    fd, temporario = tempfile.mkstemp(prefix=".relatorio-", dir=saida.parent or ".")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="\n") as f:
+            f.write(pagina)
+        os.chmod(temporario, 0o644)
+        os.replace(temporario, saida)
+    except BaseException:
+        Path(temporario).unlink(missing_ok=True)
+        raise
+    return True
+
+
+# ─── 6. LINHA DE COMANDO ────────────────────────────────────────────
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--saida", type=Path, default=Path(SAIDA_PADRAO))
+    parser.add_argument("--forcar", action="store_true",
+                        help="regera mesmo sem mudança nas origens")
+    parser.add_argument("arquivos", nargs="*", type=Path)
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    try:
+        gerado = gerar(args.saida, args.arquivos, args.forcar)
+    except ValueError as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    situacao = "gerado" if gerado else "já atualizado"
+    print(f"{args.saida}: {situacao} em {time.perf_counter() - inicio:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Dados sintéticos para os testes da camada de dados e da API (sem Streamlit)."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from dados import MODALIDADES  # noqa: E402
+
+REDES = ["Estadual", "Municipal", "Privada", "Pública e Privada"]
+MUNICIPIOS = ["Recife", "Olinda", "Caruaru", "São José do Egito", "Jaboatão dos Guararapes"]
+
+# Etapa → subetapas usadas nas linhas sintéticas de cada modalidade
+ETAPAS = {
+    "Ensino Regular": {
+        "Educação Infantil": ["Creche", "Pré-Escola", "Educação Infantil - Total"],
+        "Ensino Fundamental": ["Anos Iniciais", "Anos Finais", "Ensino Fundamental - Total"],
+        "Ensino Médio": ["Propedêutico", "Normal/Magistério", "Ensino Médio - Total"],
+    },
+    "EJA - Educação de Jovens e Adultos": {
+        "EJA - Total": ["N/A"],
+        "EJA Ensino Fundamental": ["EJA Anos Iniciais", "EJA Anos Finais"],
+        "EJA Ensino Fundamental - Total": ["N/A"],
+        "EJA Ensino Médio": ["EJA Ensino Médio - Curso FIC",
+                             "EJA Ensino Médio - Sem componente profissionalizante"],
+        "EJA Ensino Médio - Total": ["N/A"],
+    },
+    "Educação Profissional": {
+        "Educação Profissional - Total": ["N/A"],
+        "Formação Inicial Continuada (FIC)": ["Curso FIC Concomitante",
+                                              "Formação Inicial Continuada (FIC) - Total"],
+        "Educação profissional técnica de nível médio": ["Curso técnico - Subsequente",
+                                                         "Curso técnico - Concomitante"],
+    },
+}
+SERIES = ["1º Ano", "2º Ano", "3ª Série", "N/A"]
+
+
+def linhas_escola(modalidade_key: str, quantidade: int = 3000, semente: int = 0) -> pd.DataFrame:
+    """Linhas de escola sorteadas, com os dtypes das tabelas do dashboard."""
+    rng = np.random.default_rng(semente)
+    etapas = ETAPAS[modalidade_key]
+    pares = [(e, s) for e, subs in etapas.items() for s in subs]
+    escolhidos = rng.integers(len(pares), size=quantidade)
+    municipios = rng.choice(MUNICIPIOS, quantidade)
+    df = pd.DataFrame({
+        "Ano": rng.choice([2022, 2023, 2024], quantidade).astype(np.int16),
+        "Nome do Município": municipios,
+        "Nome da Escola": [f"ESCOLA {i % 40} DE {m.upper()}"
+                           for i, m in zip(rng.integers(400, size=quantidade), municipios)],
+        "Etapa": [pares[i][0] for i in escolhidos],
+        "Subetapa": [pares[i][1] for i in escolhidos],
+        "Rede": rng.choice(REDES, quantidade),
+        "Número de Matrículas": rng.integers(0, 3000, quantidade).astype(np.uint32),
+    })
+    serie_col = MODALIDADES[modalidade_key].serie_col
+    if serie_col:
+        df.insert(5, serie_col, rng.choice(SERIES, quantidade))
+    for col in df.columns:
+        if df[col].dtype == object or pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].astype("category")
+    return df
+
+
+@pytest.fixture
+def pasta_eja(tmp_path) -> Path:
+    """Pasta com um Parquet de EJA no esquema de origem (escola, município, estado)."""
+    modalidade_key = "EJA - Educação de Jovens e Adultos"
+    escolas = linhas_escola(modalidade_key, quantidade=600, semente=7).astype(
+        {"Nome do Município": str, "Nome da Escola": str, "Etapa": str,
+         "Subetapa": str, "Rede": str}
+    )
+    codigos = {m: 2600000 + i for i, m in enumerate(MUNICIPIOS)}
+    escolas["Cód. Município"] = escolas["Nome do Município"].map(codigos).astype(float)
+    escolas["Cód. da Escola"] = (escolas["Nome da Escola"].factorize()[0] + 26100000).astype(float)
+    escolas["Número de Matrículas"] = escolas["Número de Matrículas"].astype(np.int64)
+    escolas["Ano"] = escolas["Ano"].astype(np.int64)
+
+    dims = ["Ano", "Rede", "Etapa", "Subetapa"]
+    municipios = (escolas.groupby(dims + ["Cód. Município", "Nome do Município"], as_index=False)
+                  ["Número de Matrículas"].sum())
+    estado = escolas.groupby(dims, as_index=False)["Número de Matrículas"].sum()
+    partes = []
+    for nivel, df in (("escola", escolas), ("município", municipios), ("estado", estado)):
+        partes.append(df.assign(**{"Nível de agregação": nivel}))
+    origem = pd.concat(partes, ignore_index=True)
+    colunas = ["Nível de agregação", "Ano", "Cód. Município", "Nome do Município",
+               "Cód. da Escola", "Nome da Escola", "Etapa", "Subetapa", "Rede",
+               "Número de Matrículas"]
+    pq.write_table(pa.Table.from_pandas(origem[colunas], preserve_index=False),
+                   tmp_path / MODALIDADES[modalidade_key].arquivo)
+    return tmp_path
@@ -0,0 +1,143 @@
+"""Rotas da API de consulta sobre um Parquet de EJA sintético."""
+import json
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from api import TIPO_ARROW, ServicoConsulta, carregador_local
+from dados import ARQ
+from preparar_dados import salvar_cubo
+
+EJA = "EJA - Educação de Jovens e Adultos"
+
+
+def criar_servico(pasta) -> ServicoConsulta:
+    return ServicoConsulta(carregador_local(pasta), pasta=pasta)
+
+
+def pedir(servico, rota, formato="json", **parametros):
+    """Resposta JSON já decodificada (status, corpo)."""
+    parametros = {k: v if isinstance(v, list) else [str(v)] for k, v in parametros.items()}
+    status, tipo, cabecalhos, corpo = servico.responder(rota, parametros, formato)
+    if formato == "arrow" and status == 200:
+        return status, cabecalhos, pa.ipc.open_stream(corpo).read_all()
+    return status, json.loads(corpo)
+
+
+@pytest.fixture
+def origem(pasta_eja) -> pd.DataFrame:
+    return pd.read_parquet(pasta_eja / ARQ[EJA])
+
+
+def esperado_escolas(origem, anos, redes=None, etapas=None) -> pd.DataFrame:
+    df = origem[(origem["Nível de agregação"] == "escola") & origem["Ano"].isin(anos)]
+    if redes:
+        df = df[df["Rede"].isin(redes)]
+    if etapas:
+        df = df[df["Etapa"].isin(etapas)]
+    return df
+
+
+def test_modalidades_lista_apenas_arquivos_presentes(pasta_eja):
+    status, corpo = pedir(criar_servico(pasta_eja), "/modalidades")
+    assert status == 200
+    assert list(corpo) == [EJA]
+    assert corpo[EJA]["niveis"]["Escolas"][:3] == ["Ano", "Nome do Município", "Nome da Escola"]
+
+
+def test_consulta_pagina_os_resultados(pasta_eja, origem):
+    servico = criar_servico(pasta_eja)
+    esperado = esperado_escolas(origem, [2023, 2024], ["Estadual", "Municipal"])
+    vistos = []
+    paginas = -(-len(esperado) // 40)
+    for pagina in range(1, paginas + 1):
+        status, corpo = pedir(servico, "/consulta", modalidade=EJA, nivel="Escolas",
+                              ano=["2023", "2024"], rede=["Estadual", "Municipal"],
+                              pagina=pagina, por_pagina=40)
+        assert status == 200
+        assert (corpo["total"], corpo["pagina"], corpo["paginas"]) == (len(esperado), pagina, paginas)
+        assert corpo["colunas"] == ["Ano", "Nome do Município", "Nome da Escola", "Etapa",
+                                    "Subetapa", "Rede", "Número de Matrículas"]
+        vistos.append(pd.DataFrame(corpo["dados"]))
+    obtido = pd.concat(vistos, ignore_index=True)
+    assert len(obtido) == len(esperado)
+    assert obtido["Número de Matrículas"].sum() == esperado["Número de Matrículas"].sum()
+    assert sorted(obtido["Nome da Escola"]) == sorted(esperado["Nome da Escola"])
+
+
+def test_consulta_pagina_fora_do_intervalo_vai_para_a_ultima(pasta_eja):
+    status, corpo = pedir(criar_servico(pasta_eja), "/consulta", modalidade=EJA,
+                          nivel="escola", pagina=999, por_pagina=100)
+    assert status == 200
+    assert corpo["pagina"] == corpo["paginas"]
+
+
+def test_consulta_com_etapa_e_busca(pasta_eja, origem):
+    servico = criar_servico(pasta_eja)
+    status, corpo = pedir(servico, "/consulta", modalidade=EJA, nivel="Escolas", ano=2024,
+                          **{"busca.Cód. da Escola": "26100001"})
+    assert status == 400
+    assert "busca" in corpo["erro"]
+
+    status, corpo = pedir(servico, "/consulta", modalidade=EJA, nivel="Escolas", ano=2024,
+                          etapa="EJA Ensino Médio", por_pagina=10_000,
+                          **{"busca.Nome do Município": "sao jose"})
+    esperado = esperado_escolas(origem, [2024], etapas=["EJA Ensino Médio"])
+    esperado = esperado[esperado["Nome do Município"] == "São José do Egito"]
+    assert status == 200
+    assert corpo["total"] == len(esperado) > 0
+    assert set(corpo["dados"]["Nome do Município"]) == {"São José do Egito"}
+
+
+def test_consulta_em_arrow_leva_meta_nos_cabecalhos(pasta_eja):
+    servico = criar_servico(pasta_eja)
+    parametros = dict(modalidade=EJA, nivel="Municípios", ano=2023, por_pagina=25)
+    _, json_corpo = pedir(servico, "/consulta", **parametros)
+    status, cabecalhos, tabela = pedir(servico, "/consulta", "arrow", **parametros)
+    assert status == 200
+    assert cabecalhos == {"X-Total": json_corpo["total"], "X-Pagina": 1,
+                          "X-Paginas": json_corpo["paginas"]}
+    assert tabela.column_names == json_corpo["colunas"]
+    assert tabela.to_pydict() == json_corpo["dados"]
+    assert servico.responder("/consulta", {k: [str(v)] for k, v in parametros.items()},
+                             "arrow")[1] == TIPO_ARROW
+
+
+@pytest.mark.parametrize("rota, parametros, status", [
+    ("/inexistente", {}, 404),
+    ("/consulta", {"nivel": "Escolas"}, 400),
+    ("/consulta", {"modalidade": "Ensino Superior", "nivel": "Escolas"}, 400),
+    ("/consulta", {"modalidade": EJA, "nivel": "Bairros"}, 400),
+    ("/consulta", {"modalidade": EJA, "nivel": "Escolas", "ano": "dois mil"}, 400),
+    ("/consulta", {"modalidade": EJA, "nivel": "Escolas", "pagina": "x"}, 400),
+    ("/agregado", {"modalidade": EJA, "nivel": "Escolas", "por": "Número de Matrículas"}, 400),
+])
+def test_parametros_invalidos(pasta_eja, rota, parametros, status):
+    obtido, corpo = pedir(criar_servico(pasta_eja), rota, **parametros)
+    assert obtido == status
+    assert "erro" in corpo
+
+
+@pytest.mark.parametrize("nivel", ["Escolas", "Municípios", "Pernambuco"])
+@pytest.mark.parametrize("por", [[], ["Rede"], ["Ano", "Etapa"], ["Nome do Município", "Subetapa"]])
+def test_agregado_pelo_cubo_igual_ao_das_linhas(pasta_eja, nivel, por):
+    sem_cubo = criar_servico(pasta_eja)
+    parametros = dict(modalidade=EJA, nivel=nivel, ano=["2022", "2024"], rede="Estadual",
+                      etapa="EJA Ensino Fundamental", subetapa="EJA Anos Finais", por=por)
+    status, esperado = pedir(sem_cubo, "/agregado", **parametros)
+    if nivel == "Pernambuco" and "Nome do Município" in por:
+        assert status == 400
+        return
+    assert status == 200
+
+    salvar_cubo(pasta_eja / ARQ[EJA])
+    com_cubo = criar_servico(pasta_eja)
+    _, obtido = pedir(com_cubo, "/agregado", **parametros)
+    assert com_cubo._cubo(EJA) is not None
+
+    def ordenado(corpo):
+        return pd.DataFrame(corpo["dados"]).sort_values(por or [], ignore_index=True)
+
+    assert obtido["total"] == esperado["total"]
+    pd.testing.assert_frame_equal(ordenado(obtido), ordenado(esperado))
@@ -0,0 +1,43 @@
+"""Cache Arrow IPC das modalidades: validação por mtime/tamanho e por SHA-256."""
+import os
+
+import pyarrow as pa
+
+import dados
+from dados import ARQ, caminho_cache, ler_cache_arrow, ler_modalidade
+
+EJA = "EJA - Educação de Jovens e Adultos"
+
+
+def metadados_cache(arquivo) -> dict:
+    return pa.ipc.open_file(pa.memory_map(str(caminho_cache(arquivo)))).schema.metadata
+
+
+def test_origem_tocada_com_mesmo_conteudo_regrava_o_estado(pasta_eja, monkeypatch):
+    arquivo = pasta_eja / ARQ[EJA]
+    tabela = ler_modalidade(str(arquivo))
+    assert caminho_cache(arquivo).exists()
+
+    info = os.stat(arquivo)
+    os.utime(arquivo, ns=(info.st_atime_ns, info.st_mtime_ns + 10 ** 9))
+    assert metadados_cache(arquivo)[dados.CHAVE_ESTADO] != dados._estado_origem(arquivo)
+
+    calculos = []
+    original = dados.impressao_digital
+    monkeypatch.setattr(dados, "impressao_digital",
+                        lambda a: calculos.append(a) or original(a))
+
+    primeira = ler_cache_arrow(arquivo)
+    segunda = ler_cache_arrow(arquivo)
+    assert len(calculos) == 1
+    assert metadados_cache(arquivo)[dados.CHAVE_ESTADO] == dados._estado_origem(arquivo)
+    assert primeira.equals(segunda)
+    assert primeira.num_rows == tabela.num_rows
+
+
+def test_origem_com_outro_conteudo_invalida_o_cache(pasta_eja):
+    arquivo = pasta_eja / ARQ[EJA]
+    ler_modalidade(str(arquivo))
+    with open(arquivo, "ab") as f:
+        f.write(b"\0")
+    assert ler_cache_arrow(arquivo) is None
@@ -0,0 +1,99 @@
+"""Ida e volta dos formatos de exportação (CSV, XLSX, Parquet e Arrow)."""
+import io
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+import pytest
+
+import dados
+from conftest import linhas_escola
+from dados import (
+    ExportacaoCancelada, gerar_arrow, gerar_csv, gerar_parquet, gerar_xlsx,
+)
+
+
+@pytest.fixture(scope="module")
+def df():
+    base = linhas_escola("Ensino Regular", quantidade=1200, semente=5)
+    # Valores que exigem aspas no CSV
+    base["Nome da Escola"] = base["Nome da Escola"].cat.add_categories(['ESCOLA "A", B'])
+    base.loc[3, "Nome da Escola"] = 'ESCOLA "A", B'
+    return base
+
+
+def como_texto(df: pd.DataFrame) -> pd.DataFrame:
+    return df.astype({c: str for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)})
+
+
+def test_csv_ida_e_volta(df):
+    gravadas = []
+    arquivo = gerar_csv(df, progresso=gravadas.append)
+    assert gravadas[-1] == len(df)
+
+    lido = pacsv.read_csv(arquivo).to_pandas()
+    assert list(lido.columns) == list(df.columns)
+    esperado = como_texto(df)
+    for col in df.columns:
+        np.testing.assert_array_equal(lido[col].to_numpy(), esperado[col].to_numpy())
+
+
+def test_csv_em_lotes(df, monkeypatch):
+    original = dados._lotes_arrow
+    monkeypatch.setattr(dados, "_lotes_arrow", lambda d: original(d, tamanho_lote=500))
+    gravadas = []
+    lido = pacsv.read_csv(gerar_csv(df, progresso=gravadas.append))
+    assert gravadas == [500, 1000, 1200]
+    assert lido.num_rows == len(df)
+
+
+def test_xlsx_ida_e_volta(df):
+    gravadas = []
+    arquivo = gerar_xlsx(df.head(300), progresso=gravadas.append)
+    assert gravadas[-1] == 300
+
+    planilha = openpyxl.load_workbook(io.BytesIO(arquivo.read()), read_only=True)["Dados"]
+    linhas = list(planilha.iter_rows(values_only=True))
+    assert list(linhas[0]) == list(df.columns)
+    esperado = como_texto(df.head(300))
+    for i, col in enumerate(df.columns):
+        assert [r[i] for r in linhas[1:]] == esperado[col].tolist()
+
+
+def test_xlsx_recusa_selecao_acima_do_limite(df, monkeypatch):
+    monkeypatch.setattr(dados, "LIMITE_LINHAS_XLSX", len(df))
+    with pytest.raises(ValueError, match="limite do Excel"):
+        gerar_xlsx(df)
+    monkeypatch.setattr(dados, "LIMITE_LINHAS_XLSX", len(df) + 1)
+    assert gerar_xlsx(df).read(2) == b"PK"
+
+
+@pytest.mark.parametrize("gerar, ler", [
+    (gerar_parquet, pq.read_table),
+    (gerar_arrow, lambda f: pa.ipc.open_file(f).read_all()),
+])
+def test_formatos_colunares_preservam_tipos(df, gerar, ler):
+    gravadas = []
+    selecao = df.iloc[::3]
+    tabela = ler(gerar(selecao, progresso=gravadas.append, tamanho_lote=150))
+    assert gravadas == list(range(150, len(selecao), 150)) + [len(selecao)]
+
+    assert pa.types.is_dictionary(tabela.schema.field("Rede").type)
+    assert tabela.schema.field("Número de Matrículas").type == pa.uint32()
+    lido = tabela.to_pandas()
+    pd.testing.assert_frame_equal(como_texto(lido), como_texto(selecao.reset_index(drop=True)),
+                                  check_dtype=False)
+    # Só as categorias presentes na seleção vão para o arquivo
+    assert set(lido["Nome da Escola"].cat.categories) == set(selecao["Nome da Escola"])
+
+
+@pytest.mark.parametrize("gerar", [gerar_csv, gerar_xlsx, gerar_parquet, gerar_arrow])
+def test_cancelamento_interrompe_a_geracao(df, gerar):
+    def progresso(gravadas):
+        raise ExportacaoCancelada
+
+    with pytest.raises(ExportacaoCancelada):
+        gerar(df, progresso=progresso)
@@ -0,0 +1,160 @@
+"""Filtros por máscara e busca textual comparados com as versões diretas em pandas."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ETAPAS, REDES, SERIES, linhas_escola
+from dados import (
+    MODALIDADES, IndiceTexto, MotorFiltro, filtrar_dados, filtrar_indices,
+    filtrar_texto, normalizar_busca,
+)
+
+
+def filtrar_dados_referencia(df, modalidade_key, anos, redes, filtros):
+    """`filtrar_dados` original (filtros sequenciais em pandas), como referência."""
+    config = MODALIDADES[modalidade_key]
+    result_df = df.copy()
+    result_df = result_df[result_df["Ano"].isin(anos)]
+    if redes:
+        result_df = result_df[result_df["Rede"].isin(redes)]
+
+    if modalidade_key == "EJA - Educação de Jovens e Adultos":
+        etapa_sel = filtros.get("etapa", [])
+        subetapa_sel = filtros.get("subetapa", [])
+        if etapa_sel:
+            result_df = result_df[result_df["Etapa"].isin(etapa_sel)]
+        if (etapa_sel and
+                not any(e in config.etapa_valores.get("totais", []) for e in etapa_sel) and
+                subetapa_sel):
+            result_df = result_df[result_df["Subetapa"].isin(subetapa_sel)]
+    else:
+        etapa_sel = filtros.get("etapa", [])
+        if etapa_sel:
+            result_df = result_df[result_df["Etapa"].isin(etapa_sel)]
+            is_etapa_total = any(e in config.etapa_valores.get("totais", []) for e in etapa_sel)
+            if modalidade_key == "Ensino Regular" and not is_etapa_total and not filtros.get("subetapa"):
+                result_df = result_df[result_df["Subetapa"].astype(str).str.contains("Total", na=False)]
+        subetapa_sel = filtros.get("subetapa", [])
+        if subetapa_sel and etapa_sel and not any(e in config.etapa_valores.get("totais", []) for e in etapa_sel):
+            result_df = result_df[result_df["Subetapa"].isin(subetapa_sel)]
+        serie_sel = filtros.get("serie", [])
+        if (
+                serie_sel
+                and modalidade_key == "Ensino Regular"
+                and etapa_sel
+                and not any(e in config.etapa_valores.get("totais", []) for e in etapa_sel)
+                and not any("Total" in sub for sub in subetapa_sel)
+        ):
+            serie_col = config.serie_col if config.serie_col in result_df.columns else "Série"
+            if serie_col in result_df.columns:
+                result_df = result_df[result_df[serie_col].isin(serie_sel)]
+    return result_df
+
+
+def sortear(rng, valores, vazio=0.3):
+    """Subconjunto aleatório de `valores` (vazio com probabilidade `vazio`)."""
+    if rng.random() < vazio:
+        return []
+    return list(rng.choice(valores, rng.integers(1, len(valores) + 1), replace=False))
+
+
+def filtros_aleatorios(rng, modalidade_key):
+    etapas = ETAPAS[modalidade_key]
+    etapa = sortear(rng, list(etapas), vazio=0.2)
+    subetapas = [s for e in etapa for s in etapas[e]] or ["Inexistente"]
+    filtros = {"etapa": etapa, "subetapa": sortear(rng, subetapas)}
+    if MODALIDADES[modalidade_key].serie_col:
+        filtros["serie"] = sortear(rng, SERIES)
+    anos = sortear(rng, [2022, 2023, 2024, 2030], vazio=0.1)
+    return anos, sortear(rng, REDES), filtros
+
+
+@pytest.mark.parametrize("modalidade_key", list(MODALIDADES))
+def test_filtrar_indices_igual_ao_filtro_sequencial(modalidade_key):
+    df = linhas_escola(modalidade_key)
+    motor = MotorFiltro(df, MODALIDADES[modalidade_key].serie_col)
+    rng = np.random.default_rng(42)
+    for _ in range(200):
+        anos, redes, filtros = filtros_aleatorios(rng, modalidade_key)
+        esperado = filtrar_dados_referencia(df, modalidade_key, anos, redes, filtros)
+        linhas = filtrar_indices(motor, modalidade_key, anos, redes, filtros)
+        assert linhas.dtype == np.int32
+        np.testing.assert_array_equal(df.index[linhas], esperado.index,
+                                      err_msg=f"{anos} {redes} {filtros}")
+
+
+def test_filtrar_dados_com_colunas_de_texto_simples():
+    modalidade_key = "Ensino Regular"
+    df = linhas_escola(modalidade_key, semente=3).astype(
+        {"Etapa": str, "Subetapa": str, "Rede": str, "Ano/Série": str}
+    )
+    filtros = {"etapa": ["Ensino Fundamental"], "subetapa": ["Anos Iniciais"],
+               "serie": ["1º Ano", "2º Ano"]}
+    esperado = filtrar_dados_referencia(df, modalidade_key, [2023, 2024], ["Estadual"], filtros)
+    obtido = filtrar_dados(df, modalidade_key, [2023, 2024], ["Estadual"], filtros)
+    pd.testing.assert_frame_equal(obtido, esperado)
+
+
+def test_valor_ausente_nas_categorias_nao_casa():
+    df = linhas_escola("Educação Profissional", quantidade=200)
+    motor = MotorFiltro(df)
+    assert not motor.mascara("Rede", ["Federal"]).any()
+    assert motor.mascara("Rede", REDES + ["Federal"]).all()
+
+
+# ─── Busca textual ────────────────────────────────────────────────
+def busca_direta(s: pd.Series, consulta: str) -> np.ndarray:
+    """Busca sem índice: número exato nas colunas numéricas, senão substring normalizada."""
+    v = consulta.replace(",", ".")
+    numerica = s.name.startswith("Número de") or pd.api.types.is_numeric_dtype(s)
+    if numerica and v.lstrip("-").replace(".", "", 1).isdigit():
+        return (s.astype(float) == float(v)).to_numpy()
+    q = normalizar_busca(consulta)
+    return np.array([q in normalizar_busca(x) for x in s.astype(str)], dtype=bool)
+
+
+@pytest.fixture(scope="module")
+def df_busca():
+    return linhas_escola("Ensino Regular", quantidade=4000, semente=11)
+
+
+@pytest.mark.parametrize("col, consulta", [
+    ("Nome do Município", "sao jose"),
+    ("Nome do Município", "SÃO"),
+    ("Nome do Município", "re"),
+    ("Nome do Município", "o"),
+    ("Nome da Escola", "escola 1 de"),
+    ("Nome da Escola", "caruaru"),
+    ("Nome da Escola", "xyz"),
+    ("Subetapa", "- total"),
+    ("Ano/Série", "º"),
+    ("Rede", "pública e"),
+    ("Número de Matrículas", "150"),
+    ("Número de Matrículas", "150,0"),
+    ("Ano", "2023"),
+])
+def test_indice_texto_igual_a_busca_direta(df_busca, col, consulta):
+    indice = IndiceTexto(df_busca)
+    linhas = np.arange(len(df_busca), dtype=np.int32)
+    obtido = indice.mascara(col, consulta, linhas)
+    np.testing.assert_array_equal(obtido, busca_direta(df_busca[col], consulta))
+
+
+def test_filtrar_texto_combina_filtros_sobre_subconjunto(df_busca):
+    indice = IndiceTexto(df_busca)
+    linhas = np.flatnonzero(df_busca["Ano"].to_numpy() == 2024).astype(np.int32)
+    filtros = {"Nome do Município": "recife", "Rede": "estad"}
+    obtido = filtrar_texto(indice, linhas, filtros, {})
+
+    sub = df_busca.iloc[linhas]
+    mask = busca_direta(sub["Nome do Município"], "recife") & busca_direta(sub["Rede"], "estad")
+    np.testing.assert_array_equal(obtido, linhas[mask])
+
+
+def test_filtrar_texto_em_coluna_fixa(df_busca):
+    indice = IndiceTexto(df_busca)
+    linhas = np.arange(50, dtype=np.int32)
+    fixas = {"Modalidade": "EJA - Educação de Jovens e Adultos"}
+    np.testing.assert_array_equal(
+        filtrar_texto(indice, linhas, {"Modalidade": "educacao"}, fixas), linhas)
+    assert len(filtrar_texto(indice, linhas, {"Modalidade": "regular"}, fixas)) == 0